@@ -0,0 +1,169 @@
+"""Host calibration for the encode profiles.
+
+Encodes short synthetic ( and optional sample ) clips with every ffargs
+profile across a grid of presets and thread counts, measuring fps, output
+size and SSIM per CPU-second. For each profile the most CPU efficient
+setting within --band of the best SSIM wins, and the slot count follows
+from how many cores one encode keeps busy. The result is stored under this
+host's name in TUNING_FILE, which the bot reads at startup.
+
+    python -m bench.calibrate --profiles 360 720 --seconds 10 --samples ep01.mkv
+"""
+import os
+import sys
+from argparse import ArgumentParser
+from json import load, dump
+from re import findall, search
+from shutil import rmtree
+from socket import gethostname
+from subprocess import run as srun
+from tempfile import mkdtemp
+from time import time
+
+from dotenv import dotenv_values
+from psutil import cpu_count
+
+from bench.pipeline import REPO_DIR, make_source
+
+# Speed knob per encoder, listed fastest first
+PRESET_GRID = {
+    'libx264': ("-preset", ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium"]),
+    'libx265': ("-preset", ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium"]),
+    'libaom-av1': ("-cpu-used", ["8", "7", "6", "5", "4"]),
+    'libsvtav1': ("-preset", ["12", "10", "8", "6"]),
+}
+
+def parse_args():
+    cores = cpu_count() or 1
+    parser = ArgumentParser(description="Benchmark the ffargs profiles on this host and write its tuning table")
+    parser.add_argument("--profiles", nargs="+", default=None, help="ffargs keys to calibrate ( default: all )")
+    parser.add_argument("--presets", nargs="+", default=None, help="Override the preset grid for every profile")
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({min(2 ** n, cores) for n in range(8)}), help="Thread counts to try")
+    parser.add_argument("--seconds", type=int, default=10, help="Length of each test clip")
+    parser.add_argument("--resolution", default="1920x1080", help="Synthetic clip resolution")
+    parser.add_argument("--samples", nargs="*", default=[], help="Real episodes to cut test clips from")
+    parser.add_argument("--band", type=float, default=0.01, help="SSIM a setting may lose against the best one and still be picked")
+    parser.add_argument("--primary", default="360", help="Profile the encode slots are sized for ( fencode uses 360 )")
+    parser.add_argument("--out", default=None, help="Tuning table to update ( default: TUNING_FILE from config.env )")
+    parser.add_argument("--workdir", default=None, help="Working directory ( default: fresh temp dir, removed after )")
+    return parser.parse_args()
+
+def setup_env(workdir):
+    conf = dotenv_values(os.path.join(REPO_DIR, "config.env"))
+    os.environ.update({
+        'API_ID': "1", 'API_HASH': "bench", 'BOT_TOKEN': "1:bench", 'MONGO_URI': "mongodb://127.0.0.1:1",
+        'FSUB_CHATS': "", 'MAIN_CHANNEL': "-1001", 'FILE_STORE': "-1002", 'LOG_CHANNEL': "0",
+        'METRICS_PORT': "0", 'WATCHDOG': "False", 'TRACE_FILE': "",
+        # Calibrate the templates as written, not as tuned by an earlier run
+        'TUNING_FILE': "",
+    })
+    os.environ.update({key: value for key, value in conf.items() if key.startswith("FFCODE_") and value})
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    return conf
+
+def cut_sample(src, dest, seconds):
+    # From a third in, past any intro or black frames
+    probe = srun(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", src], capture_output=True, text=True)
+    start = float(probe.stdout.strip() or 0) / 3
+    srun(["ffmpeg", "-v", "error", "-y", "-ss", f"{start:.1f}", "-i", src, "-t", str(seconds), "-map", "0:v:0", "-map", "0:a:0?", "-c", "copy", dest], check=True)
+    return dest
+
+def count_frames(path):
+    probe = srun(["ffprobe", "-v", "error", "-select_streams", "v:0", "-count_packets", "-show_entries", "stream=nb_read_packets", "-of", "csv=p=0", path], capture_output=True, text=True)
+    return int(probe.stdout.strip() or 0)
+
+def measure_ssim(encoded, src):
+    # The reference is scaled to the encoded size, profiles downscale
+    res = srun(["ffmpeg", "-v", "info", "-i", encoded, "-i", src, "-lavfi", "[1:v][0:v]scale2ref[ref][enc];[enc][ref]ssim", "-f", "null", "-"], capture_output=True, text=True)
+    return float(m[-1]) if (m := findall(r"All:(\d+\.\d+)", res.stderr)) else None
+
+def run_trial(ffcode, src, out):
+    cmd = ffcode.format(src, os.devnull, out)
+    before, start = os.times(), time()
+    res = srun(cmd, shell=True, capture_output=True, text=True)
+    wall, after = time() - start, os.times()
+    if res.returncode != 0 or not os.path.exists(out):
+        return {'error': res.stderr.strip()[-300:]}
+    cpu = (after.children_user - before.children_user) + (after.children_system - before.children_system)
+    frames, size = count_frames(out), os.path.getsize(out)
+    return {
+        'wall': wall, 'cpu': cpu, 'fps': frames / wall, 'fps_per_cpu': frames / max(cpu, 0.001),
+        'bytes_per_cpu': size / max(cpu, 0.001), 'size': size, 'util': cpu / wall, 'ssim': measure_ssim(out, src)
+    }
+
+def mean(trials, key):
+    values = [trial[key] for trial in trials if trial.get(key) is not None]
+    return sum(values) / len(values) if values else None
+
+def pick(results, band):
+    """Most frames per CPU-second among settings within band of the best SSIM, faster wall clock breaks ties."""
+    scored = [res for res in results if res['ssim'] is not None]
+    if not scored:
+        return None
+    floor = max(res['ssim'] for res in scored) - band
+    return max((res for res in scored if res['ssim'] >= floor), key=lambda res: (round(res['fps_per_cpu'], 1), res['fps']))
+
+def main():
+    args = parse_args()
+    workdir = os.path.abspath(args.workdir or mkdtemp(prefix="aacalib-"))
+    samples = [os.path.abspath(sample) for sample in args.samples]
+    conf = setup_env(workdir)
+    out_path = args.out or conf.get("TUNING_FILE") or "tuning.json"
+    out_path = out_path if os.path.isabs(out_path) else os.path.join(REPO_DIR, out_path)
+
+    from bot.core.ffencoder import ffargs, set_option
+
+    clips = [make_source(os.path.join(workdir, "synthetic.mkv"), args.seconds, args.resolution, "stereo", False)]
+    clips += [cut_sample(sample, os.path.join(workdir, f"sample{no}.mkv"), args.seconds) for no, sample in enumerate(samples)]
+
+    cores = cpu_count() or 1
+    profiles = {}
+    for qual in args.profiles or list(ffargs):
+        template = ffargs[qual]
+        codec = m.group(1) if (m := search(r"-c:v (\S+)", template)) else "libx264"
+        opt, grid = PRESET_GRID.get(codec, ("-preset", PRESET_GRID['libx264'][1]))
+        results = []
+        for preset in args.presets or grid:
+            for threads in args.threads:
+                ffcode = set_option(set_option(template, opt, preset), "-threads", threads)
+                trials = [run_trial(ffcode, clip, os.path.join(workdir, f"out_{qual}.mkv")) for clip in clips]
+                if (errors := [trial['error'] for trial in trials if 'error' in trial]):
+                    print(f"{qual} {opt} {preset} threads {threads} : failed, {errors[0]}")
+                    continue
+                res = {'args': {opt: preset, '-threads': str(threads)}}
+                res.update({key: mean(trials, key) for key in ("fps", "fps_per_cpu", "bytes_per_cpu", "util", "ssim")})
+                res['kbps'] = mean(trials, 'size') * 8 / args.seconds / 1000
+                results.append(res)
+                print(f"{qual} {opt} {preset:>9} threads {threads:>2} : {res['fps']:7.1f} fps, {res['fps_per_cpu']:6.1f} fps/cpu-s, "
+                      f"{res['kbps']:7.0f} kbps, util {res['util']:4.1f}, ssim {res['ssim'] or 0:.4f}")
+        if not (best := pick(results, args.band)):
+            print(f"{qual} : no usable setting, left untuned")
+            continue
+        # As many encodes as the cores can keep busy at the measured utilisation
+        best['slots'] = max(1, int(cores // max(best['util'], 1)))
+        best['parallel'] = round(cores / max(best['util'], 1), 2)
+        profiles[qual] = {key: round(val, 4) if isinstance(val, float) else val for key, val in best.items()}
+        print(f"{qual} : picked {best['args']}, {best['slots']} slot(s)\n")
+
+    table = {}
+    if os.path.exists(out_path):
+        with open(out_path) as f:
+            table = load(f)
+    primary = profiles.get(args.primary) or next(iter(profiles.values()), {})
+    table[gethostname()] = {
+        'created': int(time()),
+        'cores': cores,
+        'band': args.band,
+        'slots': primary.get('slots', 1),
+        'parallel': primary.get('parallel', 1.0),
+        'profiles': profiles,
+    }
+    with open(out_path, "w") as f:
+        dump(table, f, indent=2, sort_keys=True)
+    print(f"Tuning for {gethostname()} written to {out_path} : {table[gethostname()]['slots']} slot(s)")
+    if not args.workdir:
+        rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
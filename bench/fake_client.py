@@ -0,0 +1,133 @@
+from os import path as ospath
+from time import time
+from random import Random
+from shutil import copyfile
+from inspect import isawaitable
+from itertools import count
+from asyncio import get_event_loop, sleep as asleep
+
+from pyrogram import StopTransmission
+from pyrogram.errors import FloodWait
+
+class FakeChat:
+    def __init__(self, chat_id):
+        self.id = chat_id
+        self.title = f"Chat {chat_id}"
+        self.invite_link = f"https://t.me/+fake{abs(chat_id)}"
+
+class FakeMessage:
+    def __init__(self, client, chat_id, text="", media=None, file_name=None):
+        self._client = client
+        self.id = next(client.msg_ids)
+        self.chat = FakeChat(chat_id)
+        self.text = self.caption = text
+        self.media = media
+        self.empty = False
+        self.replies = []
+        self.edits = 0
+        self.document = self.video = None
+        if media:
+            self.video = type("FakeVideo", (), {'file_name': file_name or ospath.basename(media), 'file_size': ospath.getsize(media)})()
+
+    async def edit_text(self, text, *args, **kwargs):
+        await self._client.api_call("edit")
+        self.edits += 1
+        self.text = text
+        return self
+
+    edit = edit_text
+
+    async def delete(self, *args, **kwargs):
+        await self._client.api_call("delete")
+        return True
+
+    async def reply(self, text, *args, **kwargs):
+        await self._client.api_call("send")
+        self.replies.append(text)
+        return FakeMessage(self._client, self.chat.id, text)
+
+    reply_text = reply
+
+    async def reply_document(self, document, *args, **kwargs):
+        return await self.reply(kwargs.get('caption', ""))
+
+    async def copy(self, chat_id, *args, **kwargs):
+        await self._client.api_call("copy")
+        return FakeMessage(self._client, chat_id, self.caption, self.media)
+
+class FakeClient:
+    """In-process stand-in for pyrogram.Client used by the benchmark harness.
+
+    Simulates upload/download bandwidth, round-trip latency and random FloodWait errors
+    on message edits, so the real pipeline can run without a bot token.
+    """
+    bandwidth = 20 * 1024 * 1024
+    latency = 0.05
+    floodwait_rate = 0.0
+    floodwait_value = 2
+    seed = 0
+
+    def __init__(self, name=None, *args, **kwargs):
+        self.name = name
+        self.loop = get_event_loop()
+        self.me = type("FakeUser", (), {'id': 1, 'username': "FakeBenchBot"})()
+        self.msg_ids = count(1)
+        self.random = Random(self.seed)
+        self.calls = {}
+        self.floodwaits = 0
+        self.transferred = 0
+
+    def __getattr__(self, attr):
+        if attr.startswith("on_"):
+            return lambda *args, **kwargs: (lambda func: func)
+        raise AttributeError(attr)
+
+    async def api_call(self, method):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        await asleep(self.latency)
+        if method == "edit" and self.random.random() < self.floodwait_rate:
+            self.floodwaits += 1
+            raise FloodWait(value=self.floodwait_value)
+
+    async def start(self):
+        return self
+
+    async def stop(self, *args):
+        return self
+
+    async def get_me(self):
+        return self.me
+
+    def stop_transmission(self):
+        raise StopTransmission
+
+    async def __transfer(self, size, progress, progress_args):
+        done, chunk, start = 0, 512 * 1024, time()
+        while done < size:
+            done = min(done + chunk, size)
+            await asleep(max((start + done / self.bandwidth) - time(), 0))
+            if progress and (res := progress(done, size, *progress_args)) and isawaitable(res):
+                await res
+        self.transferred += size
+
+    async def send_message(self, chat_id, text, *args, **kwargs):
+        await self.api_call("send")
+        return FakeMessage(self, chat_id, text)
+
+    async def __send_media(self, chat_id, path, caption, progress, progress_args):
+        await self.api_call("upload")
+        await self.__transfer(ospath.getsize(path), progress, progress_args)
+        return FakeMessage(self, chat_id, caption or "", path)
+
+    async def send_video(self, chat_id, video, caption=None, progress=None, progress_args=(), **kwargs):
+        return await self.__send_media(chat_id, video, caption, progress, progress_args)
+
+    async def send_document(self, chat_id, document, caption=None, progress=None, progress_args=(), **kwargs):
+        return await self.__send_media(chat_id, document, caption, progress, progress_args)
+
+    async def download_media(self, message, file_name="downloads/", progress=None, progress_args=(), **kwargs):
+        await self.api_call("download")
+        out = ospath.join(file_name, message.video.file_name) if file_name.endswith("/") else file_name
+        await self.__transfer(ospath.getsize(message.media), progress, progress_args)
+        await self.loop.run_in_executor(None, copyfile, message.media, out)
+        return out
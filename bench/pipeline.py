@@ -0,0 +1,202 @@
+"""Offline end-to-end benchmark of the encode pipeline.
+
+Generates synthetic sources with ffmpeg lavfi, swaps pyrogram's Client for
+bench.fake_client.FakeClient and drives N concurrent jobs through the real
+fencode -> FFEncoder -> upload -> fan-out path. Results are written as JSON.
+
+    python -m bench.pipeline --jobs 4 --durations 30 60 --resolutions 1280x720 --out bench_result.json
+"""
+import os
+import sys
+from argparse import ArgumentParser
+from asyncio import gather
+from json import dumps
+from platform import platform
+from random import Random
+from shutil import rmtree
+from subprocess import run as srun
+from tempfile import mkdtemp
+from threading import Thread, Event as ThreadEvent
+from time import time
+
+from dotenv import dotenv_values
+from psutil import Process, cpu_count
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AUDIO_LAYOUTS = {'mono': [1], 'stereo': [2], '5.1': [6], 'dual': [2, 2]}
+
+def parse_args():
+    parser = ArgumentParser(description="Offline pipeline benchmark with a fake Telegram client")
+    parser.add_argument("--jobs", type=int, default=4, help="Number of concurrent jobs to submit")
+    parser.add_argument("--durations", type=int, nargs="+", default=[30], help="Source durations in seconds")
+    parser.add_argument("--resolutions", nargs="+", default=["1920x1080"], help="Source resolutions WxH")
+    parser.add_argument("--audio", nargs="+", default=["stereo"], choices=list(AUDIO_LAYOUTS), help="Audio layouts")
+    parser.add_argument("--subs", action="store_true", help="Mux a subtitle track into the sources")
+    parser.add_argument("--bandwidth", type=float, default=20, help="Simulated Telegram bandwidth in MiB/s")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated API round-trip in seconds")
+    parser.add_argument("--floodwait", type=float, default=0.0, help="Probability of a FloodWait per message edit")
+    parser.add_argument("--ffcode", default=None, help="Override the encode template ( default: FFCODE_360 from config.env )")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="Working directory ( default: fresh temp dir, removed after )")
+    parser.add_argument("--out", default=None, help="Write the JSON result to this file")
+    return parser.parse_args()
+
+def make_source(path, duration, resolution, layout, subs):
+    cmd = ["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"testsrc2=size={resolution}:rate=24:duration={duration}"]
+    channels = AUDIO_LAYOUTS[layout]
+    for no, _ in enumerate(channels):
+        cmd += ["-f", "lavfi", "-i", f"sine=frequency={440 * (no + 1)}:sample_rate=48000:duration={duration}"]
+    if subs:
+        srt = f"{path}.srt"
+        with open(srt, "w") as f:
+            for no, sec in enumerate(range(0, duration, 2), start=1):
+                f.write(f"{no}\n00:{sec // 60:02d}:{sec % 60:02d},000 --> 00:{sec // 60:02d}:{sec % 60:02d},900\nLine {no}\n\n")
+        cmd += ["-i", srt]
+    cmd += ["-map", "0:v"] + [x for no in range(len(channels)) for x in ("-map", f"{no + 1}:a")]
+    if subs:
+        cmd += ["-map", f"{len(channels) + 1}:s", "-c:s", "ass"]
+    for no, ac in enumerate(channels):
+        cmd += [f"-ac:a:{no}", str(ac)]
+    cmd += ["-c:v", "libx264", "-preset", "ultrafast", "-crf", "23", "-c:a", "aac", path]
+    srun(cmd, check=True)
+    return path
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    pick = lambda q: samples[min(int(q * len(samples)), len(samples) - 1)]
+    return {'count': len(samples), 'mean': round(sum(samples) / len(samples), 3), 'p50': round(pick(0.5), 3),
+            'p90': round(pick(0.9), 3), 'p99': round(pick(0.99), 3), 'max': round(samples[-1], 3)}
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+class ResourceSampler(Thread):
+    def __init__(self, workdir, interval=0.25):
+        super().__init__(daemon=True)
+        self.__workdir = workdir
+        self.__interval = interval
+        self.__stop = ThreadEvent()
+        self.peak_rss = 0
+        self.peak_disk = 0
+
+    def run(self):
+        proc = Process()
+        while not self.__stop.wait(self.__interval):
+            rss = proc.memory_info().rss
+            for child in proc.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except Exception:
+                    pass
+            self.peak_rss = max(self.peak_rss, rss)
+            self.peak_disk = max(self.peak_disk, sum(dir_size(os.path.join(self.__workdir, d)) for d in ("downloads", "encode", "thumbs")))
+
+    def stop(self):
+        self.__stop.set()
+
+def setup_env(args, workdir):
+    conf = dotenv_values(os.path.join(REPO_DIR, "config.env"))
+    os.environ.update({
+        'API_ID': "1", 'API_HASH': "bench", 'BOT_TOKEN': "1:bench", 'MONGO_URI': "mongodb://127.0.0.1:1",
+        'FSUB_CHATS': "", 'MAIN_CHANNEL': "-1001", 'FILE_STORE': "-1002", 'LOG_CHANNEL': "0",
+        'THUMB': "", 'METRICS_PORT': "0", 'WATCHDOG': "False", 'LOG_ROTATE': "size",
+        'FFCODE_360': args.ffcode or conf.get("FFCODE_360") or "",
+    })
+    if not os.environ['FFCODE_360']:
+        del os.environ['FFCODE_360']
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+
+def main():
+    args = parse_args()
+    workdir = os.path.abspath(args.workdir or mkdtemp(prefix="aabench-"))
+    os.makedirs(os.path.join(workdir, "sources"), exist_ok=True)
+    setup_env(args, workdir)
+
+    import pyrogram
+    from bench.fake_client import FakeClient, FakeMessage
+    FakeClient.bandwidth = args.bandwidth * 1024 * 1024
+    FakeClient.latency = args.latency
+    FakeClient.floodwait_rate = args.floodwait
+    FakeClient.seed = args.seed
+    pyrogram.Client = FakeClient
+
+    from bot import bot, bot_loop
+    from bot.__main__ import queue_loop
+    from bot.core import metrics
+    from bot.core.auto_animes import fencode
+
+    samples = {}
+    for hist in (metrics.stage_seconds, metrics.queue_wait):
+        def observe(value, __orig=hist.observe, __name=hist.name, **labels):
+            samples.setdefault(labels.get('stage', __name.replace("autoanime_", "")), []).append(value)
+            __orig(value, **labels)
+        hist.observe = observe
+
+    rnd = Random(args.seed)
+    sources, gen_start = [], time()
+    for no in range(args.jobs):
+        dur, res, aud = rnd.choice(args.durations), rnd.choice(args.resolutions), rnd.choice(args.audio)
+        name = f"bench_{no:03d}_{res}_{dur}s_{aud}.mkv"
+        sources.append((name, make_source(os.path.join(workdir, "sources", name), dur, res, aud, args.subs), dur, res, aud))
+    gen_time = time() - gen_start
+
+    async def run_job(name, src):
+        message = FakeMessage(bot, 1, "", src, name)
+        stat = await message.reply("<b>File Received. Start Downloading.....</b>")
+        with metrics.time_stage("download"):
+            fpath = await bot.download_media(message)
+        await fencode(name, fpath, message, stat)
+        return any("Upload completed successfully" in txt for txt in message.replies)
+
+    async def run_all():
+        loop_task = bot_loop.create_task(queue_loop())
+        start = time()
+        results = await gather(*(run_job(name, src) for name, src, *_ in sources), return_exceptions=True)
+        loop_task.cancel()
+        return results, time() - start
+
+    sampler = ResourceSampler(workdir)
+    sampler.start()
+    results, wall = bot_loop.run_until_complete(run_all())
+    sampler.stop()
+
+    done = sum(1 for r in results if r is True)
+    ffver = srun(["ffmpeg", "-version"], capture_output=True, text=True).stdout.split("\n", 1)[0]
+    result = {
+        'config': vars(args),
+        'host': {'platform': platform(), 'python': sys.version.split()[0], 'cpus': cpu_count(), 'ffmpeg': ffver},
+        'sources': [{'name': n, 'duration': d, 'resolution': r, 'audio': a} for n, _, d, r, a in sources],
+        'source_generation_seconds': round(gen_time, 3),
+        'jobs': args.jobs,
+        'completed': done,
+        'failed': args.jobs - done,
+        'errors': [repr(r) for r in results if isinstance(r, BaseException)],
+        'wall_seconds': round(wall, 3),
+        'jobs_per_hour': round(done / wall * 3600, 3) if wall else 0,
+        'stages': {stage: percentiles(vals) for stage, vals in sorted(samples.items())},
+        'peak_rss_bytes': sampler.peak_rss,
+        'peak_disk_bytes': sampler.peak_disk,
+        'api_calls': bot.calls,
+        'floodwaits': bot.floodwaits,
+        'bytes_transferred': bot.transferred,
+    }
+    out = dumps(result, indent=2, sort_keys=True)
+    if args.out:
+        with open(os.path.join(REPO_DIR, args.out) if not os.path.isabs(args.out) else args.out, "w") as f:
+            f.write(out)
+    print(out)
+    if not args.workdir:
+        rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Replays recorded job traces against alternative scheduler settings.
+
+Reads the JSON lines the bot appends to TRACE_FILE and runs them through a
+discrete event model of the pipeline, no ffmpeg or Telegram involved:
+
+    queue -> encode slot ( ENCODE_SLOTS, shared CPU ) -> thumbnail / upload / fan-out
+
+Encodes share the CPU: with k running and --parallel P, each progresses at
+min(1, P / k) of the speed it had alone. Recorded encode times are normalised
+by the number of peers they ran with, so traces from any slot count compare.
+Every combination of the grid options is simulated and reported.
+
+    python -m bench.simulate traces.jsonl --slots 1 2 4 --parallel 1.5 --policy fifo sjf --load 1 2
+"""
+from argparse import ArgumentParser
+from itertools import product
+from json import loads, dumps
+
+from bench.pipeline import percentiles
+
+POST_STAGES = ("thumbnail", "split", "upload", "fanout")
+TRANSFER_STAGES = ("upload", "fanout")
+
+def parse_args():
+    parser = ArgumentParser(description="Offline scheduler simulator driven by recorded job traces")
+    parser.add_argument("traces", nargs="+", help="Trace files written by the bot ( TRACE_FILE )")
+    parser.add_argument("--slots", type=int, nargs="+", default=[1], help="Concurrent encode slots to try")
+    parser.add_argument("--parallel", type=float, nargs="+", default=[1.0], help="Encodes the host runs at full speed at once ( bench.calibrate reports it )")
+    parser.add_argument("--policy", nargs="+", default=["fifo"], choices=["fifo", "sjf", "small"], help="Queue order : arrival, shortest encode first, smallest source first")
+    parser.add_argument("--upload-slots", type=int, nargs="+", default=[0], help="Concurrent uploads, 0 for no limit")
+    parser.add_argument("--release", action="store_true", help="Free the encode slot when ffmpeg ends instead of after the upload")
+    parser.add_argument("--load", type=float, nargs="+", default=[1.0], help="Arrival rate multiplier, 2 replays the traces twice as dense")
+    parser.add_argument("--bandwidth", type=float, default=1.0, help="Upload bandwidth multiplier against the recorded one")
+    parser.add_argument("--speed", type=float, default=1.0, help="Encode speed multiplier, e.g. a faster preset or host")
+    parser.add_argument("--out", default=None, help="Write the JSON result to this file")
+    return parser.parse_args()
+
+def load_traces(paths):
+    jobs = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip() and (trace := loads(line)).get('stages', {}).get('encode'):
+                    jobs.append(trace)
+    jobs.sort(key=lambda t: t['at'])
+    return jobs
+
+class SimJob:
+    __slots__ = ("trace", "arrival", "work", "post", "size", "out", "started", "encoded", "done")
+
+    def __init__(self, trace, start, args, parallel, load):
+        stages = trace['stages']
+        self.trace = trace
+        self.arrival = (trace['at'] - start) / load
+        # Back to the time the encode would have taken alone on the recording host
+        peers = max(trace.get('peers') or 1, 1)
+        self.work = (stages['encode'] + stages.get('probe', 0)) * min(1, parallel / peers) / args.speed
+        self.post = sum(stages.get(stage, 0) / (args.bandwidth if stage in TRANSFER_STAGES else 1) for stage in POST_STAGES)
+        self.size = trace.get('size') or 0
+        self.out = trace.get('out') or 0
+        self.started = self.encoded = self.done = None
+
+def simulate(traces, slots, parallel, policy, upload_slots, load, args):
+    jobs = [SimJob(trace, traces[0]['at'], args, parallel, load) for trace in traces]
+    pending = list(jobs)
+    queue, encoding, posting, waiting_upload = [], {}, [], []
+    now, disk, peak_disk, held = 0.0, 0, 0, 0
+    order = {'fifo': lambda j: j.arrival, 'sjf': lambda j: j.work, 'small': lambda j: j.size}[policy]
+
+    def start_post(job):
+        # Uploads hold the encode slot unless --release, the way fencode releases its lock today
+        if upload_slots and len(posting) >= upload_slots:
+            waiting_upload.append(job)
+        else:
+            posting.append((now + job.post, job))
+
+    while pending or queue or encoding or posting or waiting_upload:
+        # Admit as many queued jobs as there are free slots
+        queue.sort(key=order)
+        while queue and held < slots:
+            job = queue.pop(0)
+            job.started, held = now, held + 1
+            encoding[job] = job.work
+            disk += job.out
+        peak_disk = max(peak_disk, disk)
+
+        rate = min(1.0, parallel / len(encoding)) if encoding else 0
+        candidates = []
+        if pending:
+            candidates.append(pending[0].arrival)
+        if encoding:
+            candidates.append(now + min(encoding.values()) / rate)
+        if posting:
+            candidates.append(min(end for end, _ in posting))
+        if not candidates:
+            break
+        step = max(min(candidates), now)
+        for job in encoding:
+            encoding[job] -= (step - now) * rate
+        now = step
+
+        while pending and pending[0].arrival <= now:
+            job = pending.pop(0)
+            queue.append(job)
+            disk += job.size
+        for job in [job for job, left in encoding.items() if left <= 1e-9]:
+            del encoding[job]
+            job.encoded = now
+            # The source is deleted once the encode succeeds
+            disk -= job.size
+            if args.release:
+                held -= 1
+            start_post(job)
+        for end, job in [item for item in posting if item[0] <= now]:
+            posting.remove((end, job))
+            job.done = now
+            disk -= job.out
+            if not args.release:
+                held -= 1
+            if waiting_upload:
+                posting.append((now + waiting_upload[0].post, waiting_upload.pop(0)))
+        peak_disk = max(peak_disk, disk)
+
+    return jobs, now, peak_disk
+
+def run(traces, args):
+    results = []
+    for slots, parallel, policy, upload_slots, load in product(args.slots, args.parallel, args.policy, args.upload_slots, args.load):
+        jobs, makespan, peak_disk = simulate(traces, slots, parallel, policy, upload_slots, load, args)
+        results.append({
+            'slots': slots, 'parallel': parallel, 'policy': policy, 'upload_slots': upload_slots, 'load': load,
+            'makespan_seconds': round(makespan, 1),
+            'jobs_per_hour': round(len(jobs) / makespan * 3600, 3) if makespan else 0,
+            'queue_wait': percentiles([job.started - job.arrival for job in jobs]),
+            'turnaround': percentiles([job.done - job.arrival for job in jobs]),
+            'peak_disk_bytes': peak_disk,
+        })
+    return results
+
+def recorded(traces):
+    span = traces[-1]['at'] + sum(traces[-1]['stages'].values()) - traces[0]['at']
+    return {
+        'jobs': len(traces),
+        'slots': sorted({trace.get('slots') for trace in traces if trace.get('slots')}),
+        'span_seconds': round(span, 1),
+        'queue_wait': percentiles([trace['wait'] for trace in traces if trace.get('wait') is not None]),
+        'floodwaits': sum(len(trace.get('fw') or ()) for trace in traces),
+        'floodwait_seconds': round(sum(secs for trace in traces for _, secs in trace.get('fw') or ()), 1),
+    }
+
+def main():
+    args = parse_args()
+    if not (traces := load_traces(args.traces)):
+        raise SystemExit("No finished jobs with an encode stage in the traces")
+    results = run(traces, args)
+    print(f"{len(traces)} jobs replayed, recorded waits p50 {recorded(traces)['queue_wait'].get('p50')}s\n")
+    print(f"{'slots':>5} {'par':>5} {'policy':>6} {'upl':>4} {'load':>5} | {'jobs/h':>8} {'wait p50':>9} {'wait p90':>9} {'wait p99':>9} {'disk peak':>10}")
+    for res in results:
+        wait = res['queue_wait']
+        print(f"{res['slots']:>5} {res['parallel']:>5g} {res['policy']:>6} {res['upload_slots'] or '-':>4} {res['load']:>5g} | "
+              f"{res['jobs_per_hour']:>8.2f} {wait['p50']:>8.0f}s {wait['p90']:>8.0f}s {wait['p99']:>8.0f}s {res['peak_disk_bytes'] / 1024 ** 3:>8.2f}GB")
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(dumps({'config': vars(args), 'recorded': recorded(traces), 'results': results}, indent=2, sort_keys=True))
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,17 @@
-from os import path as ospath, mkdir, system, getenv
-from logging import INFO, ERROR, FileHandler, StreamHandler, basicConfig, getLogger
+from time import perf_counter
+BOOT_TIME = perf_counter()
+
+from os import path as ospath, mkdir, getenv
+from logging import INFO, ERROR, Filter, Formatter, StreamHandler, basicConfig, getLogger
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from queue import SimpleQueue
+from contextvars import ContextVar
+from json import dumps as jdumps
+from atexit import register as atexit_register
 from traceback import format_exc
-from asyncio import Queue, Lock
+from asyncio import Queue, Semaphore, Event
+from json import load as jload
+from socket import gethostname
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from pyrogram import Client
@@ -10,26 +20,54 @@ from dotenv import load_dotenv
 from uvloop import install
 
 install()
-basicConfig(format="[%(asctime)s] [%(name)s | %(levelname)s] - %(message)s [%(filename)s:%(lineno)d]",
-            datefmt="%m/%d/%Y, %H:%M:%S %p",
-            handlers=[FileHandler('log.txt'), StreamHandler()],
-            level=INFO)
+load_dotenv('config.env')
+
+LOG_FILE = getenv("LOG_FILE", "log.txt")
+LOG_FORMAT = "[%(asctime)s] [%(name)s | %(levelname)s] - %(message)s [%(filename)s:%(lineno)d]"
+LOG_DATEFMT = "%m/%d/%Y, %H:%M:%S %p"
+log_jobid = ContextVar("log_jobid", default=None)
+
+class JobIdFilter(Filter):
+    def filter(self, record):
+        record.job_id = log_jobid.get()
+        return True
+
+class JsonFormatter(Formatter):
+    def format(self, record):
+        return jdumps({
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'job_id': getattr(record, 'job_id', None),
+            'msg': record.getMessage(),
+            'src': f"{record.filename}:{record.lineno}"
+        }, ensure_ascii=False)
+
+if getenv("LOG_ROTATE", "size").lower() == "time":
+    file_handler = TimedRotatingFileHandler(LOG_FILE, when="midnight", backupCount=int(getenv("LOG_BACKUPS", "5")))
+else:
+    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=int(getenv("LOG_MAX_SIZE", "10")) * 1024 * 1024, backupCount=int(getenv("LOG_BACKUPS", "5")))
+file_handler.setFormatter(JsonFormatter(datefmt=LOG_DATEFMT) if getenv("LOG_JSON", "False").lower() == "true" else Formatter(LOG_FORMAT, LOG_DATEFMT))
+stream_handler = StreamHandler()
+stream_handler.setFormatter(Formatter(LOG_FORMAT, LOG_DATEFMT))
+
+log_queue = SimpleQueue()
+queue_handler = QueueHandler(log_queue)
+queue_handler.addFilter(JobIdFilter())
+log_listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+log_listener.start()
+atexit_register(log_listener.stop)
+
+basicConfig(handlers=[queue_handler], level=INFO)
 
 getLogger("pyrogram").setLevel(ERROR)
 LOGS = getLogger(__name__)
 
-load_dotenv('config.env')
-
 ani_cache = {
     'fetch_animes': True,
     'ongoing': set(),
     'completed': set()
 }
-ffpids_cache = list()
-
-ffLock = Lock()
-ffQueue = Queue()
-ff_queued = dict()
 
 class Var:
     API_ID, API_HASH, BOT_TOKEN = getenv("API_ID"), getenv("API_HASH"), getenv("BOT_TOKEN")
@@ -40,7 +78,8 @@ class Var:
         exit(1)
 
     RSS_ITEMS = getenv("RSS_ITEMS", "https://subsplease.org/rss/?r=1080").split()
-    FSUB_CHATS = list(map(int, getenv('FSUB_CHATS').split()))
+    FSUB_CHATS = list(map(int, getenv('FSUB_CHATS', '').split()))
+    FSUB_TTL = int(getenv("FSUB_TTL", "600"))
     BACKUP_CHANNEL = getenv("BACKUP_CHANNEL") or ""
     MAIN_CHANNEL = int(getenv("MAIN_CHANNEL"))
     LOG_CHANNEL = int(getenv("LOG_CHANNEL") or 0)
@@ -60,13 +99,78 @@ class Var:
     THUMB = getenv("THUMB", "https://te.legra.ph/file/621c8d40f9788a1db7753.jpg")
     AUTO_DEL = getenv("AUTO_DEL", "True").lower() == "true"
     DEL_TIMER = int(getenv("DEL_TIMER", "600"))
+    DEL_BUCKET = int(getenv("DEL_BUCKET", "30"))
+    BATCH_LIMIT = int(getenv("BATCH_LIMIT", "200"))
+    RETRY_ATTEMPTS = int(getenv("RETRY_ATTEMPTS", "5"))
+    RETRY_BACKOFF = float(getenv("RETRY_BACKOFF", "5"))
+    DL_WORKERS = int(getenv("DL_WORKERS", "4"))
+    DL_SESSIONS = int(getenv("DL_SESSIONS", "1"))
+    DL_PARALLEL_MIN = int(getenv("DL_PARALLEL_MIN", "20"))
+    BW_TOTAL = float(getenv("BW_TOTAL", "0"))
+    BW_UPLOAD = float(getenv("BW_UPLOAD", "0"))
+    BW_DOWNLOAD = float(getenv("BW_DOWNLOAD", "0"))
+    BW_TORRENT = float(getenv("BW_TORRENT", "0"))
+    STREAM_INPUT = getenv("STREAM_INPUT", "False").lower() == "true"
+    IMPORT_WORKERS = int(getenv("IMPORT_WORKERS", "2"))
+    IMPORT_BACKLOG = int(getenv("IMPORT_BACKLOG", "3"))
+    IMPORT_HORIZON = float(getenv("IMPORT_HORIZON", "0"))
+    JOB_RETENTION = int(getenv("JOB_RETENTION", "600"))
+    ENCODE_SLOTS = int(getenv("ENCODE_SLOTS", "0"))
+    TRACE_FILE = getenv("TRACE_FILE", "traces.jsonl")
+    TUNING_FILE = getenv("TUNING_FILE", "tuning.json")
+    ASSET_DIR = getenv("ASSET_DIR", "assets")
+    ASSET_REVALIDATE = float(getenv("ASSET_REVALIDATE", "24"))
+    DISK_MIN_FREE = float(getenv("DISK_MIN_FREE", "2"))
+    OUTPUT_RATIO = float(getenv("OUTPUT_RATIO", "0.6"))
+    GC_INTERVAL = int(getenv("GC_INTERVAL", "30"))
+    GC_MAX_AGE = float(getenv("GC_MAX_AGE", "24"))
+    GC_RESUME_AGE = float(getenv("GC_RESUME_AGE", "72"))
+    PIPELINE_UPLOAD = getenv("PIPELINE_UPLOAD", "False").lower() == "true"
+    HLS = getenv("HLS", "False").lower() == "true"
+    SPLIT_SIZE = int(getenv("SPLIT_SIZE", "1990"))
+    HELPER_TOKENS = getenv("HELPER_TOKENS", "").split()
+    MEDIA_POOL = int(getenv("MEDIA_POOL", "2"))
+    DISTRIBUTED = getenv("DISTRIBUTED", "False").lower() == "true"
+    SHARED_DIR = getenv("SHARED_DIR", "")
+    REMOTE_SLOTS = int(getenv("REMOTE_SLOTS", "8"))
+    LEASE_TTL = int(getenv("LEASE_TTL", "60"))
+    JOB_ATTEMPTS = int(getenv("JOB_ATTEMPTS", "3"))
+    JOB_TTL = float(getenv("JOB_TTL", "24"))
+    FILE_CACHE_SIZE = int(getenv("FILE_CACHE_SIZE", "5000"))
+    FILE_CACHE_DB = getenv("FILE_CACHE_DB", "True").lower() == "true"
     START_PHOTO = getenv("START_PHOTO", "https://te.legra.ph/file/120de4dbad87fb20ab862.jpg")
     START_MSG = getenv("START_MSG", "<b>Hey {first_name}</b>,\n\n    <i>I am Auto Animes Store & Automater Encoder Build with ❤️ !!</i>")
     START_BUTTONS = getenv("START_BUTTONS", "UPDATES|https://telegram.me/Matiz_Tech SUPPORT|https://t.me/+p78fp4UzfNwzYzQ5")
+    LOG_TAIL = int(getenv("LOG_TAIL", "500"))
+    METRICS_HOST = getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(getenv("METRICS_PORT", "9100"))
+    SERVE_FILES = getenv("SERVE_FILES", "False").lower() == "true"
+    SERVE_HOST = getenv("SERVE_HOST", "127.0.0.1")
+    SERVE_PORT = int(getenv("SERVE_PORT", "8000"))
+    SERVE_URL = getenv("SERVE_URL", "")
+    SERVE_SECRET = getenv("SERVE_SECRET", "")
+    SERVE_TTL = float(getenv("SERVE_TTL", "24"))
+    SERVE_RATE = int(getenv("SERVE_RATE", "60"))
+    SERVE_CONNS = int(getenv("SERVE_CONNS", "4"))
+    SERVE_PROXY = getenv("SERVE_PROXY", "True").lower() == "true"
+    WATCHDOG = getenv("WATCHDOG", "True").lower() == "true"
+    WATCHDOG_THRESHOLD = float(getenv("WATCHDOG_THRESHOLD", "1"))
+
+# Written by bench.calibrate, one entry per host
+TUNING = {}
+if Var.TUNING_FILE and ospath.exists(Var.TUNING_FILE):
+    try:
+        with open(Var.TUNING_FILE) as f:
+            TUNING = jload(f).get(gethostname(), {})
+    except Exception:
+        LOGS.error(f"Unreadable Tuning Table {Var.TUNING_FILE}\n{format_exc()}")
+
+ENCODE_SLOTS = Var.ENCODE_SLOTS or TUNING.get('slots', 1)
+ffLock = Semaphore(ENCODE_SLOTS)
+ffQueue = Queue()
+# Set by main() once the asset cache is ready and the last run's remote jobs are reaped
+encodes_ready = Event()
 
-if Var.THUMB and not ospath.exists("thumb.jpg"):
-    system(f"wget -q {Var.THUMB} -O thumb.jpg")
-    LOGS.info("Thumbnail has been Saved!!")
 if not ospath.isdir("encode/"):
     mkdir("encode/")
 if not ospath.isdir("thumbs/"):
@@ -75,7 +179,7 @@ if not ospath.isdir("downloads/"):
     mkdir("downloads/")
 
 try:
-    bot = Client(name="AutoAniAdvance", api_id=Var.API_ID, api_hash=Var.API_HASH, bot_token=Var.BOT_TOKEN, plugins=dict(root="bot/modules"), parse_mode=ParseMode.HTML)
+    bot = Client(name="AutoAniAdvance", api_id=Var.API_ID, api_hash=Var.API_HASH, bot_token=Var.BOT_TOKEN, parse_mode=ParseMode.HTML)
     bot_loop = bot.loop
     #sch = AsyncIOScheduler(timezone="Asia/Kolkata", event_loop=bot_loop)
 except Exception as ee:
@@ -5,11 +5,25 @@ from pyrogram.filters import command, user
 from os import path as ospath, execl, kill
 from sys import executable
 from signal import SIGKILL
+from time import perf_counter
+from traceback import format_exc
+from importlib import import_module
 
 #from bot import bot, Var, bot_loop, LOGS, ffQueue, ffLock, ffpids_cache, ff_queued, sch
-from bot import bot, Var, bot_loop, LOGS, ffQueue, ffLock, ffpids_cache, ff_queued
+from bot import bot, Var, bot_loop, LOGS, ffQueue, ffLock, BOOT_TIME, encodes_ready
 #from bot.core.auto_animes import fetch_animes
 from bot.core.func_utils import clean_up, new_task, editMessage
+from bot.core.metrics import start_metrics_server
+from bot.core.watchdog import watchdog
+from bot.core.autodel import auto_deleter
+from bot.core.storage import storage
+from bot.core.mediapool import media_pool
+from bot.core.uploadpool import upload_pool
+from bot.core.fileserver import start_file_server
+from bot.core.jobs import jobs
+from bot.core.throughput import throughput
+from bot.core.assets import assets
+from bot.core.jobqueue import reap_jobs, job_gc_loop
 #from bot.modules.up_posts import upcoming_animes
 
 async def queue_loop():
@@ -17,26 +31,74 @@ async def queue_loop():
     while True:
         if not ffQueue.empty():
             post_id = await ffQueue.get()
+            if not (job := jobs.get(post_id)) or job.finished is not None:
+                # Removed while it was waiting
+                ffQueue.task_done()
+                continue
             await asleep(1.5)
-            ff_queued[post_id].set()
+            job.turn.set()
             await asleep(1.5)
             async with ffLock:
                 ffQueue.task_done()
         await asleep(10)
 
+# Handler modules under bot/modules, the admin ones load after the connect so /start is answered first
+START_PLUGINS = ("start",)
+PLUGINS = ("cmds", "admincode")
+
+def load_plugins(names):
+    for name in names:
+        import_module(f"bot.modules.{name}")
+
 async def main():
     #sch.add_job(upcoming_animes, "cron", hour=0, minute=30)
+    imported = perf_counter()
+    media_pool.start()
+    load_plugins(START_PLUGINS)
     await bot.start()
+    connected = perf_counter()
+    load_plugins(PLUGINS)
+    started = perf_counter()
+    # /start already answers, only encodes wait on the assets and the reap ( START_PHOTO falls back to its URL meanwhile )
+    try:
+        await assets.prepare()
+    except Exception as e:
+        LOGS.critical(f"{e}. Exiting Now...")
+        await bot.stop()
+        exit(1)
+    # Encodes are held until now, so every job still in the queue was left by the last run
+    try:
+        await reap_jobs()
+    except Exception:
+        LOGS.error(f"Reaping Encode Jobs Failed\n{format_exc()}")
+    encodes_ready.set()
     #await restart()
     LOGS.info('Auto Anime Bot Started!')
+    if Var.HELPER_TOKENS:
+        LOGS.info(f"Upload Pool : {await upload_pool.start()} Client(s)")
     #sch.start()
+    await throughput.load()
     bot_loop.create_task(queue_loop())
+    bot_loop.create_task(watchdog.heartbeat())
+    bot_loop.create_task(auto_deleter.run())
+    bot_loop.create_task(storage.gc_loop())
+    bot_loop.create_task(job_gc_loop())
+    bot_loop.create_task(assets.revalidate_loop())
+    from bot.modules.cmds import resume_downloads
+    bot_loop.create_task(resume_downloads())
+    if Var.WATCHDOG:
+        watchdog.enable()
+    await start_metrics_server()
+    await start_file_server()
+    LOGS.info(f"Startup Timings : Imports {imported - BOOT_TIME:.2f}s | Connect {connected - imported:.2f}s | Plugins {started - connected:.2f}s | Services {perf_counter() - started:.2f}s | Total {perf_counter() - BOOT_TIME:.2f}s")
     #await fetch_animes()
     await idle()
     LOGS.info('Auto Anime Bot Stopped!')
+    await upload_pool.stop()
     await bot.stop()
     for task in all_tasks:
         task.cancel()
+    media_pool.shutdown()
     await clean_up()
     LOGS.info('Finished AutoCleanUp !!')
     
@@ -0,0 +1,141 @@
+from os import path as ospath, makedirs
+from re import findall
+from time import time
+from hashlib import sha256
+from mimetypes import guess_extension
+from traceback import format_exc
+from json import loads as jloads, dumps as jdumps
+from asyncio import gather, sleep as asleep
+from aiofiles import open as aiopen
+from aiofiles.os import path as aiopath, remove as aioremove, rename as aiorename
+from aiohttp import ClientTimeout
+
+from bot import Var, LOGS
+from .func_utils import get_session
+
+# Only ffmpeg inputs, URLs in metadata or filter text are left as written
+INPUT_URL = r"""(?<!\S)-i\s+(['"]?)(https?://[^\s'"]+)\1"""
+
+def is_url(ref):
+    return bool(ref) and ref.startswith(("http://", "https://"))
+
+class AssetCache:
+    """Local copies of remote inputs, stored by content hash and revalidated with ETag / Last-Modified."""
+    def __init__(self, path):
+        self.__dir = path
+        self.__index_path = ospath.join(path, "index.json")
+        self.__index = {}
+        self.__templates = {}
+        self.__media = True
+
+    def local(self, ref):
+        """Cached path of ref, ref itself when it is not a URL or has not been fetched."""
+        return entry['path'] if (entry := self.__index.get(ref)) else ref
+
+    def file_id(self, ref):
+        """Telegram file_id of an already sent asset, else its local path."""
+        return (entry := self.__index.get(ref)) and entry.get('file_id') or self.local(ref)
+
+    async def uploaded(self, ref, file_id):
+        if (entry := self.__index.get(ref)) and entry.get('file_id') != file_id:
+            entry['file_id'] = file_id
+            await self.__save_index()
+
+    async def __load_index(self):
+        makedirs(self.__dir, exist_ok=True)
+        if await aiopath.exists(self.__index_path):
+            try:
+                async with aiopen(self.__index_path, 'r') as f:
+                    self.__index = jloads(await f.read())
+            except Exception:
+                LOGS.error(f"Unreadable Asset Index, Refetching All\n{format_exc()}")
+
+    async def __save_index(self):
+        async with aiopen(f"{self.__index_path}.tmp", 'w') as f:
+            await f.write(jdumps(self.__index, indent=2))
+        await aiorename(f"{self.__index_path}.tmp", self.__index_path)
+
+    async def fetch(self, url):
+        entry = self.__index.get(url)
+        headers = {}
+        if entry and await aiopath.exists(entry['path']):
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('modified'):
+                headers['If-Modified-Since'] = entry['modified']
+        else:
+            entry = None
+        async with get_session().get(url, headers=headers, timeout=ClientTimeout(total=60)) as resp:
+            if resp.status == 304 and entry:
+                entry['checked'] = time()
+                return entry['path']
+            if resp.status != 200:
+                raise Exception(f"HTTP {resp.status}")
+            data = await resp.read()
+            etag, modified, mime = resp.headers.get("ETag"), resp.headers.get("Last-Modified"), resp.content_type
+        ext = ospath.splitext(url.split("?")[0])[1] or guess_extension(mime or "") or ""
+        path = ospath.join(self.__dir, f"{sha256(data).hexdigest()[:32]}{ext}")
+        if not await aiopath.exists(path):
+            async with aiopen(f"{path}.tmp", 'wb') as f:
+                await f.write(data)
+            await aiorename(f"{path}.tmp", path)
+        if entry and entry['path'] != path:
+            LOGS.info(f"Asset {url} Changed Upstream")
+            if not any(other['path'] == entry['path'] for key, other in self.__index.items() if key != url):
+                await aioremove(entry['path'])
+        # A new file_id is needed once the content changes
+        file_id = entry.get('file_id') if entry and entry['path'] == path else None
+        self.__index[url] = {'path': path, 'etag': etag, 'modified': modified, 'size': len(data), 'checked': time(), 'file_id': file_id}
+        return path
+
+    def __urls(self):
+        urls = {url for ffcode in self.__templates.values() for _, url in findall(INPUT_URL, ffcode)}
+        return urls | {ref for ref in (Var.THUMB, Var.START_PHOTO) if self.__media and is_url(ref)}
+
+    async def refresh(self, strict=False):
+        """Revalidates every remote asset, a stale copy is kept when the host is down. With strict, an asset without any copy raises."""
+        urls = self.__urls()
+        results = await gather(*(self.fetch(url) for url in urls), return_exceptions=True)
+        missing = []
+        for url, res in zip(urls, results):
+            if not isinstance(res, BaseException):
+                continue
+            if url in self.__index and await aiopath.exists(self.__index[url]['path']):
+                LOGS.warning(f"Asset {url} Unreachable ({res!r}), Using Cached Copy")
+            else:
+                self.__index.pop(url, None)
+                missing.append(f"{url} ({res!r})")
+        await self.__save_index()
+        self.__apply()
+        if missing and strict:
+            raise Exception(f"Remote Asset(s) could not be Fetched : {', '.join(missing)}")
+        for url in missing:
+            LOGS.error(f"Asset {url} could not be Fetched")
+        return len(urls) - len(missing)
+
+    def __apply(self):
+        from .ffencoder import ffargs
+        for qual, ffcode in self.__templates.items():
+            for _, url in findall(INPUT_URL, ffcode):
+                ffcode = ffcode.replace(url, self.local(url))
+            ffargs[qual] = ffcode
+
+    async def prepare(self, media=True):
+        """Fetches the remote inputs, with media False only the ones in the templates ( encode workers post nothing )."""
+        from .ffencoder import ffargs
+        self.__media = media
+        await self.__load_index()
+        # The templates as configured, so later refreshes can point them at new content
+        self.__templates = dict(ffargs)
+        count = await self.refresh(strict=True)
+        LOGS.info(f"Asset Cache Ready with {count} Remote Input(s)")
+
+    async def revalidate_loop(self):
+        while Var.ASSET_REVALIDATE:
+            await asleep(Var.ASSET_REVALIDATE * 3600)
+            try:
+                await self.refresh()
+            except Exception:
+                LOGS.error(format_exc())
+
+assets = AssetCache(Var.ASSET_DIR)
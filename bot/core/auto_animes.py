@@ -1,25 +1,34 @@
 import os
 import time
-from moviepy.editor import VideoFileClip
-from PIL import Image
-from asyncio import gather, create_task, sleep as asleep, Event
+from asyncio import gather, create_task, sleep as asleep
 from asyncio.subprocess import PIPE
 from os import path as ospath, system
 from aiofiles import open as aiopen
 from aiofiles.os import remove as aioremove
+from aioshutil import rmtree as aiormtree
 from traceback import format_exc
 from base64 import urlsafe_b64encode
 #from time import time
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
 
-from bot import bot, bot_loop, Var, ani_cache, ffQueue, ffLock, ff_queued
+from bot import bot, bot_loop, Var, LOGS, ani_cache, ffQueue, ffLock, log_jobid, encodes_ready
 from .tordownload import TorDownloader
 from .database import db
-from .func_utils import getfeed, encode, editMessage, sendMessage, convertBytes
+from .func_utils import getfeed, encode, editMessage, sendMessage, convertBytes, convertTime, retry_call, get_file_link
 from .ffencoder import FFEncoder
+from .jobqueue import RemoteEncoder, remote_slots
 from .tguploader import TgUploader
 from .reporter import rep
 from .utils import progress_for_pyrogram
+from .metrics import queue_wait, time_stage, observe_transfer
+from .filecache import file_cache
+from .mediapool import media_pool, video_info, video_thumbnail
+from .uploadpool import upload_pool
+from .fileserver import publish_output
+from .pipeupload import PipelinedUpload
+from .splitter import needs_split, split_video, upload_parts, publish_group, drop_parts
+from .jobs import jobs
+from .throughput import throughput
 
 btn_formatter = {
     '1080':'𝟭𝟬𝟴𝟬𝗽', 
@@ -28,34 +37,16 @@ btn_formatter = {
     '360':'𝟯𝟲𝟬𝗽'
 }
 
-ff_encoders = {}
-file_path_cache = {}
-
 async def download_thumbnail(video, thumbnail_path="thumbnail.jpg"):
+    # Probe and frame grab share one decode in the media pool, returns duration, width, height, thumbnail
     try:
-        clip = VideoFileClip(video)
-        duration = clip.duration
-        thumbnail_time = duration / 2
-        frame = clip.get_frame(thumbnail_time)
-        image = Image.fromarray(frame)
-        image.save(thumbnail_path)
-        clip.close()
-        return thumbnail_path 
-    except Exception as e:
-        print(f"Error generating thumbnail: {e}")
-        return None
-
-def get_video_info(video_path):
-    try:
-        clip = VideoFileClip(video_path)
-        duration = clip.duration  # Duration in seconds
-        width, height = clip.size  # Video resolution
-        clip.close()
-        print("Video information retrieved successfully!")
-        return duration, width, height
+        duration, width, height, data = await media_pool.run(video_thumbnail, video)
     except Exception as e:
-        print(f"Error getting video info: {e}")
-        return None, None, None
+        await rep.report(f"Error generating thumbnail: {e}", "warning", log=False)
+        return (await media_pool.run(video_info, video)) + (None,)
+    async with aiopen(thumbnail_path, "wb") as f:
+        await f.write(data)
+    return duration, width, height, thumbnail_path
         
 async def fetch_animes():
     await rep.report("Fetch Animes Started !!", "info")
@@ -68,134 +59,166 @@ async def fetch_animes():
 
 @bot.on_callback_query()
 async def callback_handler(client, query: CallbackQuery):
-    if query.data.startswith("queue_status:"):
-        encodeid = int(query.data.split(":")[1])
-        position = list(ffQueue._queue).index(encodeid) + 1
-        total_tasks = ffQueue.qsize()
+    action, _, encodeid = query.data.partition(":")
+    if action not in ("queue_status", "remove_task", "cancel_encoding"):
+        return
+    job = jobs.get(int(encodeid))
+
+    if action == "queue_status":
+        waiting = [task for task in ffQueue._queue if (queued := jobs.get(task)) and queued.finished is None]
+        if not job or job.stage != "queued" or job.id not in waiting:
+            return await query.answer("Task is no longer in the Queue.", show_alert=True)
+        wait = throughput.queue_wait(job.id)
         await query.answer(
-            f"Queue Position: {position}\nTotal Queue: {total_tasks}",
+            f"Queue Position: {waiting.index(job.id) + 1}\nTotal Queue: {len(waiting)}"
+            + (f"\nExpected Start: in ~{convertTime(wait) or '1s'}" if wait else ""),
             show_alert=True
         )
 
-    elif query.data.startswith("remove_task:"):
-        data = query.data.split(":")
-        encodeid = int(data[1])  # The encodeid
-        fpath = file_path_cache.get(encodeid)  # Retrieve the file path from cache
-        
-        if fpath:
-            # Proceed with the removal of the task and file
-            temp_queue = []
-            removed = False
-            while not ffQueue.empty():
-                task = await ffQueue.get()
-                if task == encodeid:
-                    removed = True  # Mark task as removed
-                    continue  # Skip this task
-                temp_queue.append(task)
-
-            # Re-add the remaining tasks back to the queue
-            for task in temp_queue:
-                await ffQueue.put(task)
-
-            # Delete the file associated with the task
-            if removed and os.path.exists(fpath):
-                try:
-                    await aioremove(fpath)  # Remove the file
-                    await query.answer("Task removed from the queue and file deleted.", show_alert=True)
-                except Exception as e:
-                    await query.answer(f"Error deleting file: {e}", show_alert=True)
-            elif removed:
-                await query.answer("Task removed, but file not found.", show_alert=True)
-            
-            # Remove from the cache after the task is processed
-            file_path_cache.pop(encodeid, None)
-
-            # Delete the queue status message
-            await query.message.delete()
+    elif action == "remove_task":
+        if not job or job.stage != "queued":
+            return await query.answer("Task is no longer in the Queue.", show_alert=True)
+        # The queue loop skips finished jobs, waking it lets fencode return and release its storage
+        jobs.finish(job.id, "removed")
+        job.turn.set()
+        if job.src_path and ospath.exists(job.src_path):
+            try:
+                await aioremove(job.src_path)
+                await query.answer("Task removed from the queue and file deleted.", show_alert=True)
+            except Exception as e:
+                await query.answer(f"Error deleting file: {e}", show_alert=True)
         else:
-            await query.answer("File path not found in cache.", show_alert=True)
-    
-    elif query.data.startswith("cancel_encoding:"):
-        # Extract the file name (encoded filename)
-        encodeid = int(query.data.split(":")[1])
+            await query.answer("Task removed from the queue.", show_alert=True)
+        await query.message.delete()
 
-        # Check if the encoding task is in progress and cancel it
-        encodeid = int(query.data.split(":")[1])
+    elif action == "cancel_encoding":
+        if not job or not job.encoder:
+            return await query.answer("No encoding task found to cancel.", show_alert=True)
+        await job.encoder.cancel_encode()
+        await query.answer("Encoding process has been canceled.", show_alert=True)
 
-        # Check if the encoding task exists
-        if encodeid in ff_encoders:
-            encoder = ff_encoders[encodeid]  # Retrieve the FFEncoder instance
-            await encoder.cancel_encode()  # Call cancel_encode to stop the encoding
-            await query.answer("Encoding process has been canceled.", show_alert=True)
-        else:
-            await query.answer("No encoding task found to cancel.", show_alert=True)
 
+async def fencode(fname, fpath, message, m, source=None):
+    """Runs one encode job, returns the stage it ended in ( done, failed, cancelled or removed )."""
+    try:
+        await encode_job(fname, fpath, message, m, source)
+    finally:
+        # Catches exits the job did not record itself, a no-op for finished ones
+        job = jobs.finish(m.id, "failed")
+    return job.stage if job else "failed"
 
-async def fencode(fname, fpath, message, m):
+async def encode_job(fname, fpath, message, m, source=None):
     # Notify the user that encoding has started
     #t = time.time()
     encode = await m.edit_text(
         f"File downloaded successfully:\n\n"
         f"    • <b>File Name:</b> {fname}\n"
-        f"    • <b>File Path:</b> {fpath}"
+        f"    • <b>File Path:</b> {fpath or 'Streaming from Telegram'}"
     )
     stat_msg = await m.edit_text(
         f"‣ <b>File Name :</b> <b><i>{fname}</i></b>\n\n<i>Processing...</i>",
     )
     
     encodeid = encode.id
-    ffEvent = Event()
-    ff_queued[encodeid] = ffEvent
+    log_jobid.set(encodeid)
+    # Templates point at local assets and stale remote jobs are gone only after startup finishes
+    await encodes_ready.wait()
+    # Downloaded files go to the worker queue, streamed input can only be fed from this process
+    remote = Var.DISTRIBUTED and bool(fpath)
+    lock = remote_slots if remote else ffLock
+    job = jobs.add(encodeid, fname, fpath, stat_msg, "360", remote)
+    # Probed up front, the throughput model needs it for queue estimates and FFEncoder reuses it
+    if fpath:
+        job.size = ospath.getsize(fpath)
+        try:
+            job.duration, job.width, job.height = await media_pool.run(video_info, fpath)
+        except Exception as e:
+            LOGS.warning(f"Probing {fname} Failed : {e}")
+    elif source is not None:
+        media = getattr(source, source.media.value)
+        job.size, job.duration = getattr(media, 'file_size', None), getattr(media, 'duration', None)
+        job.width, job.height = getattr(media, 'width', None), getattr(media, 'height', None)
 
     # If the lock is already engaged, inform the user that the task is queued
-    if ffLock.locked():
-        file_path_cache[encodeid] = fpath
+    if not remote and ffLock.locked():
         queue_markup = InlineKeyboardMarkup(
         [
             [InlineKeyboardButton("Queue Status", callback_data=f"queue_status:{encodeid}")],
             [InlineKeyboardButton("Remove from Queue", callback_data=f"remove_task:{encodeid}")]
         ]
         )
+        wait = throughput.queue_wait(encodeid)
         await stat_msg.edit_text(
-            f"‣ <b>File Name :</b> <b><i>{fname}</i></b>\n\n<i>Queued to Encode...</i>",
+            f"‣ <b>File Name :</b> <b><i>{fname}</i></b>\n\n<i>Queued to Encode...</i>"
+            + (f"\n‣ <b>Expected Start :</b> in ~{convertTime(wait) or '1s'}" if wait else ""),
             reply_markup=queue_markup
         )
 
-    #encoder = FFEncoder(stat_msg, fpath, fname, encodeid, "360")
-    #ff_encoders[encodeid] = encoder
-    
     # Add the encoding task to the queue and wait for its turn
-    await ffQueue.put(encodeid)
-    await ffEvent.wait()
+    queued_at = time.time()
+    if not remote:
+        await ffQueue.put(encodeid)
+        await job.turn.wait()
+        if job.finished is not None:
+            # Removed from the queue, the callback already deleted the source and status
+            return
  
     t = time.time()
    
     # Acquire the lock for the current encoding task
-    await ffLock.acquire()
+    await lock.acquire()
+    job.wait = time.time() - queued_at
+    queue_wait.observe(job.wait)
+    jobs.set_stage(encodeid, "encoding")
     await stat_msg.edit_text(
         f"‣ <b>File Name :</b> <b><i>{fname}</i></b>\n\n<i>Ready to Encode...</i>"
     )
 
     await asleep(1.5)
 
+    out_path, encoder, pipeline = None, None, None
     try:
         # Start the encoding process
-        out_path = await FFEncoder(stat_msg, fpath, fname, encodeid, "360").start_encode()    
+        if remote:
+            encoder = RemoteEncoder(stat_msg, fpath, fname, encodeid, job.profile)
+        else:
+            pipeline = PipelinedUpload() if Var.PIPELINE_UPLOAD else None
+            encoder = FFEncoder(stat_msg, fpath, fname, encodeid, job.profile, source=source, pipeline=pipeline)
+        job.encoder = encoder
+        out_path = await encoder.start_encode()    
+        if not out_path:
+            raise Exception("Cancelled" if encoder.is_cancelled else "FFmpeg exited with an error, check logs")
     except Exception as e:
         await stat_msg.delete()
-        await aioremove(out_path)
-        await aioremove(fpath)
+        if pipeline:
+            await pipeline.close()
+        if out_path and ospath.exists(out_path):
+            await aioremove(out_path)
+        if getattr(encoder, 'hls_dir', None):
+            await aiormtree(ospath.dirname(encoder.hls_dir), ignore_errors=True)
+        if fpath and ospath.exists(fpath):
+            await aioremove(fpath)
         #await encode.delete()
-        ffLock.release()
+        lock.release()
+        jobs.finish(encodeid, "cancelled" if getattr(encoder, 'is_cancelled', False) else "failed")
         return await message.reply(f"<b>Encoding failed: {str(e)}</b>")
 
+    # The source is no longer needed, upload retries work from the encoded output
+    if fpath and ospath.exists(fpath):
+        await aioremove(fpath)
+    job.encoder, job.out_path, job.out_size = None, out_path, ospath.getsize(out_path)
+    jobs.set_stage(encodeid, "uploading")
     await stat_msg.edit_text("<b>Successfully Compressed. Now proceeding to upload...</b>")
     await asleep(1.5)
 
+    thumbnail_path = None
     try:
+        with time_stage("thumbnail"):
+            duration, width, height, thumbnail_path = await download_thumbnail(out_path, ospath.join("thumbs", f"{encodeid}.jpg"))
+        # The upload model learns from transfer time only, not the stages around it
         start_time = time.time()
-        duration, width, height = get_video_info(out_path)
-        thumbnail_path = await download_thumbnail(out_path)
+        job.duration = job.duration or duration
+        job.width, job.height = job.width or width, job.height or height
         
         # Upload the encoded file using Pyrogram's send_video
         #await bot.send_document(
@@ -207,18 +230,6 @@ async def fencode(fname, fpath, message, m):
         #    progress=progress_for_pyrogram,
         #    progress_args=("<b>Upload Started....</b>", stat_msg, start_time)
         #)
-        msg = await bot.send_video(
-            chat_id=message.chat.id,
-            video=out_path,
-            thumb=thumbnail_path,
-            caption=f"‣ <b>File Name:</b> <i>{fname}</i>",
-            duration=int(duration),
-            width=width,
-            height=height,
-            supports_streaming=True,
-            progress=progress_for_pyrogram,
-            progress_args=("<b>Upload Started....</b>", stat_msg, start_time)
-        )
         #channel_id = int(-1001825550753)  # Replace with your channel ID
         #await msg.copy(chat_id=channel_id)
         channel_ids = [
@@ -226,26 +237,86 @@ async def fencode(fname, fpath, message, m):
             int(-1002373955828)
         ]
 
-        for channel_id in channel_ids:
-            await msg.copy(chat_id=channel_id)
+        if needs_split(out_path):
+            if pipeline:
+                await pipeline.close()
+            # Over the Telegram file limit, posted as an album of parts instead
+            with time_stage("split"):
+                parts = await split_video(out_path, duration)
+            start_time = time.time()
+            with time_stage("upload"):
+                group = await upload_parts(parts, "send_video", f"‣ <b>File Name:</b> <i>{fname}</i>",
+                    thumb=thumbnail_path,
+                    width=width,
+                    height=height,
+                    supports_streaming=True,
+                    progress=progress_for_pyrogram,
+                    progress_args=("<b>Uploading Parts....</b>", stat_msg, start_time, "upload")
+                )
+            observe_transfer("upload", ospath.getsize(out_path), time.time() - start_time)
+            with time_stage("fanout"):
+                await publish_group(group, message.chat.id)
+                for channel_id in channel_ids:
+                    if channel_id != Var.FILE_STORE:
+                        await publish_group(group, channel_id)
+            await message.reply(f"<b>{len(group)} Parts Link :</b> {await get_file_link(group[0].id, group[-1].id)}")
+        else:
+            with time_stage("upload"):
+                # Most of the file already went up during the encode, only the tail and rewritten header are left
+                msg = pipeline and await pipeline.complete(out_path, message.chat.id, f"‣ <b>File Name:</b> <i>{fname}</i>",
+                    thumb=thumbnail_path,
+                    duration=duration,
+                    width=width,
+                    height=height
+                )
+                pipelined = bool(msg)
+                msg = msg or await retry_call(upload_pool.send, "send_video", message.chat.id,
+                    video=out_path,
+                    thumb=thumbnail_path,
+                    caption=f"‣ <b>File Name:</b> <i>{fname}</i>",
+                    duration=int(duration),
+                    width=width,
+                    height=height,
+                    supports_streaming=True,
+                    progress=progress_for_pyrogram,
+                    progress_args=("<b>Upload Started....</b>", stat_msg, start_time, "upload")
+                )
+            # A pipelined upload sent most bytes during the encode, its tail time says nothing about bandwidth
+            if not pipelined:
+                observe_transfer("upload", ospath.getsize(out_path), time.time() - start_time)
+
+            with time_stage("fanout"):
+                for channel_id in channel_ids:
+                    cmsg = await retry_call(msg.copy, chat_id=channel_id)
+                    if channel_id == Var.FILE_STORE:
+                        await file_cache.put(cmsg)
     except Exception as e:
         await message.reply(
-            f"<b>Error during upload: {e}. Encoding task canceled, please retry.</b>"
+            f"<b>Error during upload: {e}. Gave up after {Var.RETRY_ATTEMPTS} attempts, encoded output kept at</b> <code>{out_path}</code>"
         )
         await stat_msg.delete()
-        await aioremove(out_path)
-        await aioremove(fpath)
         #await encode.delete()
-        ffLock.release()
+        lock.release()
+        jobs.finish(encodeid, "failed")
         return
     finally:
+        # complete() closes it on success, any earlier failure would leak the media session
+        if pipeline:
+            await pipeline.close()
+        if thumbnail_path and ospath.exists(thumbnail_path):
+            await aioremove(thumbnail_path)
+        await drop_parts(out_path)
+
+    dl_link = None
+    if Var.SERVE_FILES and Var.SERVE_PORT:
+        dl_link = await publish_output(encodeid, out_path)
+    else:
         await aioremove(out_path)
-        await aioremove(fpath)
-        await aioremove(thumbnail_path)
 
     # Release the lock once the task is completed
-    ffLock.release()
+    lock.release()
     await stat_msg.delete()
+    jobs.finish(encodeid)
     total_time = time.time() - t
     formatted_time = time.strftime("%H:%M:%S", time.gmtime(total_time))
     #await encode.delete()
@@ -256,4 +327,6 @@ async def fencode(fname, fpath, message, m):
         f"‣ <b>File Name:</b> <b><i>{fname}</i></b>\n\n"
         f"<i>Upload completed successfully.</i>\n"
         f"‣ <b>Total Time Taken:</b> {formatted_time}"
+        + (f"\n‣ <b>Direct Link:</b> <a href='{dl_link}'>Download</a> <i>( Expires in {Var.SERVE_TTL:g}h )</i>" if dl_link else "")
+        + (f"\n‣ <b>Stream:</b> <a href='{encoder.hls_link}'>Watch in Browser</a>" if getattr(encoder, 'hls_link', None) else "")
     )
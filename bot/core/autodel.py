@@ -0,0 +1,77 @@
+from math import ceil
+from time import time
+from traceback import format_exc
+from asyncio import Event, sleep as asleep, wait_for, TimeoutError as AsyncTimeout
+
+from pyrogram.errors import FloodWait
+
+from bot import bot, Var, LOGS
+from .database import db
+from .reporter import rep
+from .metrics import observe_floodwait
+
+class AutoDeleter:
+    def __init__(self, client, bucket_size=30):
+        self.__client = client
+        self.__bucket_size = bucket_size
+        self.__buckets = {}
+        self.__wakeup = Event()
+
+    def __bucket(self, due):
+        return int(ceil(due / self.__bucket_size) * self.__bucket_size)
+
+    async def schedule(self, chat_id, msg_ids, delay):
+        bucket = self.__bucket(time() + delay)
+        self.__buckets.setdefault(bucket, {}).setdefault(chat_id, []).extend(msg_ids)
+        try:
+            await db.addAutoDel(bucket, chat_id, msg_ids)
+        except Exception:
+            LOGS.error(format_exc())
+        if bucket == min(self.__buckets):
+            self.__wakeup.set()
+
+    async def __load(self):
+        for doc in await db.getAutoDels():
+            chats = self.__buckets.setdefault(doc['_id'], {})
+            for chat_id, msg_ids in doc.get('chats', {}).items():
+                chats.setdefault(int(chat_id), []).extend(msg_ids)
+        if (overdue := sum(1 for bucket in self.__buckets if bucket <= time())):
+            LOGS.info(f"Auto Delete : Catching Up on {overdue} Overdue Bucket(s)")
+
+    async def __delete(self, chat_id, msg_ids):
+        for i in range(0, len(msg_ids), 100):
+            chunk = msg_ids[i:i+100]
+            while True:
+                try:
+                    await self.__client.delete_messages(chat_id, chunk)
+                    break
+                except FloodWait as f:
+                    observe_floodwait("autodel", f.value)
+                    await asleep(f.value * 1.2)
+                except Exception as e:
+                    await rep.report(f"Auto Delete : {chat_id} | Error : {str(e)}", "warning", log=False)
+                    break
+
+    async def run(self):
+        try:
+            await self.__load()
+        except Exception:
+            await rep.report(format_exc(), "error")
+        while True:
+            self.__wakeup.clear()
+            timeout = (min(self.__buckets) - time()) if self.__buckets else None
+            if timeout is None or timeout > 0:
+                try:
+                    await wait_for(self.__wakeup.wait(), timeout)
+                except AsyncTimeout:
+                    pass
+                continue
+            for bucket in sorted(b for b in self.__buckets if b <= time()):
+                for chat_id, msg_ids in self.__buckets.pop(bucket).items():
+                    await self.__delete(chat_id, list(dict.fromkeys(msg_ids)))
+                try:
+                    await db.delAutoDel(bucket)
+                except Exception:
+                    LOGS.error(format_exc())
+
+auto_deleter = AutoDeleter(bot, Var.DEL_BUCKET)
@@ -0,0 +1,144 @@
+from time import time
+from heapq import heappush, heappop
+from itertools import count
+from collections import deque
+
+from bot import Var, bot_loop
+from .metrics import Metric, Counter, Gauge
+
+TRAFFIC = ("upload", "download", "torrent")
+# Lower goes first, an upload is the last step before a post is out
+PRIO_UPLOAD, PRIO_DOWNLOAD, PRIO_BULK = 0, 1, 2
+PRIORITY = {'upload': PRIO_UPLOAD, 'download': PRIO_DOWNLOAD, 'torrent': PRIO_BULK}
+WINDOW = 5
+
+class TokenBucket:
+    """Refills at rate bytes/s up to one second of burst. Goes into debt, so any chunk size fits and the average holds."""
+    __slots__ = ("rate", "tokens", "last")
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.last = time()
+
+    def refill(self, now):
+        self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        return self.tokens
+
+    def ready_in(self):
+        return max(-self.tokens / self.rate, 0)
+
+class BandwidthManager:
+    def __init__(self, total, limits):
+        self.__total = TokenBucket(total) if total else None
+        self.__limits = {traffic: TokenBucket(rate) for traffic, rate in limits.items() if rate}
+        self.__waiters = []
+        self.__seq = count()
+        self.__timer = None
+        self.__moved = {traffic: deque() for traffic in TRAFFIC}
+
+    def budget(self, traffic=None):
+        bucket = self.__limits.get(traffic) if traffic else self.__total
+        return bucket.rate if bucket else 0
+
+    @property
+    def waiting(self):
+        return len(self.__waiters)
+
+    def record(self, traffic, nbytes):
+        if nbytes > 0:
+            self.__moved[traffic].append((time(), nbytes))
+            moved_bytes.inc(nbytes, traffic=traffic)
+
+    def rate(self, traffic):
+        moved, cutoff = self.__moved[traffic], time() - WINDOW
+        while moved and moved[0][0] < cutoff:
+            moved.popleft()
+        return sum(nbytes for _, nbytes in moved) / WINDOW
+
+    async def acquire(self, traffic, nbytes, priority=None):
+        """Waits until traffic may move nbytes more, queued by priority when the budgets are contended."""
+        if self.__total is None and traffic not in self.__limits:
+            return self.record(traffic, nbytes)
+        future = bot_loop.create_future()
+        heappush(self.__waiters, (PRIORITY[traffic] if priority is None else priority, next(self.__seq), traffic, nbytes, future))
+        self.__pump()
+        try:
+            await future
+        except BaseException:
+            # Cancelled while queued, the entry is skipped when it surfaces
+            if not future.done():
+                future.cancel()
+            raise
+
+    def __pump(self):
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+        now, delays, blocked, kept = time(), [], set(), []
+        if self.__total:
+            self.__total.refill(now)
+        for bucket in self.__limits.values():
+            bucket.refill(now)
+        while self.__waiters:
+            entry = heappop(self.__waiters)
+            _, _, traffic, nbytes, future = entry
+            if future.done():
+                continue
+            if self.__total and self.__total.tokens <= 0:
+                # Out of global budget, nothing of lower priority may overtake
+                kept.append(entry)
+                delays.append(self.__total.ready_in())
+                break
+            if traffic in blocked or ((bucket := self.__limits.get(traffic)) and bucket.tokens <= 0):
+                # Only this class is over its own budget, others keep flowing
+                blocked.add(traffic)
+                kept.append(entry)
+                delays.append(self.__limits[traffic].ready_in())
+                continue
+            if bucket:
+                bucket.tokens -= nbytes
+            if self.__total:
+                self.__total.tokens -= nbytes
+            self.record(traffic, nbytes)
+            future.set_result(None)
+        for entry in kept:
+            heappush(self.__waiters, entry)
+        if self.__waiters and self.__timer is None:
+            self.__timer = bot_loop.call_later(max(min(delays, default=0.05), 0.01), self.__pump)
+
+    def allowance(self, traffic):
+        """Rate for traffic not chunked through acquire ( torrents ), what the higher priorities leave of the global budget."""
+        rates = [self.budget(traffic)] if self.budget(traffic) else []
+        if self.__total:
+            busy = sum(self.rate(other) for other in TRAFFIC if PRIORITY[other] < PRIORITY[traffic])
+            rates.append(self.__total.rate - busy)
+        # Never fully zero, a stalled torrent loses its peers
+        return max(min(rates), 16 * 1024) if rates else None
+
+    def throttle(self, traffic, progress=None, priority=None):
+        """Wraps a pyrogram progress callback so each part waits for its share before the next is sent."""
+        last = 0
+
+        async def on_progress(current, total, *args):
+            nonlocal last
+            # A retried transfer starts over from zero
+            sent, last = current - last if current >= last else current, current
+            await self.acquire(traffic, sent, priority)
+            if progress:
+                await progress(current, total, *args)
+        return on_progress
+
+MiB = 1024 * 1024
+bandwidth = BandwidthManager(Var.BW_TOTAL * MiB, {'upload': Var.BW_UPLOAD * MiB, 'download': Var.BW_DOWNLOAD * MiB, 'torrent': Var.BW_TORRENT * MiB})
+
+class TrafficGauge(Gauge):
+    def collect(self):
+        for traffic in TRAFFIC:
+            self.set(round(bandwidth.rate(traffic), 2), traffic=traffic)
+        return Metric.collect(self)
+
+moved_bytes = Counter("bandwidth_bytes_total", "Bytes moved through the bandwidth manager", labels=("traffic",))
+traffic_rate = TrafficGauge("bandwidth_bytes_per_second", f"Rate per traffic class over the last {WINDOW}s", labels=("traffic",))
+bandwidth_waiting = Gauge("bandwidth_waiting", "Transfers waiting for bandwidth budget", func=lambda: bandwidth.waiting)
@@ -1,4 +1,8 @@
-from motor.motor_asyncio import AsyncIOMotorClient
+from time import time
+from datetime import datetime, timezone
+from aiofiles import open as aiopen
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo import ReturnDocument
 from bot import Var
 
 class MongoDB:
@@ -6,6 +10,12 @@ class MongoDB:
         self.__client = AsyncIOMotorClient(uri)
         self.__db = self.__client[database_name]
         self.__animes = self.__db.animes[Var.BOT_TOKEN.split(':')[0]]
+        self.__files = self.__db.files[Var.BOT_TOKEN.split(':')[0]]
+        self.__autodel = self.__db.autodel[Var.BOT_TOKEN.split(':')[0]]
+        self.__reports = self.__db.reports[Var.BOT_TOKEN.split(':')[0]]
+        self.__jobs = self.__db.jobs[Var.BOT_TOKEN.split(':')[0]]
+        self.__models = self.__db.models[Var.BOT_TOKEN.split(':')[0]]
+        self.__grid = AsyncIOMotorGridFSBucket(self.__db, bucket_name=f"encodes_{Var.BOT_TOKEN.split(':')[0]}")
 
     async def getAnime(self, ani_id):
         botset = await self.__animes.find_one({'_id': ani_id})
@@ -18,6 +28,90 @@ class MongoDB:
         if post_id:
             await self.__animes.update_one({'_id': ani_id}, {'$set': {"msg_id": post_id}}, upsert=True)
 
+    async def getFileCache(self, msg_id):
+        return await self.__files.find_one({'_id': msg_id})
+
+    async def saveFileCache(self, msg_id, data):
+        await self.__files.update_one({'_id': msg_id}, {'$set': data}, upsert=True)
+
+    async def delFileCache(self, msg_id):
+        await self.__files.delete_one({'_id': msg_id})
+
+    async def addAutoDel(self, bucket, chat_id, msg_ids):
+        await self.__autodel.update_one({'_id': bucket}, {'$push': {f'chats.{chat_id}': {'$each': msg_ids}}}, upsert=True)
+
+    async def getAutoDels(self):
+        return [doc async for doc in self.__autodel.find({})]
+
+    async def delAutoDel(self, bucket):
+        await self.__autodel.delete_one({'_id': bucket})
+
+    async def getMediaReport(self, key):
+        return await self.__reports.find_one({'_id': key})
+
+    async def saveMediaReport(self, key, data):
+        await self.__reports.update_one({'_id': key}, {'$set': data}, upsert=True)
+
+    async def getModel(self, name):
+        return await self.__models.find_one({'_id': name}) or {}
+
+    async def saveModel(self, name, data):
+        await self.__models.update_one({'_id': name}, {'$set': data}, upsert=True)
+
+    async def addEncodeJob(self, job):
+        await self.__jobs.insert_one(job)
+
+    async def getEncodeJob(self, job_id):
+        return await self.__jobs.find_one({'_id': job_id})
+
+    async def getEncodeJobs(self, query=None):
+        return [job async for job in self.__jobs.find(query or {})]
+
+    async def claimEncodeJob(self, worker, lease):
+        now = time()
+        return await self.__jobs.find_one_and_update(
+            {'$or': [{'state': 'queued'}, {'state': 'running', 'lease': {'$lt': now}}]},
+            {'$set': {'state': 'running', 'worker': worker, 'lease': now + lease, 'updated': now}, '$inc': {'attempts': 1}},
+            sort=[('created', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def renewEncodeJob(self, job_id, worker, lease, progress=None):
+        now = time()
+        res = await self.__jobs.update_one({'_id': job_id, 'worker': worker, 'state': 'running'}, {'$set': {'lease': now + lease, 'updated': now, 'progress': progress}})
+        return res.matched_count == 1
+
+    async def finishEncodeJob(self, job_id, worker, data):
+        res = await self.__jobs.update_one({'_id': job_id, 'worker': worker, 'state': 'running'}, {'$set': {**data, 'lease': 0, 'updated': time()}})
+        return res.matched_count == 1
+
+    async def delEncodeJob(self, job_id):
+        await self.__jobs.delete_one({'_id': job_id})
+
+    async def putJobFile(self, path, name, job_id):
+        grid_in = self.__grid.open_upload_stream(name, metadata={'job': job_id})
+        try:
+            async with aiopen(path, 'rb') as f:
+                while (chunk := await f.read(4 * 1024 * 1024)):
+                    await grid_in.write(chunk)
+        except BaseException:
+            await grid_in.abort()
+            raise
+        await grid_in.close()
+        return grid_in._id
+
+    async def getJobFile(self, file_id, path):
+        grid_out = await self.__grid.open_download_stream(file_id)
+        async with aiopen(path, 'wb') as f:
+            while (chunk := await grid_out.readchunk()):
+                await f.write(chunk)
+
+    async def delJobFile(self, file_id):
+        await self.__grid.delete(file_id)
+
+    async def getJobFiles(self, before):
+        return [grid_out async for grid_out in self.__grid.find({'uploadDate': {'$lt': datetime.fromtimestamp(before, timezone.utc)}})]
+
     async def reboot(self):
         await self.__animes.drop()
 
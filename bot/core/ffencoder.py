@@ -1,20 +1,24 @@
-from re import findall 
+from re import findall, search, sub, escape
 from math import floor
 from time import time
-from os import path as ospath
+from os import path as ospath, makedirs
 from aiofiles import open as aiopen
 from aiofiles.os import remove as aioremove, rename as aiorename
 from shlex import split as ssplit
-from asyncio import sleep as asleep, gather, create_subprocess_shell, create_task
+from asyncio import sleep as asleep, gather, create_subprocess_shell, create_subprocess_exec, create_task
 from asyncio.subprocess import PIPE
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from moviepy.editor import VideoFileClip
-from PIL import Image
 
 
-from bot import Var, bot_loop, ffpids_cache, LOGS
-from .func_utils import convertBytes, convertTime, sendMessage, editMessage
+from bot import Var, bot, bot_loop, LOGS, TUNING
+from .func_utils import convertBytes, convertTime, sendMessage, editMessage, sync_to_async
 from .reporter import rep
+from .metrics import ffmpeg_fps, ffmpeg_speed, time_stage
+from .mediapool import media_pool, video_info
+from .fileserver import OUTPUT_DIR, hls_url
+from .jobs import jobs
+from .throughput import throughput
+from .bandwidth import bandwidth
 
 ffargs = {
     '1080': Var.FFCODE_1080,
@@ -24,29 +28,90 @@ ffargs = {
     '361': Var.FFCODE_361,
 }
 
+def set_option(ffcode, opt, value):
+    """Sets an option in an ffargs template, added in front of the output when the template lacks it."""
+    if search(rf"(?<!\S){escape(opt)} ", ffcode):
+        return sub(rf"(?<!\S){escape(opt)} \S+", f"{opt} {value}", ffcode, count=1)
+    head, sep, tail = ffcode.rpartition(" '{}'")
+    return f"{head} {opt} {value}{sep}{tail}"
+
+# Presets and threads bench.calibrate found best on this host within the quality band
+for qual, tuned in TUNING.get('profiles', {}).items():
+    if qual in ffargs:
+        for opt, value in tuned['args'].items():
+            ffargs[qual] = set_option(ffargs[qual], opt, value)
+
+# Bitrate ladder for the HLS profile, renditions are only built for QUALS listed here
+hls_ladder = {
+    '1080': "4500k",
+    '720': "2500k",
+    '480': "1200k",
+    '360': "700k",
+}
+
+def hls_args(outdir, quals=None, height=None, audio=True):
+    """Extra outputs appended to an ffargs command, HLS/fMP4 renditions of QUALS up to the source height from the same decode."""
+    quals = [qual for qual in (quals or Var.QUALS) if qual in hls_ladder]
+    if height and quals:
+        # Never upscale, a source below every rung still gets the smallest one
+        quals = [qual for qual in quals if int(qual) <= height] or [min(quals, key=int)]
+    if not quals:
+        return ""
+    splits = "".join(f"[hv{no}]" for no in range(len(quals)))
+    scales = ";".join(f"[hv{no}]scale=-2:{qual}[hs{no}]" for no, qual in enumerate(quals))
+    args = f"-filter_complex '[0:v:0]split={len(quals)}{splits};{scales}'"
+    for no, qual in enumerate(quals):
+        rate = hls_ladder[qual]
+        args += f" -map '[hs{no}]' -c:v:{no} libx264 -b:v:{no} {rate} -maxrate:v:{no} {rate} -bufsize:v:{no} {int(rate[:-1]) * 2}k"
+    # Audio is encoded once as its own rendition and shared by every video variant, a silent source gets video only
+    if audio:
+        stream_map = " ".join(["a:0,agroup:aud,name:audio,default:yes"] + [f"v:{no},agroup:aud,name:{qual}p" for no, qual in enumerate(quals)])
+        args += " -map 0:a:0? -c:a aac -b:a 128k -ac 2"
+    else:
+        stream_map = " ".join(f"v:{no},name:{qual}p" for no, qual in enumerate(quals))
+    args += (
+        f" -preset veryfast -pix_fmt yuv420p -g 48 -keyint_min 48 -sc_threshold 0"
+        f" -f hls -hls_time 6 -hls_playlist_type event -hls_segment_type fmp4 -hls_flags independent_segments"
+        f" -hls_fmp4_init_filename init.mp4 -hls_segment_filename '{outdir}/%v/seg_%05d.m4s'"
+        f" -master_pl_name master.m3u8 -var_stream_map '{stream_map}' '{outdir}/%v/index.m3u8'"
+    )
+    return args
+
+async def has_audio(path):
+    proc = await create_subprocess_exec("ffprobe", "-v", "error", "-select_streams", "a", "-show_entries", "stream=index", "-of", "csv=p=0", path, stdout=PIPE, stderr=PIPE)
+    out, _ = await proc.communicate()
+    return bool(out.strip())
+
 async def get_video_info(video_path):
     try:
         if not ospath.exists(video_path):
             raise FileNotFoundError(f"File not found: {video_path}")
-        clip = VideoFileClip(video_path)
-        duration = clip.duration  # Duration in seconds
-        clip.close()
+        duration, _, _ = await media_pool.run(video_info, video_path)
         return duration
     except Exception as e:
         LOGS.error(f"Error in get_video_info: {e}")
         return None
         
 class FFEncoder:
-    def __init__(self, message, path, name, encodeid, qual):
+    def __init__(self, message, path, name, encodeid, qual, source=None, pipeline=None):
         self.__proc = None
+        self.__source = source
+        self.__pipeline = pipeline
+        self.__feed_failed = False
         self.is_cancelled = False
+        self.status = None
+        self.error = None
+        self.hls_dir = None
+        self.hls_link = None
         self.message = message
         self.__name = name
         self.__qual = qual
         self.dl_path = path
         self.__total_time = None
+        self.__height = None
+        self.__predicted = None
         self.out_path = ospath.join("encode", name)
-        self.__prog_file = 'prog.txt'
+        self.__prog_file = ospath.join("encode", f"prog_{encodeid}.txt")
         self.__start_time = time()
         self.__encodeid = encodeid
 
@@ -55,18 +120,24 @@ class FFEncoder:
         #LOGS.info(f"Video duration: {self.__total_time} seconds")
         if isinstance(self.__total_time, str):
             self.__total_time = 1.0
-        while not (self.__proc is None or self.is_cancelled):
+        # A killed or failed ffmpeg never writes progress=end, its exit code ends the loop instead
+        while not (self.__proc is None or self.__proc.returncode is not None or self.is_cancelled):
             async with aiopen(self.__prog_file, 'r+') as p:
                 text = await p.read()
-            if text:
+            # With a learned estimate there is something to show before ffmpeg's first progress block
+            if text or self.__predicted:
                 time_done = floor(int(t[-1]) / 1000000) if (t := findall("out_time_ms=(\d+)", text)) else 1
                 ensize = int(s[-1]) if (s := findall(r"total_size=(\d+)", text)) else 0
+                if (fps := findall(r"fps=(\d+\.?\d*)", text)):
+                    ffmpeg_fps.set(float(fps[-1]))
+                if (fspeed := findall(r"speed=\s*(\d+\.?\d*)x", text)):
+                    ffmpeg_speed.set(float(fspeed[-1]))
                 
                 diff = time() - self.__start_time
                 speed = ensize / diff
-                percent = round((time_done/self.__total_time)*100, 2)
+                percent = min(round((time_done/self.__total_time)*100, 2), 100) if text else 0
                 tsize = ensize / (max(percent, 0.01)/100)
-                eta = (tsize-ensize)/max(speed, 0.01)
+                eta = throughput.time_left(self.__predicted, diff, percent / 100)
     
                 bar = floor(percent/8)*"█" + (12 - floor(percent/8))*"▒"
                 
@@ -76,12 +147,15 @@ class FFEncoder:
 <blockquote>   ‣ <b>Size :</b> {convertBytes(ensize)} out of ~ {convertBytes(tsize)}
     ‣ <b>Speed :</b> {convertBytes(speed)}/s
     ‣ <b>Time Took :</b> {convertTime(diff)}
-    ‣ <b>Time Left :</b> {convertTime(eta)}</blockquote>"""
+    ‣ <b>Time Left :</b> {convertTime(eta) if eta is not None else 'Estimating...'}</blockquote>"""
                 cancel_markup = InlineKeyboardMarkup([
                     [InlineKeyboardButton("Cancel Encoding", callback_data=f"cancel_encoding:{self.__encodeid}")]
                 ])
-                await editMessage(self.message, progress_str)
-                #await editMessage(self.message, progress_str, buttons=cancel_markup)
+                if self.hls_link:
+                    progress_str += f"\n<blockquote>‣ <b>Watch While Encoding :</b> <a href='{self.hls_link}'>Stream</a></blockquote>"
+                self.status = progress_str
+                if self.message:
+                    await editMessage(self.message, progress_str, buttons=cancel_markup)
                 if (prog := findall(r"progress=(\w+)", text)) and prog[-1] == 'end':
                     break
             await asleep(8)
@@ -94,34 +168,102 @@ class FFEncoder:
             LOGS.info("Progress Temp Generated !")
             pass
             
-        self.__total_time = await get_video_info(self.dl_path)
+        if (job := jobs.get(self.__encodeid)) and job.duration:
+            # Probed when the job was queued
+            self.__total_time, self.__height = job.duration, job.height
+        elif self.__source is not None:
+            media = getattr(self.__source, self.__source.media.value)
+            self.__total_time = getattr(media, 'duration', None) or 1440
+            self.__height = getattr(media, 'height', None)
+        else:
+            with time_stage("probe"):
+                self.__total_time = await get_video_info(self.dl_path)
+        self.__predicted = throughput.predict_encode(self.__qual, self.__total_time, self.__height)
         LOGS.info(f"Video duration: {self.__total_time} seconds")
         
-        dl_npath, out_npath = ospath.join("encode", "ffanimeadvin.mkv"), ospath.join("encode", "ffanimeadvout.mkv")
-        await aiorename(self.dl_path, dl_npath)
+        # Per job names, ENCODE_SLOTS may run several encodes side by side
+        dl_npath, out_npath = ospath.join("encode", f"ffanimeadvin_{self.__encodeid}.mkv"), ospath.join("encode", f"ffanimeadvout_{self.__encodeid}.mkv")
+        if self.__source is not None:
+            dl_npath = "pipe:0"
+        else:
+            await aiorename(self.dl_path, dl_npath)
         
         ffcode = ffargs[self.__qual].format(dl_npath, self.__prog_file, out_npath)
+        if Var.HLS and Var.SERVE_FILES and Var.SERVE_PORT and self.message:
+            self.hls_dir = ospath.join(OUTPUT_DIR, str(self.__encodeid), "hls")
+            await sync_to_async(makedirs, self.hls_dir, exist_ok=True)
+            # Streamed input cannot be probed ahead, Telegram media nearly always carries audio
+            audio = True if self.__source is not None else await has_audio(dl_npath)
+            ffcode = f"{ffcode} {hls_args(self.hls_dir, height=self.__height, audio=audio)}"
+            self.hls_link = hls_url(self.__encodeid)
         
         LOGS.info(f'FFCode: {ffcode}')
-        self.__proc = await create_subprocess_shell(ffcode, stdout=PIPE, stderr=PIPE)
-        proc_pid = self.__proc.pid
-        ffpids_cache.append(proc_pid)
-        LOGS.info(f"Started encoding process with PID: {proc_pid}")
-        _, return_code = await gather(create_task(self.progress()), self.__proc.wait())
-        ffpids_cache.remove(proc_pid)
+        self.__proc = await create_subprocess_shell(ffcode, stdin=PIPE if self.__source is not None else None, stdout=PIPE, stderr=PIPE)
+        LOGS.info(f"Started encoding process with PID: {self.__proc.pid}, Predicted {convertTime(self.__predicted) if self.__predicted else 'Unknown'}")
+        # Elapsed time and the model both count from the ffmpeg launch, not from the probe
+        self.__start_time = time()
+        with time_stage("encode"):
+            progress = create_task(self.progress())
+            tasks = [self.__proc.wait()]
+            if self.__source is not None:
+                tasks.append(create_task(self.__feed()))
+            if self.__pipeline is not None:
+                tasks.append(create_task(self.__pipeline.follow(out_npath, lambda: self.__proc.returncode is None)))
+            try:
+                return_code, *_ = await gather(*tasks)
+            finally:
+                # Only the exit matters, a status edit still sleeping must not hold the slot
+                progress.cancel()
         
-        await aiorename(dl_npath, self.dl_path)
+        if self.__source is None:
+            await aiorename(dl_npath, self.dl_path)
         
         if self.is_cancelled:
             return
         
+        if self.__feed_failed:
+            # ffmpeg was killed mid stream, whatever it wrote is a truncated episode
+            if ospath.exists(out_npath):
+                await aioremove(out_npath)
+            return
+        
         if return_code == 0:
+            # Workers run their own process without the bot's model, only local encodes teach it
+            if self.message and isinstance(self.__total_time, (int, float)):
+                throughput.observe_encode(self.__qual, self.__total_time, self.__height, time() - self.__start_time)
             if ospath.exists(out_npath):
                 await aiorename(out_npath, self.out_path)
             return self.out_path
         else:
-            await rep.report((await self.__proc.stderr.read()).decode().strip(), "error")
+            self.error = (await self.__proc.stderr.read()).decode().strip()
+            await rep.report(self.error, "error")
             
+    async def __feed(self):
+        stdin = self.__proc.stdin
+        try:
+            async for chunk in bot.stream_media(self.__source):
+                if self.is_cancelled:
+                    break
+                await bandwidth.acquire("download", len(chunk))
+                stdin.write(chunk)
+                await stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            # Closing stdin would look like a clean EOF to ffmpeg, it has to die instead
+            self.__feed_failed = True
+            self.error = f"Streaming Input Failed : {e}"
+            try:
+                self.__proc.kill()
+            except Exception:
+                pass
+            await rep.report(self.error, "error")
+        finally:
+            try:
+                stdin.close()
+            except Exception:
+                pass
+
     async def cancel_encode(self):
         self.is_cancelled = True
         if self.__proc is not None:
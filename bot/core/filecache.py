@@ -0,0 +1,62 @@
+from collections import OrderedDict
+from traceback import format_exc
+
+from bot import Var, LOGS
+from .database import db
+
+class FileStoreCache:
+    def __init__(self, max_size, persist=True):
+        self.__cache = OrderedDict()
+        self.__max_size = max_size
+        self.__persist = persist
+
+    @staticmethod
+    def extract(msg):
+        if not msg or msg.empty or not msg.media or not (media := getattr(msg, msg.media.value, None)):
+            return None
+        return {
+            'file_id': media.file_id,
+            'type': msg.media.value,
+            'caption': msg.caption.html if msg.caption else None
+        }
+
+    def __remember(self, msg_id, entry):
+        self.__cache[msg_id] = entry
+        self.__cache.move_to_end(msg_id)
+        while len(self.__cache) > self.__max_size:
+            self.__cache.popitem(last=False)
+
+    async def get(self, msg_id):
+        if (entry := self.__cache.get(msg_id)):
+            self.__cache.move_to_end(msg_id)
+            return entry
+        if self.__persist:
+            try:
+                if (entry := await db.getFileCache(msg_id)):
+                    entry.pop('_id', None)
+                    self.__remember(msg_id, entry)
+                    return entry
+            except Exception:
+                LOGS.error(format_exc())
+        return None
+
+    async def put(self, msg):
+        if not (entry := self.extract(msg)):
+            return None
+        self.__remember(msg.id, entry)
+        if self.__persist:
+            try:
+                await db.saveFileCache(msg.id, entry)
+            except Exception:
+                LOGS.error(format_exc())
+        return entry
+
+    async def drop(self, msg_id):
+        self.__cache.pop(msg_id, None)
+        if self.__persist:
+            try:
+                await db.delFileCache(msg_id)
+            except Exception:
+                LOGS.error(format_exc())
+
+file_cache = FileStoreCache(Var.FILE_CACHE_SIZE, Var.FILE_CACHE_DB)
@@ -0,0 +1,162 @@
+from os import path as ospath, makedirs
+from time import time
+from hmac import new as hmac_new, compare_digest
+from hashlib import sha256
+from base64 import urlsafe_b64encode
+from urllib.parse import quote
+from aiohttp import web
+from aioshutil import move as aiomove
+
+from bot import Var, LOGS
+from .func_utils import sync_to_async
+from .metrics import Counter, Gauge
+
+OUTPUT_DIR = "outputs"
+TUNNEL_FILE = "/root/cfdl"
+
+served_bytes = Counter("fileserver_bytes_total", "Bytes sent by the output file server")
+served_requests = Counter("fileserver_requests_total", "Requests to the output file server by response status", labels=("status",))
+
+def sign(job_id, name, expires):
+    secret = (Var.SERVE_SECRET or Var.BOT_TOKEN).encode()
+    digest = hmac_new(secret, f"{job_id}/{name}:{expires}".encode(), sha256).digest()
+    return urlsafe_b64encode(digest[:18]).decode().rstrip("=")
+
+def base_url():
+    if Var.SERVE_URL:
+        return Var.SERVE_URL.rstrip("/")
+    # run.sh saves the Cloudflare tunnel URL here
+    if ospath.exists(TUNNEL_FILE):
+        with open(TUNNEL_FILE) as f:
+            return f.read().strip().rstrip("/")
+    return f"http://{Var.SERVE_HOST}:{Var.SERVE_PORT}"
+
+def signed_url(job_id, name, ttl=None):
+    expires = int(time() + (ttl or Var.SERVE_TTL * 3600))
+    return f"{base_url()}/dl/{job_id}/{quote(name)}?exp={expires}&sig={sign(job_id, name, expires)}"
+
+def hls_url(job_id, ttl=None, player=True):
+    # The signature sits in the path, so relative segment URIs in the playlists inherit it
+    expires = int(time() + (ttl or Var.SERVE_TTL * 3600))
+    url = f"{base_url()}/hls/{job_id}/{expires}/{sign(job_id, 'hls', expires)}"
+    return f"{url}/" if player else f"{url}/master.m3u8"
+
+async def publish_output(job_id, path):
+    """Moves a finished output under outputs/<job_id>/ and returns its signed link."""
+    name = ospath.basename(path)
+    await sync_to_async(makedirs, ospath.join(OUTPUT_DIR, str(job_id)), exist_ok=True)
+    await aiomove(path, ospath.join(OUTPUT_DIR, str(job_id), name))
+    return signed_url(job_id, name)
+
+class RateLimiter:
+    def __init__(self, rate, burst, max_conns):
+        self.__rate = rate / 60
+        self.__burst = burst
+        self.__max_conns = max_conns
+        self.__buckets = {}
+        self.__conns = {}
+
+    def acquire(self, ip):
+        now = time()
+        tokens, last = self.__buckets.get(ip, (self.__burst, now))
+        tokens = min(self.__burst, tokens + (now - last) * self.__rate)
+        if tokens < 1 or self.__conns.get(ip, 0) >= self.__max_conns:
+            self.__buckets[ip] = (tokens, now)
+            return False
+        self.__buckets[ip] = (tokens - 1, now)
+        self.__conns[ip] = self.__conns.get(ip, 0) + 1
+        if len(self.__buckets) > 10000:
+            self.__buckets = {k: v for k, v in self.__buckets.items() if now - v[1] < 600}
+        return True
+
+    @property
+    def active(self):
+        return sum(self.__conns.values())
+
+    def release(self, ip):
+        if (conns := self.__conns.get(ip, 0) - 1) > 0:
+            self.__conns[ip] = conns
+        else:
+            self.__conns.pop(ip, None)
+
+limiter = RateLimiter(Var.SERVE_RATE, max(Var.SERVE_RATE // 4, 1), Var.SERVE_CONNS)
+served_active = Gauge("fileserver_active", "Downloads currently being served", func=lambda: limiter.active)
+
+def client_ip(request):
+    # Behind the Cloudflare tunnel every request arrives from localhost
+    if Var.SERVE_PROXY and (ip := request.headers.get("CF-Connecting-IP") or request.headers.get("X-Forwarded-For", "").split(",")[0].strip()):
+        return ip
+    return request.remote
+
+@web.middleware
+async def rate_limit(request, handler):
+    ip = client_ip(request)
+    if not limiter.acquire(ip):
+        served_requests.inc(status=429)
+        return web.Response(status=429, text="Too Many Requests", headers={'Retry-After': "30"})
+    try:
+        resp = await handler(request)
+        # Sending happens in prepare, so the connection slot is held until the body is out
+        await resp.prepare(request)
+        served_requests.inc(status=resp.status)
+        served_bytes.inc(resp.content_length or 0)
+        return resp
+    except web.HTTPException as e:
+        served_requests.inc(status=e.status)
+        raise
+    finally:
+        limiter.release(ip)
+
+async def download_handler(request):
+    job_id, name = request.match_info['job_id'], request.match_info['name']
+    try:
+        expires = int(request.query.get('exp', "0"))
+    except ValueError:
+        expires = 0
+    if expires < time() or not compare_digest(request.query.get('sig', ""), sign(job_id, name, expires)):
+        raise web.HTTPForbidden(text="Link Expired or Invalid")
+    root = ospath.realpath(OUTPUT_DIR)
+    path = ospath.realpath(ospath.join(root, job_id, name))
+    if not path.startswith(root + ospath.sep) or not ospath.isfile(path):
+        raise web.HTTPNotFound()
+    # FileResponse answers Range requests and hands the body to sendfile when the transport allows it
+    return web.FileResponse(path, chunk_size=256 * 1024, headers={'Content-Disposition': f"attachment; filename*=UTF-8''{quote(name)}"})
+
+HLS_TYPES = {'.m3u8': "application/vnd.apple.mpegurl", '.m4s': "video/iso.segment", '.mp4': "video/mp4"}
+HLS_PLAYER = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1"><title>{title}</title>
+<script src="https://cdn.jsdelivr.net/npm/hls.js@1"></script></head>
+<body style="margin:0;background:#000"><video id="v" controls autoplay playsinline style="width:100vw;height:100vh"></video>
+<script>var v=document.getElementById("v"),src="master.m3u8";
+if(v.canPlayType("application/vnd.apple.mpegurl")){{v.src=src}}else if(Hls.isSupported()){{var h=new Hls();h.loadSource(src);h.attachMedia(v)}}</script>
+</body></html>"""
+
+async def hls_handler(request):
+    job_id, expires, path = request.match_info['job_id'], request.match_info['exp'], request.match_info['path']
+    if not expires.isdigit() or int(expires) < time() or not compare_digest(request.match_info['sig'], sign(job_id, "hls", int(expires))):
+        raise web.HTTPForbidden(text="Link Expired or Invalid")
+    headers = {'Access-Control-Allow-Origin': "*"}
+    if not path:
+        return web.Response(text=HLS_PLAYER.format(title=f"Job {job_id}"), content_type="text/html", headers=headers)
+    root = ospath.realpath(ospath.join(OUTPUT_DIR, job_id, "hls"))
+    fpath = ospath.realpath(ospath.join(root, path))
+    if not fpath.startswith(root + ospath.sep) or not ospath.isfile(fpath):
+        raise web.HTTPNotFound()
+    if (ctype := HLS_TYPES.get(ospath.splitext(fpath)[1])):
+        headers['Content-Type'] = ctype
+    # Playlists keep growing while the encode runs, segments never change once written
+    headers['Cache-Control'] = "no-cache" if fpath.endswith(".m3u8") else "max-age=86400"
+    return web.FileResponse(fpath, chunk_size=256 * 1024, headers=headers)
+
+async def start_file_server():
+    if not (Var.SERVE_FILES and Var.SERVE_PORT):
+        return None
+    makedirs(OUTPUT_DIR, exist_ok=True)
+    app = web.Application(middlewares=[rate_limit])
+    app.router.add_get("/dl/{job_id}/{name}", download_handler)
+    app.router.add_get("/hls/{job_id}/{exp}/{sig}/{path:.*}", hls_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, Var.SERVE_HOST, Var.SERVE_PORT).start()
+    LOGS.info(f"File Server Started on http://{Var.SERVE_HOST}:{Var.SERVE_PORT}, Public at {base_url()}")
+    return runner
@@ -4,24 +4,27 @@ from functools import partial, wraps
 from json import loads as jloads
 from re import findall
 from math import floor
-from os import path as ospath
+from os import path as ospath, SEEK_END
+from io import BytesIO
+from glob import glob
+from tarfile import open as taropen
 from time import time, sleep
 from traceback import format_exc
-from asyncio import sleep as asleep, create_subprocess_shell
-from asyncio.subprocess import PIPE
+from asyncio import sleep as asleep, gather
 from base64 import urlsafe_b64encode, urlsafe_b64decode
 
 from aiohttp import ClientSession
 from aiofiles import open as aiopen
+from aiofiles.os import remove as aioremove
 from aioshutil import rmtree as aiormtree
-from html_telegraph_poster import TelegraphPoster
 from feedparser import parse as feedparse
 from pyrogram.enums import ChatMemberStatus
 from pyrogram.types import InlineKeyboardButton
 from pyrogram.errors import MessageNotModified, FloodWait, UserNotParticipant, ReplyMarkupInvalid, MessageIdInvalid
 
-from bot import bot, bot_loop, LOGS, Var
+from bot import bot, bot_loop, LOGS, Var, LOG_FILE
 from .reporter import rep
+from .metrics import observe_floodwait
 
 def handle_logs(func):
     @wraps(func)
@@ -37,6 +40,30 @@ async def sync_to_async(func, *args, wait=True, **kwargs):
     future = bot_loop.run_in_executor(ThreadPoolExecutor(max_workers=cpu_count() * 125), pfunc)
     return await future if wait else future
     
+async def retry_call(func, *args, attempts=None, backoff=None, **kwargs):
+    attempts, backoff = attempts or Var.RETRY_ATTEMPTS, backoff or Var.RETRY_BACKOFF
+    attempt = 1
+    while True:
+        try:
+            return await func(*args, **kwargs)
+        except FloodWait as f:
+            observe_floodwait("retry", f.value)
+            await asleep(f.value * 1.2)
+        except Exception as e:
+            if attempt >= attempts:
+                raise e
+            await rep.report(f"{getattr(func, '__name__', func)} Failed ( Attempt {attempt}/{attempts} ) : {e}", "warning", log=False)
+            await asleep(backoff * 2 ** (attempt - 1))
+            attempt += 1
+
+http_session = None
+
+def get_session():
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = ClientSession()
+    return http_session
+
 def new_task(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
@@ -55,9 +82,8 @@ async def getfeed(link, index=0):
 
 @handle_logs
 async def aio_urldownload(link):
-    async with ClientSession() as sess:
-        async with sess.get(link) as data:
-            image = await data.read()
+    async with get_session().get(link) as data:
+        image = await data.read()
     path = f"thumbs/{link.split('/')[-1]}"
     if not path.endswith((".jpg" or ".png")):
         path += ".jpg"
@@ -67,19 +93,8 @@ async def aio_urldownload(link):
 
 @handle_logs
 async def get_telegraph(out):
-    client = TelegraphPoster(use_api=True)
-    client.create_api_token("Mediainfo")
-    uname = Var.BRAND_UNAME.lstrip('@')
-    page = client.post(
-        title="Mediainfo",
-        author=uname,
-        author_url=f"https://t.me/{uname}",
-        text=f"""<pre>
-{out}
-</pre>
-""",
-        )
-    return page.get("url")
+    from .mediareport import media_report
+    return await media_report.post(out)
     
 async def sendMessage(chat, text, buttons=None, get_error=False, **kwargs):
     try:
@@ -90,6 +105,7 @@ async def sendMessage(chat, text, buttons=None, get_error=False, **kwargs):
             return await chat.reply(text=text, quote=True, disable_web_page_preview=True, disable_notification=False,
                                     reply_markup=buttons, **kwargs)
     except FloodWait as f:
+        observe_floodwait("send", f.value)
         await rep.report(f, "warning")
         sleep(f.value * 1.2)
         return await sendMessage(chat, text, buttons, get_error, **kwargs)
@@ -108,6 +124,7 @@ async def editMessage(msg, text, buttons=None, get_error=False, **kwargs):
         return await msg.edit_text(text=text, disable_web_page_preview=True, 
                                         reply_markup=buttons, **kwargs)
     except FloodWait as f:
+        observe_floodwait("edit", f.value)
         await rep.report(f, "warning")
         sleep(f.value * 1.2)
         return await editMessage(msg, text, buttons, get_error, **kwargs)
@@ -127,61 +144,126 @@ async def encode(string):
 async def decode(b64_str):
     return urlsafe_b64decode((b64_str.strip("=") + "=" * (-len(b64_str.strip("=")) % 4)).encode("ascii")).decode("ascii")
 
+fsub_cache = {}
+fsub_chats_cache = {}
+
+async def check_member(chat_id, uid):
+    if (cached := fsub_cache.get((chat_id, uid))) and cached[1] > time():
+        return cached[0]
+    try:
+        member = await bot.get_chat_member(chat_id=chat_id, user_id=uid)
+        status = member.status not in (ChatMemberStatus.LEFT, ChatMemberStatus.BANNED)
+    except UserNotParticipant:
+        status = False
+    except Exception:
+        await rep.report(format_exc(), "warning")
+        return None
+    if len(fsub_cache) > 50000:
+        for key in [k for k, (_, exp) in fsub_cache.items() if exp <= time()]:
+            fsub_cache.pop(key, None)
+    fsub_cache[(chat_id, uid)] = (status, time() + (Var.FSUB_TTL if status else 10))
+    return status
+
+def invalidate_fsub(chat_id, uid):
+    fsub_cache.pop((chat_id, uid), None)
+
+async def get_fsub_chat(chat_id):
+    if (cached := fsub_chats_cache.get(chat_id)):
+        return cached
+    cha = await bot.get_chat(chat_id)
+    link = cha.invite_link or (await bot.create_chat_invite_link(chat_id=chat_id)).invite_link
+    fsub_chats_cache[chat_id] = (cha.title, link)
+    return cha.title, link
+
+async def get_file_link(start_id, end_id=None):
+    code = f"get-{start_id * abs(Var.FILE_STORE)}" + (f"-{end_id * abs(Var.FILE_STORE)}" if end_id else "")
+    return f"https://t.me/{(bot.me or await bot.get_me()).username}?start={await encode(code)}"
+
 async def is_fsubbed(uid):
     if len(Var.FSUB_CHATS) == 0:
         return True
-    for chat_id in Var.FSUB_CHATS:
-        try:
-            member = await bot.get_chat_member(chat_id=chat_id, user_id=uid)
-        except UserNotParticipant:
-            return False
-        except Exception as err:
-            await rep.report(format_exc(), "warning")
-            continue
-    return True
-        
+    return all(status is not False for status in await gather(*(check_member(chat_id, uid) for chat_id in Var.FSUB_CHATS)))
+
+async def fsub_status(chat_id, uid):
+    try:
+        return await gather(get_fsub_chat(chat_id), check_member(chat_id, uid))
+    except Exception:
+        await rep.report(format_exc(), "warning")
+        return None
+
 async def get_fsubs(uid, txtargs):
     txt = "<b><i>Please Join Following Channels to Use this Bot!</i></b>\n\n"
     btns = []
-    for no, chat in enumerate(Var.FSUB_CHATS, start=1):
-        try:
-            cha = await bot.get_chat(chat)
-            member = await bot.get_chat_member(chat_id=chat, user_id=uid)
-            sta = "Joined ✅️"
-        except UserNotParticipant:
-            sta = "Not Joined ❌️"
-            inv = await bot.create_chat_invite_link(chat_id=chat)
-            btns.append([InlineKeyboardButton(cha.title, url=inv.invite_link)])
-        except Exception as err:
-            await rep.report(format_exc(), "warning")
+    results = await gather(*(fsub_status(chat, uid) for chat in Var.FSUB_CHATS))
+    for no, res in enumerate(results, start=1):
+        if res is None:
             continue
-        txt += f"<b>{no}. Title :</b> <i>{cha.title}</i>\n  <b>Status :</b> <i>{sta}</i>\n\n"
+        (title, link), status = res
+        if status is False:
+            sta = "Not Joined ❌️"
+            btns.append([InlineKeyboardButton(title, url=link)])
+        else:
+            sta = "Joined ✅️"
+        txt += f"<b>{no}. Title :</b> <i>{title}</i>\n  <b>Status :</b> <i>{sta}</i>\n\n"
     if len(txtargs) > 1:
-        btns.append([InlineKeyboardButton('🗂 Get Files', url=f'https://t.me/{(await bot.get_me()).username}?start={txtargs[1]}')])
+        btns.append([InlineKeyboardButton('🗂 Get Files', url=f'https://t.me/{(bot.me or await bot.get_me()).username}?start={txtargs[1]}')])
     return txt, btns
 
 async def mediainfo(file, get_json=False, get_duration=False):
+    from .mediareport import media_report
     try:
-        outformat = "HTML"
-        if get_duration or get_json:
-            outformat = "JSON"
-        process = await create_subprocess_shell(f"mediainfo '''{file}''' --Output={outformat}", stdout=PIPE, stderr=PIPE)
-        stdout, _ = await process.communicate()
         if get_duration:
             try:
-                return float(jloads(stdout.decode())['media']['track'][0]['Duration'])
+                return float(jloads(await media_report.probe(file, "JSON"))['media']['track'][0]['Duration'])
             except Exception:
                 return 1440 # 24min
-        return await get_telegraph(stdout.decode())
+        if get_json:
+            return await media_report.probe(file, "JSON")
+        return await media_report.report(file)
     except Exception as err:
         await rep.report(format_exc(), "error")
         return ""
         
 async def clean_up():
+    # downloads/ is left for resumable parts and encode/ for outputs kept for retries, the storage GC expires both
     try:
-        (await aiormtree(dirtree) for dirtree in ("downloads", "thumbs", "encode"))
+        await aiormtree("thumbs")
     except Exception as e:
         LOGS.error(str(e))
+    for scratch in glob("encode/prog_*.txt") + glob("encode/ffanimeadv*_*"):
+        try:
+            await aioremove(scratch)
+        except Exception as e:
+            LOGS.error(str(e))
+
+def _tail_log(lines):
+    with open(LOG_FILE, 'rb') as f:
+        f.seek(0, SEEK_END)
+        pos, data = f.tell(), b""
+        while pos > 0 and data.count(b"\n") <= lines:
+            step = min(pos, 64 * 1024)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    return b"\n".join(data.splitlines()[-lines:])
+
+def _bundle_logs():
+    buf = BytesIO()
+    with taropen(fileobj=buf, mode="w:gz") as tar:
+        for lfile in sorted(glob(f"{LOG_FILE}*")):
+            tar.add(lfile)
+    buf.seek(0)
+    return buf
+
+async def get_log_tail(lines=500):
+    out = BytesIO(await sync_to_async(_tail_log, lines))
+    out.name = "log_tail.txt"
+    return out
+
+async def get_log_bundle():
+    out = await sync_to_async(_bundle_logs)
+    out.name = "logs.tar.gz"
+    return out
 
 def convertTime(s: int) -> str:
     m, s = divmod(int(s), 60)
@@ -0,0 +1,128 @@
+from os import path as ospath, makedirs
+from time import time
+from traceback import format_exc
+from asyncio import sleep as asleep, Semaphore
+from aiofiles.os import remove as aioremove
+from aioshutil import move as aiomove, copyfile as aiocopyfile, rmtree as aiormtree
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from bot import Var, LOGS
+from .database import db
+from .func_utils import editMessage, sync_to_async
+from .reporter import rep
+
+remote_slots = Semaphore(Var.REMOTE_SLOTS)
+
+def job_dir(job_id):
+    return ospath.join(Var.SHARED_DIR, "jobs", str(job_id))
+
+async def stage_file(job_id, path, kind):
+    name = ospath.basename(path)
+    if Var.SHARED_DIR:
+        dest = ospath.join(job_dir(job_id), kind, name)
+        await sync_to_async(makedirs, ospath.dirname(dest), exist_ok=True)
+        await aiomove(path, dest)
+        return {'path': dest, 'name': name}
+    return {'grid': await db.putJobFile(path, name, job_id), 'name': name}
+
+async def fetch_file(ref, dest, keep=False):
+    if 'path' in ref:
+        await (aiocopyfile if keep else aiomove)(ref['path'], dest)
+    else:
+        await db.getJobFile(ref['grid'], dest)
+    return dest
+
+async def drop_file(ref):
+    try:
+        if 'grid' in ref:
+            await db.delJobFile(ref['grid'])
+        elif ospath.exists(ref['path']):
+            await aioremove(ref['path'])
+    except Exception:
+        LOGS.error(format_exc())
+
+async def drop_job(job):
+    for ref in (job.get('input'), job.get('output')):
+        if ref and 'grid' in ref:
+            await drop_file(ref)
+    if Var.SHARED_DIR:
+        await aiormtree(job_dir(job['_id']), ignore_errors=True)
+    await db.delEncodeJob(job['_id'])
+
+async def reap_jobs():
+    """Drops jobs queued by an earlier run, no RemoteEncoder is left to collect them."""
+    for job in await db.getEncodeJobs():
+        LOGS.warning(f"Reaping Encode Job {job['_id']} ( {job['state'].title()} ) Left by the Last Run")
+        # A worker still encoding it loses its lease renewal and stops
+        await drop_job(job)
+
+async def job_gc_loop():
+    while True:
+        await asleep(3600)
+        try:
+            cutoff = time() - Var.JOB_TTL * 3600
+            for job in await db.getEncodeJobs({'state': {'$in': ['done', 'failed']}, 'updated': {'$lt': cutoff}}):
+                LOGS.warning(f"Encode Job {job['_id']} Uncollected for {Var.JOB_TTL}h, Deleting")
+                await drop_job(job)
+            # Uploads whose job never got inserted or was deleted around them
+            for grid_out in await db.getJobFiles(cutoff):
+                if not await db.getEncodeJob((grid_out.metadata or {}).get('job')):
+                    await drop_file({'grid': grid_out._id})
+        except Exception:
+            LOGS.error(format_exc())
+
+class RemoteEncoder:
+    def __init__(self, message, path, name, encodeid, qual):
+        self.is_cancelled = False
+        self.message = message
+        self.dl_path = path
+        self.out_path = ospath.join("encode", name)
+        self.__name = name
+        self.__qual = qual
+        self.__buttons = InlineKeyboardMarkup([[InlineKeyboardButton("Cancel Encoding", callback_data=f"cancel_encoding:{encodeid}")]])
+        self.job_id = f"{message.chat.id}_{encodeid}"
+
+    async def start_encode(self):
+        await editMessage(self.message, f"‣ <b>File Name :</b> <b><i>{self.__name}</i></b>\n\n<i>Handing Over to Encode Workers...</i>")
+        now = time()
+        job = {
+            '_id': self.job_id,
+            'name': self.__name,
+            'qual': self.__qual,
+            'state': 'queued',
+            'input': await stage_file(self.job_id, self.dl_path, "input"),
+            'attempts': 0,
+            'created': now,
+            'updated': now
+        }
+        await db.addEncodeJob(job)
+        LOGS.info(f"Encode Job {self.job_id} Queued for Workers")
+        last = None
+        while True:
+            await asleep(8)
+            if self.is_cancelled:
+                await drop_job(job)
+                return
+            if not (job := await db.getEncodeJob(self.job_id)):
+                await rep.report(f"Encode Job {self.job_id} Vanished from the Queue", "error")
+                return
+            if job['state'] == 'done':
+                await fetch_file(job['output'], self.out_path)
+                await drop_job(job)
+                return self.out_path
+            if job['state'] == 'failed':
+                await rep.report(f"Worker {job.get('worker')} : {job.get('error')}", "error")
+                await drop_job(job)
+                return
+            if job['state'] == 'queued' or not job.get('progress'):
+                text = f"‣ <b>File Name :</b> <b><i>{self.__name}</i></b>\n\n<i>{'Waiting for a Free Worker' if job['state'] == 'queued' else 'Worker Preparing'}...</i>"
+            else:
+                text = job['progress']
+            if job.get('worker'):
+                text += f"\n<blockquote>‣ <b>Worker :</b> <code>{job['worker']}</code> ( Attempt {job['attempts']}/{Var.JOB_ATTEMPTS} )</blockquote>"
+            if text != last:
+                await editMessage(self.message, text, buttons=self.__buttons)
+                last = text
+
+    async def cancel_encode(self):
+        self.is_cancelled = True
@@ -0,0 +1,95 @@
+from time import time
+from asyncio import Event
+
+from bot import Var, LOGS, bot_loop, log_jobid, ENCODE_SLOTS
+from .traces import traces
+
+class Job:
+    """Everything known about one encode, from queueing to the final reply."""
+    __slots__ = ("id", "name", "profile", "remote", "stage", "src_path", "out_path", "size", "out_size", "duration", "width", "height",
+                 "created", "started", "finished", "wait", "peers", "stages", "floodwaits", "encoder", "message", "turn")
+
+    def __init__(self, job_id, name, src_path=None, message=None, profile="360", remote=False):
+        self.id = job_id
+        self.name = name
+        self.profile = profile
+        self.remote = remote
+        self.stage = "queued"
+        self.src_path = src_path
+        self.out_path = None
+        self.size = None
+        self.out_size = None
+        self.duration = None
+        self.width = None
+        self.height = None
+        self.created = time()
+        self.started = None
+        self.finished = None
+        self.wait = None
+        # Encodes running when this one started, including itself
+        self.peers = None
+        self.stages = {}
+        self.floodwaits = []
+        # FFEncoder or RemoteEncoder while encoding, owns the ffmpeg process or the worker lease
+        self.encoder = None
+        self.message = message
+        # Set by the queue loop when the job reaches the front
+        self.turn = Event()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time()) - (self.started or self.created)
+
+class JobRegistry:
+    def __init__(self, retention):
+        self.__jobs = {}
+        self.__retention = retention
+
+    def __len__(self):
+        return len(self.__jobs)
+
+    def add(self, job_id, name, src_path=None, message=None, profile="360", remote=False):
+        job = self.__jobs[job_id] = Job(job_id, name, src_path, message, profile, remote)
+        return job
+
+    def get(self, job_id):
+        return self.__jobs.get(job_id)
+
+    def active(self):
+        return [job for job in self.__jobs.values() if job.finished is None]
+
+    def set_stage(self, job_id, stage):
+        if (job := self.__jobs.get(job_id)):
+            job.stage = stage
+            if stage == "encoding" and job.started is None:
+                job.started = time()
+                job.peers = sum(1 for other in self.__jobs.values() if other.stage == "encoding")
+        return job
+
+    def record_stage(self, stage, taken):
+        # Stages are timed inside the job's task, so the log context names the job
+        if (job := self.__jobs.get(log_jobid.get())) and job.finished is None:
+            job.stages[stage] = job.stages.get(stage, 0) + taken
+
+    def record_floodwait(self, source, seconds):
+        if (job := self.__jobs.get(log_jobid.get())) and job.finished is None:
+            job.floodwaits.append((source, seconds))
+
+    def finish(self, job_id, stage="done"):
+        """Marks a job finished and drops its handles, the record itself is evicted after the retention window."""
+        if not (job := self.__jobs.get(job_id)) or job.finished is not None:
+            return job
+        job.stage, job.finished = stage, time()
+        job.encoder = job.message = None
+        LOGS.info(f"Job {job_id} {stage.title()} in {job.elapsed:.1f}s")
+        if stage != "removed":
+            bot_loop.create_task(traces.record(job, ENCODE_SLOTS))
+        bot_loop.call_later(self.__retention, self.__evict, job_id, job)
+        return job
+
+    def __evict(self, job_id, job):
+        # The id may have been reused by a newer job in the meantime
+        if self.__jobs.get(job_id) is job:
+            del self.__jobs[job_id]
+
+jobs = JobRegistry(Var.JOB_RETENTION)
@@ -0,0 +1,91 @@
+from io import BytesIO
+from time import perf_counter
+from asyncio import Semaphore, wrap_future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from bot import Var, LOGS
+from .metrics import Histogram, Gauge
+
+pool_seconds = Histogram("pool_task_seconds", "Wall time of media tasks run in the process pool", labels=("task",), buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+pool_wait = Histogram("pool_wait_seconds", "Time media tasks waited for a free pool worker", labels=("task",), buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60))
+pool_busy = Gauge("pool_busy", "Media tasks currently running in the process pool")
+
+# Everything below runs in the pool processes, arguments and results stay small ( paths, bytes, numbers )
+
+def to_jpeg(img, quality=85, max_bytes=None):
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    while True:
+        buf = BytesIO()
+        img.save(buf, "JPEG", quality=quality, optimize=True)
+        if not max_bytes or buf.tell() <= max_bytes or quality <= 30:
+            return buf.getvalue()
+        quality -= 10
+
+def video_info(video):
+    from moviepy.editor import VideoFileClip
+    with VideoFileClip(video, audio=False) as clip:
+        return clip.duration, *clip.size
+
+def video_thumbnail(video, max_side=320, quality=85, max_bytes=200 * 1024):
+    from moviepy.editor import VideoFileClip
+    from PIL import Image
+    with VideoFileClip(video, audio=False) as clip:
+        duration, (width, height) = clip.duration, clip.size
+        img = Image.fromarray(clip.get_frame(duration / 2))
+    img.thumbnail((max_side, max_side))
+    return duration, width, height, to_jpeg(img, quality, max_bytes)
+
+def timed(func, *args, **kwargs):
+    start = perf_counter()
+    result = func(*args, **kwargs)
+    return result, perf_counter() - start
+
+class MediaPool:
+    def __init__(self, workers):
+        self.__workers = max(workers, 1)
+        self.__limit = Semaphore(self.__workers)
+        self.__executor = None
+        self.__busy = 0
+
+    def __get_executor(self):
+        if self.__executor is None:
+            # fork, a spawned worker would re-import the bot package and its client
+            self.__executor = ProcessPoolExecutor(max_workers=self.__workers, mp_context=get_context("fork"))
+        return self.__executor
+
+    def start(self):
+        """Forks every worker now, before the client, executors and watchdog start threads a child could inherit a held lock from."""
+        # A fork pool launches all its workers on the first submit, the log listener's handler locks are reset in the child
+        self.__get_executor().submit(int).result()
+
+    async def run(self, func, *args, **kwargs):
+        queued = perf_counter()
+        async with self.__limit:
+            started = perf_counter()
+            pool_wait.observe(started - queued, task=func.__name__)
+            self.__busy += 1
+            pool_busy.set(self.__busy)
+            try:
+                try:
+                    result, taken = await wrap_future(self.__get_executor().submit(timed, func, *args, **kwargs))
+                except BrokenProcessPool:
+                    # A worker died ( OOM, segfault in a codec ), the pool refuses all work until it is replaced
+                    LOGS.warning(f"Media Pool Broken during {func.__name__}, Replacing it")
+                    self.shutdown()
+                    result, taken = await wrap_future(self.__get_executor().submit(timed, func, *args, **kwargs))
+            finally:
+                self.__busy -= 1
+                pool_busy.set(self.__busy)
+        pool_seconds.observe(taken, task=func.__name__)
+        LOGS.info(f"Media Pool : {func.__name__} took {taken:.2f}s ( Waited {started - queued:.2f}s )")
+        return result
+
+    def shutdown(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+            self.__executor = None
+
+media_pool = MediaPool(Var.MEDIA_POOL)
@@ -0,0 +1,96 @@
+from os import path as ospath
+from hashlib import sha1
+from json import dumps as jdumps
+from traceback import format_exc
+from asyncio import Lock, create_subprocess_exec
+from asyncio.subprocess import PIPE
+
+from bot import Var, LOGS
+from .database import db
+from .func_utils import get_session, sync_to_async
+
+TELEGRAPH_API = "https://api.telegra.ph"
+PAGE_LIMIT = 60 * 1024
+HASH_SPAN = 4 * 1024 * 1024
+
+def file_digest(path):
+    size = ospath.getsize(path)
+    digest = sha1(str(size).encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(HASH_SPAN))
+        if size > HASH_SPAN:
+            f.seek(max(size - HASH_SPAN, HASH_SPAN))
+            digest.update(f.read(HASH_SPAN))
+    return digest.hexdigest()
+
+class MediaReport:
+    def __init__(self):
+        self.__token = None
+        self.__token_lock = Lock()
+        self.__urls = {}
+
+    @staticmethod
+    async def probe(path, fmt="HTML"):
+        proc = await create_subprocess_exec("mediainfo", path, f"--Output={fmt}", stdout=PIPE, stderr=PIPE)
+        stdout, stderr = await proc.communicate()
+        if proc.returncode != 0:
+            raise Exception(f"mediainfo Exited with {proc.returncode} : {stderr.decode().strip()}")
+        return stdout.decode()
+
+    async def __call(self, method, **data):
+        async with get_session().post(f"{TELEGRAPH_API}/{method}", data=data) as resp:
+            res = await resp.json(content_type=None)
+        if not res.get('ok'):
+            raise Exception(f"Telegraph {method} Failed : {res.get('error')}")
+        return res['result']
+
+    async def __get_token(self):
+        async with self.__token_lock:
+            if self.__token:
+                return self.__token
+            saved = None
+            try:
+                saved = await db.getMediaReport("telegraph_token")
+            except Exception:
+                LOGS.error(format_exc())
+            if saved and saved.get('token'):
+                self.__token = saved['token']
+            else:
+                uname = Var.BRAND_UNAME.lstrip('@')
+                self.__token = (await self.__call("createAccount", short_name="Mediainfo", author_name=uname, author_url=f"https://t.me/{uname}"))['access_token']
+                await db.saveMediaReport("telegraph_token", {'token': self.__token})
+            return self.__token
+
+    async def post(self, text, title="Mediainfo"):
+        if len(text.encode()) > PAGE_LIMIT:
+            text = text.encode()[:PAGE_LIMIT].decode(errors='ignore') + "\n..."
+        uname = Var.BRAND_UNAME.lstrip('@')
+        page = {
+            'title': title,
+            'author_name': uname,
+            'author_url': f"https://t.me/{uname}",
+            'content': jdumps([{'tag': "pre", 'children': [text]}]),
+        }
+        try:
+            res = await self.__call("createPage", access_token=await self.__get_token(), **page)
+        except Exception as e:
+            if "ACCESS_TOKEN_INVALID" not in str(e):
+                raise
+            self.__token = None
+            await db.saveMediaReport("telegraph_token", {'token': None})
+            res = await self.__call("createPage", access_token=await self.__get_token(), **page)
+        return res['url']
+
+    async def report(self, path):
+        key = await sync_to_async(file_digest, path)
+        if (url := self.__urls.get(key)):
+            return url
+        if (cached := await db.getMediaReport(key)) and cached.get('url'):
+            self.__urls[key] = cached['url']
+            return cached['url']
+        url = await self.post(await self.probe(path, "TEXT"))
+        self.__urls[key] = url
+        await db.saveMediaReport(key, {'url': url, 'name': ospath.basename(path)})
+        return url
+
+media_report = MediaReport()
@@ -0,0 +1,133 @@
+from time import perf_counter
+from contextlib import contextmanager
+
+from aiohttp import web
+from psutil import Process
+
+from bot import Var, LOGS, ffQueue
+from .jobs import jobs
+from .throughput import throughput
+
+DEFAULT_BUCKETS = (0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+
+class Metric:
+    def __init__(self, name, doc, mtype, labels=()):
+        self.name = f"autoanime_{name}"
+        self.doc = doc
+        self.mtype = mtype
+        self.labels = tuple(labels)
+        self._values = {}
+        registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _fmt(self, key, extra=None):
+        pairs = list(zip(self.labels, key)) + (list(extra.items()) if extra else [])
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+    def collect(self):
+        return [f"{self.name}{self._fmt(key)} {val}" for key, val in self._values.items()]
+
+    def render(self):
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.mtype}"] + self.collect()
+
+class Counter(Metric):
+    def __init__(self, name, doc, labels=()):
+        super().__init__(name, doc, "counter", labels)
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + value
+
+class Gauge(Metric):
+    def __init__(self, name, doc, labels=(), func=None):
+        super().__init__(name, doc, "gauge", labels)
+        self.__func = func
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def collect(self):
+        if self.__func is not None:
+            self._values[()] = self.__func()
+        return super().collect()
+
+class Histogram(Metric):
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, "histogram", labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        counts, total, obs = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self._values[key] = (counts, total + value, obs + 1)
+
+    def collect(self):
+        lines = []
+        for key, (counts, total, obs) in self._values.items():
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{self._fmt(key, {'le': bound})} {count}")
+            lines.append(f"{self.name}_bucket{self._fmt(key, {'le': '+Inf'})} {obs}")
+            lines.append(f"{self.name}_sum{self._fmt(key)} {round(total, 6)}")
+            lines.append(f"{self.name}_count{self._fmt(key)} {obs}")
+        return lines
+
+registry = []
+_proc = Process()
+
+queue_depth = Gauge("queue_depth", "Encode jobs waiting in the queue", func=lambda: ffQueue.qsize())
+queue_wait = Histogram("queue_wait_seconds", "Time a job waited in the encode queue")
+stage_seconds = Histogram("stage_seconds", "Duration of each pipeline stage", labels=("stage",))
+ffmpeg_fps = Gauge("ffmpeg_fps", "Frames per second reported by the running ffmpeg")
+ffmpeg_speed = Gauge("ffmpeg_speed", "Realtime speed factor reported by the running ffmpeg")
+transfer_rate = Gauge("transfer_bytes_per_second", "Average rate of the last Telegram transfer", labels=("direction",))
+transfer_bytes = Counter("transfer_bytes_total", "Bytes moved to or from Telegram", labels=("direction",))
+floodwaits = Counter("floodwait_total", "FloodWait errors raised by Telegram", labels=("source",))
+loop_lag = Gauge("event_loop_lag_seconds", "Delay between a scheduled and an actual event loop wakeup")
+proc_cpu = Gauge("process_cpu_percent", "CPU usage of the bot process", func=lambda: _proc.cpu_percent())
+proc_rss = Gauge("process_rss_bytes", "Resident memory of the bot process", func=lambda: _proc.memory_info().rss)
+
+@contextmanager
+def time_stage(stage):
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        taken = perf_counter() - start
+        stage_seconds.observe(taken, stage=stage)
+        jobs.record_stage(stage, taken)
+
+def observe_floodwait(source, seconds):
+    floodwaits.inc(source=source)
+    jobs.record_floodwait(source, seconds)
+
+def observe_transfer(direction, size, taken):
+    throughput.observe_transfer(direction, size, taken)
+    transfer_bytes.inc(size, direction=direction)
+    transfer_rate.set(round(size / max(taken, 0.001), 2), direction=direction)
+
+def render_metrics():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+async def metrics_handler(request):
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+async def start_metrics_server():
+    if not Var.METRICS_PORT:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, Var.METRICS_HOST, Var.METRICS_PORT).start()
+    LOGS.info(f"Metrics Server Started on http://{Var.METRICS_HOST}:{Var.METRICS_PORT}/metrics")
+    return runner
@@ -0,0 +1,126 @@
+from os import path as ospath
+from math import ceil
+from zlib import crc32
+from random import randint
+from traceback import format_exc
+from asyncio import sleep as asleep
+from aiofiles import open as aiopen
+
+from pyrogram import raw
+from pyrogram.session import Session
+from pyrogram.utils import parse_text_entities
+
+from bot import bot, LOGS
+from .func_utils import retry_call
+from .reporter import rep
+from .splitter import split_limit
+from .bandwidth import bandwidth
+
+PART_SIZE = 512 * 1024
+# Bytes kept back from the growing end, the muxer may still be flushing them
+SETTLE = 2 * 1024 * 1024
+
+class PipelinedUpload:
+    """Streams an encoder output to Telegram with upload.saveBigFilePart while ffmpeg is still writing it.
+
+    Parts are sent with file_total_parts=-1 as they settle. Once the encode ends every part is re-read, any the
+    muxer rewrote ( header, duration, seek index ) is sent again, and the last part declares the real count.
+    """
+    def __init__(self, client=bot):
+        self.__client = client
+        self.__file_id = randint(-2 ** 63, 2 ** 63 - 1)
+        self.__sums = {}
+        self.__session = None
+        self.aborted = False
+
+    async def __get_session(self):
+        if self.__session is None:
+            client = self.__client
+            self.__session = Session(client, await client.storage.dc_id(), await client.storage.auth_key(), await client.storage.test_mode(), is_media=True)
+            await self.__session.start()
+        return self.__session
+
+    @staticmethod
+    async def __read(path, index):
+        async with aiopen(path, 'rb') as f:
+            await f.seek(index * PART_SIZE)
+            return await f.read(PART_SIZE)
+
+    async def __send(self, index, data, total=-1):
+        session = await self.__get_session()
+        await bandwidth.acquire("upload", len(data))
+        await retry_call(session.invoke, raw.functions.upload.SaveBigFilePart(file_id=self.__file_id, file_part=index, file_total_parts=total, bytes=data))
+        self.__sums[index] = crc32(data)
+
+    async def follow(self, path, running):
+        index = 0
+        try:
+            while running():
+                size = ospath.getsize(path) if ospath.exists(path) else 0
+                if size > split_limit():
+                    # Will be split into parts after the encode, a single streamed file is no use
+                    self.aborted = True
+                    break
+                while (index + 1) * PART_SIZE + SETTLE <= size:
+                    await self.__send(index, await self.__read(path, index))
+                    index += 1
+                await asleep(2)
+        except Exception:
+            self.aborted = True
+            await rep.report(f"Pipelined Upload Stopped, Falling Back after Encode : {format_exc()}", "warning")
+        LOGS.info(f"Pipelined Upload : {index} Part(s) Sent during Encode")
+
+    async def __finish(self, path):
+        size = ospath.getsize(path)
+        total = ceil(size / PART_SIZE)
+        resent = 0
+        for index in range(total - 1):
+            data = await self.__read(path, index)
+            if self.__sums.get(index) != crc32(data):
+                await self.__send(index, data, total)
+                resent += index in self.__sums
+        await self.__send(total - 1, await self.__read(path, total - 1), total)
+        LOGS.info(f"Pipelined Upload : {total} Part(s), {resent} Rewritten by the Muxer and Sent Again")
+        return raw.types.InputFileBig(id=self.__file_id, parts=total, name=ospath.basename(path))
+
+    async def complete(self, path, chat_id, caption, thumb=None, duration=0, width=0, height=0):
+        """Sends the tail, then posts the video with its final metadata. Returns None if the caller should upload normally."""
+        # Big file parts are only accepted for files over 10 MB
+        if self.aborted or not 10 * 1024 * 1024 < ospath.getsize(path) <= split_limit():
+            await self.close()
+            return None
+        client = self.__client
+        try:
+            media = raw.types.InputMediaUploadedDocument(
+                file=await self.__finish(path),
+                mime_type="video/x-matroska",
+                thumb=await client.save_file(thumb) if thumb else None,
+                attributes=[
+                    raw.types.DocumentAttributeVideo(duration=int(duration or 0), w=width or 0, h=height or 0, supports_streaming=True),
+                    raw.types.DocumentAttributeFilename(file_name=ospath.basename(path))
+                ]
+            )
+            res = await retry_call(client.invoke, raw.functions.messages.SendMedia(
+                peer=await client.resolve_peer(chat_id),
+                media=media,
+                random_id=randint(-2 ** 63, 2 ** 63 - 1),
+                **await parse_text_entities(client, caption, None, None)
+            ))
+            msg_id = next((u.message.id for u in getattr(res, 'updates', []) if isinstance(u, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage))), None)
+            if msg_id is None:
+                msg_id = next(u.id for u in res.updates if isinstance(u, raw.types.UpdateMessageID))
+            return await client.get_messages(chat_id, msg_id)
+        except Exception:
+            await rep.report(f"Pipelined Upload Failed, Uploading Normally : {format_exc()}", "warning")
+            return None
+        finally:
+            await self.close()
+
+    async def close(self):
+        # Safe to call more than once, the session is detached before it is stopped
+        if (session := self.__session) is not None:
+            self.__session = None
+            try:
+                await session.stop()
+            except Exception:
+                pass
@@ -1,6 +1,7 @@
 from time import sleep
 from pyrogram.errors import FloodWait
 from bot import Var, LOGS, bot
+from .metrics import observe_floodwait
 
 class Reporter:
     def __init__(self, client, chat_id, log):
@@ -8,6 +9,9 @@ class Reporter:
         self.__cid = chat_id
         self.__logger = log
 
+    def set_chat(self, chat_id):
+        self.__cid = chat_id
+
     async def report(self, msg, log_type, log=True):
         txt = [f"[{log_type.upper()}] {msg}", log_type.lower()]
         if txt[1] == "error":
@@ -22,6 +26,7 @@ class Reporter:
             try:
                 await self.__client.send_message(self.__cid, f"{txt[0][:4096]}")
             except FloodWait as f:
+                observe_floodwait("report", f.value)
                 self.__logger.warning(str(f))
                 sleep(f.value * 1.5)
             except Exception as err:
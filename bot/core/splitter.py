@@ -0,0 +1,105 @@
+from os import path as ospath
+from math import ceil
+from glob import glob, escape
+from asyncio import gather, create_subprocess_exec
+from asyncio.subprocess import PIPE
+from aiofiles.os import remove as aioremove
+
+from pyrogram.types import InputMediaVideo, InputMediaDocument
+
+from bot import bot, Var, LOGS
+from .func_utils import retry_call
+from .mediapool import media_pool, video_info
+from .uploadpool import upload_pool
+from .filecache import file_cache
+
+def split_limit():
+    return Var.SPLIT_SIZE * 1024 * 1024
+
+def needs_split(path):
+    return ospath.getsize(path) > split_limit()
+
+def part_paths(path):
+    root, ext = ospath.splitext(path)
+    return sorted(glob(f"{escape(root)}.part[0-9][0-9]{escape(ext)}"))
+
+async def drop_parts(path):
+    for part in part_paths(path):
+        await aioremove(part)
+
+async def split_video(path, duration=None, limit=None):
+    limit = limit or split_limit()
+    size = ospath.getsize(path)
+    if not duration:
+        duration, _, _ = await media_pool.run(video_info, path)
+    root, ext = ospath.splitext(path)
+    count = ceil(size / (limit * 0.95))
+    for _ in range(3):
+        await drop_parts(path)
+        # Stream copy cuts at the first keyframe past each mark, so parts stay playable on their own
+        proc = await create_subprocess_exec(
+            "ffmpeg", "-v", "error", "-y", "-i", path, "-map", "0", "-c", "copy",
+            "-f", "segment", "-segment_time", f"{duration / count:.3f}", "-segment_start_number", "1",
+            "-reset_timestamps", "1", f"{root}.part%02d{ext}",
+            stdout=PIPE, stderr=PIPE
+        )
+        _, stderr = await proc.communicate()
+        if proc.returncode != 0:
+            await drop_parts(path)
+            raise Exception(f"Splitting Failed : {stderr.decode().strip()[-1000:]}")
+        parts = part_paths(path)
+        if all(ospath.getsize(part) <= limit for part in parts):
+            LOGS.info(f"Split {ospath.basename(path)} into {len(parts)} Parts")
+            return parts
+        # Sparse keyframes made a part overshoot, retry with shorter segments
+        count = len(parts) + 1
+    await drop_parts(path)
+    raise Exception(f"Could not Split {ospath.basename(path)} under {Var.SPLIT_SIZE} MB")
+
+async def upload_parts(parts, method, caption, progress=None, progress_args=(), **kwargs):
+    """Uploads parts concurrently through the upload pool and regroups them as one album in FILE_STORE."""
+    sizes, done = [ospath.getsize(part) for part in parts], [0] * len(parts)
+
+    async def on_progress(current, total, no):
+        done[no] = current
+        if progress:
+            await progress(sum(done), sum(sizes), *progress_args)
+
+    async def send(no, part):
+        if method == "send_video":
+            duration, _, _ = await media_pool.run(video_info, part)
+            media = {'video': part, 'duration': int(duration)}
+        else:
+            media = {'document': part}
+        return await retry_call(upload_pool.send, method, Var.FILE_STORE,
+            caption=f"{caption}\n‣ <b>Part :</b> {no + 1}/{len(parts)}",
+            progress=on_progress,
+            progress_args=(no,),
+            **media,
+            **kwargs
+        )
+
+    staged = await gather(*(send(no, part) for no, part in enumerate(parts)), return_exceptions=True)
+    if (errors := [res for res in staged if isinstance(res, BaseException)]):
+        await bot.delete_messages(Var.FILE_STORE, [msg.id for msg in staged if not isinstance(msg, BaseException)])
+        raise errors[0]
+
+    # Staged uploads finish out of order, an album gets consecutive ids so one batch link covers the set
+    group = []
+    for i in range(0, len(staged), 10):
+        media = [
+            (InputMediaVideo(msg.video.file_id, caption=msg.caption.html if msg.caption else None, supports_streaming=True)
+            if msg.video else InputMediaDocument(msg.document.file_id, caption=msg.caption.html if msg.caption else None))
+            for msg in staged[i:i+10]
+        ]
+        group.extend(await retry_call(bot.send_media_group, Var.FILE_STORE, media))
+    await bot.delete_messages(Var.FILE_STORE, [msg.id for msg in staged])
+    for msg in group:
+        await file_cache.put(msg)
+    return group
+
+async def publish_group(group, chat_id):
+    copies = []
+    for i in range(0, len(group), 10):
+        copies.extend(await retry_call(bot.copy_media_group, chat_id, Var.FILE_STORE, group[i].id))
+    return copies
@@ -0,0 +1,138 @@
+from os import path as ospath, scandir
+from time import time
+from shutil import disk_usage
+from traceback import format_exc
+from asyncio import sleep as asleep, Condition, wait_for, TimeoutError as AsyncTimeout
+from aiofiles.os import remove as aioremove
+
+from bot import Var, LOGS, bot_loop
+from .func_utils import sync_to_async, convertBytes, editMessage
+
+WORK_DIRS = ("downloads", "thumbs", "encode", "outputs")
+RESUMABLE_EXTS = (".part", ".part.json")
+ENCODER_FILES = ("ffanimeadvin", "ffanimeadvout", "prog_")
+
+def scan_dir(path):
+    files = []
+    if not ospath.isdir(path):
+        return files
+    stack = [path]
+    while stack:
+        with scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat()
+                    files.append((entry.path, stat.st_size, stat.st_mtime))
+    return files
+
+class StorageManager:
+    def __init__(self, min_free, max_age):
+        self.__min_free = min_free
+        self.__max_age = max_age
+        self.__reserved = {}
+        self.__protected = {}
+        self.__cond = Condition()
+        self.paused = False
+
+    @property
+    def reserved(self):
+        return sum(max(size - self.__used(job_id), 0) for job_id, size in self.__reserved.items())
+
+    def __used(self, job_id):
+        used = 0
+        for path in self.__protected.get(job_id, ()):
+            for fpath in (path, f"{path}.part"):
+                if ospath.exists(fpath):
+                    used += ospath.getsize(fpath)
+        return used
+
+    def available(self):
+        return disk_usage(".").free - self.reserved - self.__min_free
+
+    @staticmethod
+    def estimate(source_size, streamed=False):
+        return int(source_size * Var.OUTPUT_RATIO) + (0 if streamed else source_size)
+
+    async def admit(self, job_id, size, paths=()):
+        async with self.__cond:
+            while self.available() < size:
+                if not self.paused:
+                    self.paused = True
+                    LOGS.warning(f"Storage : Intake Paused, Job {job_id} needs {convertBytes(size)}, {convertBytes(max(self.available(), 0))} Available")
+                try:
+                    await wait_for(self.__cond.wait(), 30)
+                except AsyncTimeout:
+                    pass
+            self.paused = False
+            self.__reserved[job_id] = size
+            self.__protected[job_id] = set(paths)
+
+    async def admit_media(self, job_id, media, streamed=False, status=None):
+        file_name = getattr(media, 'file_name', None) or media.file_unique_id
+        size = self.estimate(media.file_size or 0, streamed)
+        if status and self.available() < size:
+            await editMessage(status, f"<b>Waiting for Disk Space...</b>\n\n<i>Needs {convertBytes(size)}, Intake Paused below {convertBytes(self.__min_free)} Free</i>")
+        await self.admit(job_id, size, (ospath.join("downloads", file_name), ospath.join("encode", file_name)))
+
+    def release_when_done(self, task, job_id):
+        task.add_done_callback(lambda _: bot_loop.create_task(self.release(job_id)))
+        return task
+
+    def protect(self, job_id, *paths):
+        self.__protected.setdefault(job_id, set()).update(paths)
+
+    async def release(self, job_id):
+        self.__reserved.pop(job_id, None)
+        self.__protected.pop(job_id, None)
+        async with self.__cond:
+            self.__cond.notify_all()
+
+    def __is_protected(self, path):
+        base = ospath.basename(path)
+        if base.startswith(ENCODER_FILES):
+            return True
+        return any(ospath.basename(p) in (base, base.rsplit(".part", 1)[0]) for paths in self.__protected.values() for p in paths)
+
+    async def usage(self):
+        usage = {}
+        for wdir in WORK_DIRS:
+            files = await sync_to_async(scan_dir, wdir)
+            usage[wdir] = (len(files), sum(size for _, size, _ in files))
+        return usage
+
+    async def collect(self, max_age=None):
+        max_age = self.__max_age if max_age is None else max_age
+        freed, now = 0, time()
+        for wdir in WORK_DIRS:
+            # Published outputs live as long as their download links
+            age = Var.SERVE_TTL * 3600 if wdir == "outputs" and Var.SERVE_FILES else max_age
+            for path, size, mtime in await sync_to_async(scan_dir, wdir):
+                if now - mtime < age or self.__is_protected(path):
+                    continue
+                if path.endswith(RESUMABLE_EXTS) and now - mtime < max(max_age, Var.GC_RESUME_AGE * 3600):
+                    continue
+                try:
+                    await aioremove(path)
+                    freed += size
+                except Exception:
+                    LOGS.error(format_exc())
+        if freed:
+            LOGS.info(f"Storage : Evicted {convertBytes(freed)} of Stale Artifacts")
+            async with self.__cond:
+                self.__cond.notify_all()
+        return freed
+
+    async def gc_loop(self):
+        while True:
+            await asleep(Var.GC_INTERVAL * 60)
+            try:
+                await self.collect()
+                if self.paused:
+                    async with self.__cond:
+                        self.__cond.notify_all()
+            except Exception:
+                LOGS.error(format_exc())
+
+storage = StorageManager(Var.DISK_MIN_FREE * 1024 ** 3, Var.GC_MAX_AGE * 3600)
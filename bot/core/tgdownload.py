@@ -0,0 +1,203 @@
+from os import path as ospath, open as osopen, close as osclose, pwrite, ftruncate, fstat, O_RDWR, O_CREAT
+from math import ceil
+from glob import glob
+from json import loads as jloads, dumps as jdumps
+from time import time
+from asyncio import Lock, Queue, QueueEmpty, gather, create_task
+from aiofiles import open as aiopen
+from aiofiles.os import remove as aioremove, rename as aiorename, path as aiopath
+
+from pyrogram import raw
+from pyrogram.file_id import FileId, FileType
+from pyrogram.session import Session, Auth
+from pyrogram.errors import FileReferenceExpired
+
+from bot import bot, Var, LOGS
+from .func_utils import retry_call, convertBytes
+from .bandwidth import bandwidth, PRIO_DOWNLOAD
+
+CHUNK_SIZE = 1024 * 1024
+STREAMABLE_EXTS = (".mkv", ".webm", ".ts", ".m2ts", ".flv")
+STREAMABLE_MIMES = ("video/x-matroska", "video/webm", "video/mp2t", "video/x-flv")
+
+class TgDownloader:
+    sessions = {}
+    session_lock = Lock()
+
+    def __init__(self, client=bot, path="downloads", priority=PRIO_DOWNLOAD):
+        self.__client = client
+        self.__downdir = path
+        self.__priority = priority
+        self.__manifest_lock = Lock()
+
+    @staticmethod
+    def get_media(message):
+        return getattr(message, message.media.value, None) if message and message.media else None
+
+    @classmethod
+    def is_streamable(cls, message):
+        if not (media := cls.get_media(message)):
+            return False
+        name, mime = (getattr(media, 'file_name', None) or "").lower(), (getattr(media, 'mime_type', None) or "").lower()
+        return name.endswith(STREAMABLE_EXTS) or mime in STREAMABLE_MIMES
+
+    async def __load_manifest(self, mpath):
+        if not await aiopath.exists(mpath):
+            return None
+        try:
+            async with aiopen(mpath, 'r') as f:
+                return jloads(await f.read())
+        except Exception:
+            return None
+
+    async def __save_manifest(self, mpath, manifest):
+        async with self.__manifest_lock:
+            manifest['updated'] = time()
+            async with aiopen(mpath, 'w') as f:
+                await f.write(jdumps(manifest))
+
+    async def __fetch(self, message, part, mpath, manifest, progress, progress_args):
+        offset, total = manifest['chunks'], manifest['file_size']
+        async with aiopen(part, 'r+b' if await aiopath.exists(part) else 'wb') as f:
+            await f.truncate(offset * CHUNK_SIZE)
+            await f.seek(offset * CHUNK_SIZE)
+            async for chunk in self.__client.stream_media(message, offset=offset):
+                await bandwidth.acquire("download", len(chunk), self.__priority)
+                await f.write(chunk)
+                offset += 1
+                manifest['chunks'] = offset
+                if offset % 16 == 0:
+                    await self.__save_manifest(mpath, manifest)
+                if progress:
+                    await progress(min(offset * CHUNK_SIZE, total), total, *progress_args)
+        await self.__save_manifest(mpath, manifest)
+
+    async def __get_session(self, dc_id, index):
+        client = self.__client
+        async with self.session_lock:
+            if (session := self.sessions.get((id(client), dc_id, index))):
+                return session
+            test_mode = await client.storage.test_mode()
+            if dc_id != await client.storage.dc_id():
+                session = Session(client, dc_id, await Auth(client, dc_id, test_mode).create(), test_mode, is_media=True)
+                await session.start()
+                exported = await client.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc_id))
+                await session.invoke(raw.functions.auth.ImportAuthorization(id=exported.id, bytes=exported.bytes))
+            else:
+                session = Session(client, dc_id, await client.storage.auth_key(), test_mode, is_media=True)
+                await session.start()
+            self.sessions[(id(client), dc_id, index)] = session
+            return session
+
+    @staticmethod
+    def __get_location(file_id):
+        return raw.types.InputDocumentFileLocation(
+            id=file_id.media_id,
+            access_hash=file_id.access_hash,
+            file_reference=file_id.file_reference,
+            thumb_size=file_id.thumbnail_size
+        )
+
+    async def __get_chunk(self, session, source, index):
+        try:
+            res = await session.invoke(raw.functions.upload.GetFile(location=source['location'], offset=index * CHUNK_SIZE, limit=CHUNK_SIZE), sleep_threshold=30)
+        except FileReferenceExpired:
+            msg = await self.__client.get_messages(source['message'].chat.id, source['message'].id)
+            source['location'] = self.__get_location(FileId.decode(self.get_media(msg).file_id))
+            raise
+        if not isinstance(res, raw.types.upload.File):
+            raise Exception(f"Unsupported GetFile Response : {type(res).__name__}")
+        return res.bytes
+
+    async def __fetch_parallel(self, message, part, mpath, manifest, progress, progress_args):
+        file_id = FileId.decode(self.get_media(message).file_id)
+        source = {'message': message, 'location': self.__get_location(file_id)}
+        total = manifest['file_size']
+        done = set(manifest.setdefault('done', []))
+        pending = Queue()
+        for index in range(ceil(total / CHUNK_SIZE)):
+            if index not in done:
+                pending.put_nowait(index)
+        sessions = [await self.__get_session(file_id.dc_id, no) for no in range(max(Var.DL_SESSIONS, 1))]
+
+        fd = osopen(part, O_RDWR | O_CREAT)
+        try:
+            if fstat(fd).st_size != total:
+                ftruncate(fd, total)
+
+            async def worker(no):
+                session = sessions[no % len(sessions)]
+                while True:
+                    try:
+                        index = pending.get_nowait()
+                    except QueueEmpty:
+                        return
+                    await bandwidth.acquire("download", min(CHUNK_SIZE, total - index * CHUNK_SIZE), self.__priority)
+                    data = await retry_call(self.__get_chunk, session, source, index)
+                    await self.__client.loop.run_in_executor(None, pwrite, fd, data, index * CHUNK_SIZE)
+                    done.add(index)
+                    manifest['done'] = sorted(done)
+                    if len(done) % 16 == 0:
+                        await self.__save_manifest(mpath, manifest)
+                    if progress:
+                        await progress(min(len(done) * CHUNK_SIZE, total), total, *progress_args)
+
+            workers = [create_task(worker(no)) for no in range(Var.DL_WORKERS)]
+            try:
+                await gather(*workers)
+            except BaseException:
+                for task in workers:
+                    task.cancel()
+                await gather(*workers, return_exceptions=True)
+                raise
+        finally:
+            osclose(fd)
+            await self.__save_manifest(mpath, manifest)
+
+    def __use_parallel(self, media):
+        if Var.DL_WORKERS <= 1 or (media.file_size or 0) < Var.DL_PARALLEL_MIN * 1024 * 1024:
+            return False
+        try:
+            return FileId.decode(media.file_id).file_type in (FileType.DOCUMENT, FileType.VIDEO, FileType.ANIMATION, FileType.AUDIO)
+        except Exception:
+            return False
+
+    async def download(self, message, file_name=None, progress=None, progress_args=()):
+        if not (media := self.get_media(message)):
+            return None
+        path = ospath.join(self.__downdir, file_name or getattr(media, 'file_name', None) or media.file_unique_id)
+        part, mpath = f"{path}.part", f"{path}.part.json"
+        mode = "parallel" if self.__use_parallel(media) else "stream"
+        manifest = await self.__load_manifest(mpath)
+        if manifest and manifest.get('file_unique_id') == media.file_unique_id and manifest.get('mode', "stream") == mode:
+            LOGS.info(f"Resuming Download of {ospath.basename(path)} from {convertBytes(max(manifest['chunks'], len(manifest.get('done', []))) * CHUNK_SIZE)}")
+        else:
+            manifest = {
+                'file_unique_id': media.file_unique_id,
+                'file_size': media.file_size,
+                'chat_id': message.chat.id,
+                'msg_id': message.id,
+                'mode': mode,
+                'chunks': 0
+            }
+            if await aiopath.exists(part):
+                await aioremove(part)
+        await self.__save_manifest(mpath, manifest)
+        if mode == "parallel":
+            await self.__fetch_parallel(message, part, mpath, manifest, progress, progress_args)
+        else:
+            await retry_call(self.__fetch, message, part, mpath, manifest, progress, progress_args)
+        await aiorename(part, path)
+        await aioremove(mpath)
+        return path
+
+    @staticmethod
+    async def pending(path="downloads"):
+        manifests = []
+        for mpath in glob(ospath.join(path, "*.part.json")):
+            try:
+                async with aiopen(mpath, 'r') as f:
+                    manifests.append(jloads(await f.read()))
+            except Exception:
+                continue
+        return manifests
@@ -1,13 +1,18 @@
-from time import time, sleep
+from time import time
 from traceback import format_exc
 from math import floor
 from os import path as ospath
 from aiofiles.os import remove as aioremove
-from pyrogram.errors import FloodWait
 
 from bot import bot, Var
 from .func_utils import editMessage, sendMessage, convertBytes, convertTime
 from .reporter import rep
+from .metrics import observe_transfer
+from .throughput import throughput
+from .assets import assets
+from .filecache import file_cache
+from .uploadpool import upload_pool
+from .splitter import needs_split, split_video, upload_parts, drop_parts
 
 class TgUploader:
     def __init__(self, message):
@@ -22,41 +27,53 @@ class TgUploader:
     async def upload(self, path, qual):
         self.__name = ospath.basename(path)
         self.__qual = qual
+        thumb = assets.local(Var.THUMB) if Var.THUMB else None
         try:
-            if Var.AS_DOC:
-                return await self.__client.send_document(chat_id=Var.FILE_STORE,
+            if needs_split(path):
+                parts = await split_video(path)
+                try:
+                    msg = await upload_parts(parts, "send_document" if Var.AS_DOC else "send_video", f"<i>{self.__name}</i>",
+                        thumb=thumb,
+                        progress=self.progress_status
+                    )
+                finally:
+                    await drop_parts(path)
+            elif Var.AS_DOC:
+                msg = await upload_pool.send("send_document", Var.FILE_STORE,
                     document=path,
-                    thumb="thumb.jpg" if ospath.exists("thumb.jpg") else None,
+                    thumb=thumb,
                     caption=f"<i>{self.__name}</i>",
                     force_document=True,
                     progress=self.progress_status
                 )
             else:
-                return await self.__client.send_video(chat_id=Var.FILE_STORE,
-                    document=path,
-                    thumb="thumb.jpg" if ospath.exists("thumb.jpg") else None,
+                msg = await upload_pool.send("send_video", Var.FILE_STORE,
+                    video=path,
+                    thumb=thumb,
                     caption=f"<i>{self.__name}</i>",
                     progress=self.progress_status
                 )
-        except FloodWait as e:
-            sleep(e.value * 1.5)
-            return await upload(path, qual, thumbnail)
+            if not isinstance(msg, list):
+                await file_cache.put(msg)
         except Exception as e:
-            await rep.report(format_exc(), "error")
+            # The output is kept, so a failed upload can be retried without encoding again
+            await rep.report(f"{format_exc()}\nOutput kept at {path}", "error")
             raise e
-        finally:
-            await aioremove(path)
+        await aioremove(path)
+        return msg
 
     async def progress_status(self, current, total):
         if self.cancelled:
             self.__client.stop_transmission()
         now = time()
         diff = now - self.__start
+        if current == total:
+            observe_transfer("upload", total, diff)
         if (now - self.__updater) >= 7 or current == total:
             self.__updater = now
             percent = round(current / total * 100, 2)
             speed = current / diff 
-            eta = round((total - current) / speed)
+            eta = throughput.time_left(throughput.predict_transfer("upload", total), diff, current / total) or 0
             bar = floor(percent/8)*"█" + (12 - floor(percent/8))*"▒"
             progress_str = f"""‣ <b>Anime Name :</b> <b><i>{self.__name}</i></b>
 
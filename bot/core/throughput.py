@@ -0,0 +1,136 @@
+from re import search
+from time import time
+from traceback import format_exc
+
+from bot import Var, LOGS, bot_loop, ENCODE_SLOTS
+from .database import db
+from .jobs import jobs
+
+HEIGHTS = (360, 480, 720, 1080, 1440, 2160)
+
+class LinearFit:
+    """Least squares of seconds = a + b * x over exponentially decayed samples, x being duration or bytes."""
+    __slots__ = ("n", "sx", "sy", "sxx", "sxy")
+
+    def __init__(self, n=0.0, sx=0.0, sy=0.0, sxx=0.0, sxy=0.0):
+        self.n, self.sx, self.sy, self.sxx, self.sxy = n, sx, sy, sxx, sxy
+
+    def update(self, x, y, decay):
+        self.n = self.n * decay + 1
+        self.sx = self.sx * decay + x
+        self.sy = self.sy * decay + y
+        self.sxx = self.sxx * decay + x * x
+        self.sxy = self.sxy * decay + x * y
+
+    def predict(self, x):
+        if self.n <= 0 or self.sx <= 0:
+            return None
+        det = self.n * self.sxx - self.sx * self.sx
+        # Needs spread in x for the fixed cost, a single size seen so far falls back to a plain rate
+        if self.n >= 3 and det > 0.01 * self.n * self.sxx:
+            slope = (self.n * self.sxy - self.sx * self.sy) / det
+            if slope > 0:
+                return max((self.sy - slope * self.sx) / self.n + slope * x, 0)
+        return x * self.sy / self.sx
+
+    def dump(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+class ThroughputModel:
+    """Learns encode and transfer times from finished jobs, persisted in MongoDB."""
+    def __init__(self, encode_decay=0.95, transfer_decay=0.7):
+        self.__fits = {}
+        self.__encode_decay = encode_decay
+        # Bandwidth moves quicker than CPU speed, old uploads are forgotten sooner
+        self.__transfer_decay = transfer_decay
+
+    async def load(self):
+        try:
+            self.__fits = {key: LinearFit(**fit) for key, fit in (await db.getModel("throughput")).get('fits', {}).items()}
+            LOGS.info(f"Throughput Model Loaded with {len(self.__fits)} Fit(s)")
+        except Exception:
+            LOGS.error(f"Loading Throughput Model Failed\n{format_exc()}")
+
+    async def save(self):
+        try:
+            await db.saveModel("throughput", {'fits': {key: fit.dump() for key, fit in self.__fits.items()}, 'updated': time()})
+        except Exception:
+            LOGS.error(f"Saving Throughput Model Failed\n{format_exc()}")
+
+    @staticmethod
+    def encode_keys(profile, height):
+        # Most specific first, the broader fits answer until the specific one has seen a job
+        from .ffencoder import ffargs
+        ffcode = ffargs.get(profile, "")
+        codec = m.group(1) if (m := search(r"-c:v (\S+)", ffcode)) else "copy"
+        preset = m.group(1) if (m := search(r"-(?:preset|cpu-used) (\S+)", ffcode)) else "default"
+        height = min(HEIGHTS, key=lambda h: abs(h - height)) if height else 0
+        return [f"encode:{profile}:{codec}:{preset}:{height}", f"encode:{profile}:{codec}:{preset}", f"encode:{profile}"]
+
+    def __fit(self, key):
+        if (fit := self.__fits.get(key)) is None:
+            fit = self.__fits[key] = LinearFit()
+        return fit
+
+    def observe_encode(self, profile, duration, height, seconds):
+        if not duration or seconds <= 0:
+            return
+        for key in self.encode_keys(profile, height):
+            self.__fit(key).update(duration, seconds, self.__encode_decay)
+        bot_loop.create_task(self.save())
+
+    def predict_encode(self, profile, duration, height=None):
+        if not duration:
+            return None
+        for key in self.encode_keys(profile, height):
+            if (fit := self.__fits.get(key)) and (pred := fit.predict(duration)) is not None:
+                return pred
+        return None
+
+    def observe_transfer(self, direction, size, seconds):
+        if size <= 0 or seconds <= 0:
+            return
+        self.__fit(f"transfer:{direction}").update(size, seconds, self.__transfer_decay)
+        bot_loop.create_task(self.save())
+
+    def predict_transfer(self, direction, size):
+        if (fit := self.__fits.get(f"transfer:{direction}")) and size:
+            return fit.predict(size)
+        return None
+
+    @staticmethod
+    def time_left(predicted, elapsed, fraction):
+        """Blends the model with the observed rate, trusting the observation more as the task progresses."""
+        observed = elapsed * (1 - fraction) / fraction if fraction > 0.001 else None
+        if predicted is None:
+            return observed
+        modelled = max(predicted - elapsed, 0)
+        if observed is None:
+            return modelled
+        return (1 - fraction) * modelled + fraction * observed
+
+    def job_remaining(self, job):
+        """Predicted seconds before a local job gives its encode slot back, None when unknown."""
+        encode = self.predict_encode(job.profile, job.duration, job.height)
+        if encode is None:
+            return None
+        if job.stage == "encoding":
+            encode = max(encode - (time() - job.started), 0)
+        elif job.stage != "queued":
+            encode = 0
+        # The slot is held through the upload, the output is sized like the storage estimate
+        size = job.out_size or (job.size or 0) * Var.OUTPUT_RATIO
+        return encode + (self.predict_transfer("upload", size) or 0)
+
+    def queue_wait(self, job_id=None):
+        """Predicted seconds until job_id gets a slot, or until the whole local backlog drains without one."""
+        total = 0.0
+        for job in jobs.active():
+            if job.id == job_id:
+                break
+            if job.remote:
+                continue
+            total += self.job_remaining(job) or 0
+        return total / ENCODE_SLOTS
+
+throughput = ThroughputModel()
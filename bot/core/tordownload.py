@@ -1,4 +1,5 @@
 from os import path as ospath
+from asyncio import sleep as asleep, create_task
 from aiofiles import open as aiopen
 from aiofiles.os import path as aiopath, remove as aioremove, mkdir
 
@@ -6,6 +7,7 @@ from aiohttp import ClientSession
 from torrentp import TorrentDownloader
 from bot import LOGS
 from bot.core.func_utils import handle_logs
+from bot.core.bandwidth import bandwidth
 
 class TorDownloader:
     def __init__(self, path="."):
@@ -16,14 +18,35 @@ class TorDownloader:
     async def download(self, torrent, name=None):
         if torrent.startswith("magnet:"):
             torp = TorrentDownloader(torrent, self.__downdir)
-            await torp.start_download()
+            await self.__start(torp)
             return ospath.join(self.__downdir, name)
         elif torfile := await self.get_torfile(torrent):
             torp = TorrentDownloader(torfile, self.__downdir)
-            await torp.start_download()
+            await self.__start(torp)
             await aioremove(torfile)
             return ospath.join(self.__downdir, torp._torrent_info._info.name())
 
+    async def __start(self, torp):
+        regulator = create_task(self.__regulate(torp))
+        try:
+            await torp.start_download()
+        finally:
+            regulator.cancel()
+
+    @staticmethod
+    async def __regulate(torp):
+        # libtorrent moves the bytes itself, so its rate limit follows what uploads and downloads leave free
+        moved = 0
+        while True:
+            await asleep(2)
+            if torp._session._session is None:
+                continue
+            allowance = bandwidth.allowance("torrent")
+            torp._session.set_download_limit(int(allowance / 1024) if allowance else 0)
+            if (status := getattr(torp._downloader, '_status', None)) is not None:
+                bandwidth.record("torrent", status.total_payload_download - moved)
+                moved = status.total_payload_download
+
     @handle_logs
     async def get_torfile(self, url):
         if not await aiopath.isdir(self.__torpath):
@@ -0,0 +1,40 @@
+from json import dumps as jdumps
+from traceback import format_exc
+from aiofiles import open as aiopen
+
+from bot import Var, LOGS
+
+class TraceRecorder:
+    """Appends one JSON line per finished job, replayed offline by bench.simulate."""
+    def __init__(self, path):
+        self.__path = path
+
+    @staticmethod
+    def entry(job, slots):
+        return {
+            'id': job.id,
+            'at': round(job.created, 3),
+            'outcome': job.stage,
+            'profile': job.profile,
+            'remote': job.remote,
+            'size': job.size,
+            'out': job.out_size,
+            'dur': round(job.duration, 3) if job.duration else None,
+            'res': f"{job.width}x{job.height}" if job.width else None,
+            'wait': round(job.wait, 3) if job.wait is not None else None,
+            'peers': job.peers,
+            'slots': slots,
+            'stages': {stage: round(taken, 3) for stage, taken in job.stages.items()},
+            'fw': job.floodwaits
+        }
+
+    async def record(self, job, slots):
+        if not self.__path:
+            return
+        try:
+            async with aiopen(self.__path, "a") as f:
+                await f.write(jdumps(self.entry(job, slots), separators=(",", ":")) + "\n")
+        except Exception:
+            LOGS.error(f"Writing Job Trace Failed\n{format_exc()}")
+
+traces = TraceRecorder(Var.TRACE_FILE)
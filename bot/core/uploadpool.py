@@ -0,0 +1,79 @@
+from time import time
+from traceback import format_exc
+from asyncio import sleep as asleep
+
+from pyrogram import Client
+from pyrogram.enums import ParseMode
+from pyrogram.errors import FloodWait
+
+from bot import bot, Var, LOGS
+from .metrics import observe_floodwait, Gauge
+from .bandwidth import bandwidth
+
+upload_load = Gauge("upload_pool_active", "Uploads in flight per upload client", labels=("client",))
+
+class UploadPool:
+    def __init__(self, client, tokens):
+        self.__main = client
+        self.__helpers = [Client(name=f"AutoAniHelper{no}", api_id=Var.API_ID, api_hash=Var.API_HASH, bot_token=token, no_updates=True, parse_mode=ParseMode.HTML) for no, token in enumerate(tokens, 1)]
+        self.__clients = [client]
+        self.__load = {}
+        self.__flood = {}
+
+    async def start(self):
+        for helper in self.__helpers:
+            try:
+                await helper.start()
+                # Helpers can only post where they are members, everything they upload is staged in FILE_STORE
+                await helper.get_chat(Var.FILE_STORE)
+                self.__clients.append(helper)
+                LOGS.info(f"Upload Helper @{helper.me.username} Ready")
+            except Exception:
+                LOGS.error(f"Upload Helper {helper.name} Unusable, Skipping\n{format_exc()}")
+        return len(self.__clients)
+
+    async def stop(self):
+        for helper in self.__clients[1:]:
+            try:
+                await helper.stop()
+            except Exception:
+                pass
+
+    def __name(self, client):
+        return "main" if client is self.__main else client.name
+
+    async def __pick(self):
+        while True:
+            now = time()
+            if (ready := [c for c in self.__clients if self.__flood.get(c.name, 0) <= now]):
+                return min(ready, key=lambda c: self.__load.get(c.name, 0))
+            await asleep(min(self.__flood.values()) - now)
+
+    async def send(self, method, chat_id, **kwargs):
+        kwargs['progress'] = bandwidth.throttle("upload", kwargs.get('progress'))
+        while True:
+            client = await self.__pick()
+            target = chat_id if client is self.__main else Var.FILE_STORE
+            self.__load[client.name] = self.__load.get(client.name, 0) + 1
+            upload_load.set(self.__load[client.name], client=self.__name(client))
+            try:
+                msg = await getattr(client, method)(chat_id=target, **kwargs)
+                break
+            except FloodWait as f:
+                observe_floodwait("upload", f.value)
+                self.__flood[client.name] = time() + f.value * 1.2
+                LOGS.warning(f"Upload Client {self.__name(client)} in FloodWait for {f.value}s, Rebalancing")
+            finally:
+                self.__load[client.name] -= 1
+                upload_load.set(self.__load[client.name], client=self.__name(client))
+        if client is self.__main:
+            return msg
+        # Hand the message over to the main bot, so callers copy and publish it as usual
+        msg = await self.__main.get_messages(target, msg.id)
+        if chat_id == target:
+            return msg
+        copied = await msg.copy(chat_id)
+        await self.__main.delete_messages(target, msg.id)
+        return copied
+
+upload_pool = UploadPool(bot, Var.HELPER_TOKENS)
@@ -1,6 +1,7 @@
 import math
 import time
 
+from .throughput import throughput
 
 PROGRESS_BAR = """<b>
 ╭━━━━❰ᴘʀᴏɢʀᴇss ʙᴀʀ❱━➣
@@ -15,7 +16,8 @@ async def progress_for_pyrogram(
     total,
     ud_type,
     message,
-    start
+    start,
+    direction=None
 ):
 
     now = time.time()
@@ -25,7 +27,9 @@ async def progress_for_pyrogram(
         percentage = current * 100 / total
         speed = current / diff
         elapsed_time = round(diff) * 1000
-        time_to_completion = round((total - current) / speed) * 1000
+        # Early on the learned bandwidth beats a rate taken over a few chunks
+        left = throughput.time_left(throughput.predict_transfer(direction, total) if direction else None, diff, current / total)
+        time_to_completion = round(left or 0) * 1000
         estimated_total_time = elapsed_time + time_to_completion
 
         elapsed_time = TimeFormatter(milliseconds=elapsed_time)
@@ -0,0 +1,89 @@
+from sys import _current_frames
+from time import time, perf_counter
+from threading import Thread, Event as ThreadEvent, get_ident
+from traceback import extract_stack, format_list
+from asyncio import sleep as asleep, current_task, run_coroutine_threadsafe
+
+from bot import Var, LOGS, bot_loop
+from .reporter import rep
+from .metrics import Counter, Gauge, loop_lag
+
+loop_blocks = Counter("event_loop_blocked_total", "Callbacks that blocked the event loop past the threshold", labels=("where",))
+loop_block_last = Gauge("event_loop_blocked_last_seconds", "Duration of the latest blocking callback")
+
+class LoopWatchdog:
+    def __init__(self, loop, threshold, interval=0.25, cooldown=300):
+        self.__loop = loop
+        self.__interval = interval
+        self.__cooldown = cooldown
+        self.__beat = perf_counter()
+        self.__loop_tid = None
+        self.__thread = None
+        self.__stop = ThreadEvent()
+        self.__reported = {}
+        self.threshold = threshold
+        self.stalls = 0
+        self.last_stall = None
+
+    @property
+    def enabled(self):
+        return self.__thread is not None and self.__thread.is_alive()
+
+    async def heartbeat(self):
+        self.__loop_tid = get_ident()
+        while True:
+            start = perf_counter()
+            await asleep(self.__interval)
+            self.__beat = perf_counter()
+            loop_lag.set(round(max(self.__beat - start - self.__interval, 0), 6))
+
+    def enable(self, threshold=None):
+        if threshold:
+            self.threshold = threshold
+        if self.enabled:
+            return
+        # Every thread gets its own stop event, one still waking up after a quick off / on cannot be revived
+        self.__stop = ThreadEvent()
+        self.__thread = Thread(target=self.__watch, args=(self.__stop,), name="LoopWatchdog", daemon=True)
+        self.__thread.start()
+        LOGS.info(f"Loop Watchdog Enabled with {self.threshold}s Threshold")
+
+    def disable(self):
+        self.__stop.set()
+        self.__thread = None
+        LOGS.info("Loop Watchdog Disabled")
+
+    def __watch(self, stop):
+        while not stop.wait(self.__interval):
+            if self.__loop_tid is None or (perf_counter() - self.__beat) < self.threshold:
+                continue
+            stalled_beat = self.__beat
+            self.__capture()
+            while not stop.wait(self.__interval / 5) and self.__beat == stalled_beat:
+                pass
+            blocked = round(perf_counter() - stalled_beat - self.__interval, 3)
+            loop_block_last.set(blocked)
+            if self.last_stall:
+                self.last_stall['blocked'] = blocked
+
+    def __capture(self):
+        if (frame := _current_frames().get(self.__loop_tid)) is None:
+            return
+        stack = extract_stack(frame)[-12:]
+        task = current_task(self.__loop)
+        coro = task.get_coro().__qualname__ if task else "<callback>"
+        where = next((f"{short_path(fs.filename)}:{fs.lineno}" for fs in reversed(stack) if "/bot/" in fs.filename),
+                     f"{short_path(stack[-1].filename)}:{stack[-1].lineno}")
+        self.stalls += 1
+        loop_blocks.inc(where=where)
+        self.last_stall = {'time': time(), 'coro': coro, 'where': where, 'blocked': None}
+        if time() - self.__reported.get(where, 0) < self.__cooldown:
+            return
+        self.__reported[where] = time()
+        txt = f"Event Loop Blocked > {self.threshold}s in {coro} at {where}\n\n{''.join(format_list(stack))}"
+        run_coroutine_threadsafe(rep.report(txt, "warning"), self.__loop)
+
+def short_path(filename):
+    return filename.split("/bot/", 1)[-1] if "/bot/" in filename else filename.rsplit("/", 1)[-1]
+
+watchdog = LoopWatchdog(bot_loop, Var.WATCHDOG_THRESHOLD)
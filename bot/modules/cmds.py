@@ -1,84 +1,26 @@
 import os
 import re
 import time
+import shutil
 from pyrogram import filters
-from asyncio import sleep as asleep, gather
+from asyncio import sleep as asleep, gather, Semaphore
 from pyrogram.filters import command, private, user, document, video
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from pyrogram.errors import FloodWait, MessageNotModified
 from bot import bot, bot_loop, Var, ani_cache
 from bot.core.database import db
-from bot.core.func_utils import decode, is_fsubbed, get_fsubs, editMessage, sendMessage, new_task, convertTime, getfeed
-from bot.core.auto_animes import fencode
+from bot.core.func_utils import get_file_link, editMessage, sendMessage, new_task, convertTime, convertBytes, getfeed, get_log_tail, get_log_bundle
 from bot.core.reporter import rep
 from bot.core.utils import progress_for_pyrogram
+from bot.core.metrics import time_stage, observe_transfer
+from bot.core.watchdog import watchdog
+from bot.core.tgdownload import TgDownloader
+from bot.core.storage import storage
+from bot.core.fileserver import base_url
+from bot.core.throughput import throughput
+from bot.core.jobs import jobs
+from bot.core.bandwidth import bandwidth, TRAFFIC, PRIO_BULK
 
-@bot.on_message(command('start') & private)
-@new_task
-async def start_msg(client, message):
-    uid = message.from_user.id
-    from_user = message.from_user
-    txtargs = message.text.split()
-    temp = await sendMessage(message, "<i>Connecting..</i>")
-    if not await is_fsubbed(uid):
-        txt, btns = await get_fsubs(uid, txtargs)
-        return await editMessage(temp, txt, InlineKeyboardMarkup(btns))
-    if len(txtargs) <= 1:
-        await temp.delete()
-        btns = []
-        for elem in Var.START_BUTTONS.split():
-            try:
-                bt, link = elem.split('|', maxsplit=1)
-            except:
-                continue
-            if len(btns) != 0 and len(btns[-1]) == 1:
-                btns[-1].insert(1, InlineKeyboardButton(bt, url=link))
-            else:
-                btns.append([InlineKeyboardButton(bt, url=link)])
-        smsg = Var.START_MSG.format(first_name=from_user.first_name,
-                                    last_name=from_user.first_name,
-                                    mention=from_user.mention, 
-                                    user_id=from_user.id)
-        if Var.START_PHOTO:
-            await message.reply_photo(
-                photo=Var.START_PHOTO, 
-                caption=smsg,
-                reply_markup=InlineKeyboardMarkup(btns) if len(btns) != 0 else None
-            )
-        else:
-            await sendMessage(message, smsg, InlineKeyboardMarkup(btns) if len(btns) != 0 else None)
-        return
-    try:
-        arg = (await decode(txtargs[1])).split('-')
-    except Exception as e:
-        await rep.report(f"User : {uid} | Error : {str(e)}", "error")
-        await editMessage(temp, "<b>Input Link Code Decode Failed !</b>")
-        return
-    if len(arg) == 2 and arg[0] == 'get':
-        try:
-            fid = int(int(arg[1]) / abs(int(Var.FILE_STORE)))
-        except Exception as e:
-            await rep.report(f"User : {uid} | Error : {str(e)}", "error")
-            await editMessage(temp, "<b>Input Link Code is Invalid !</b>")
-            return
-        try:
-            msg = await client.get_messages(Var.FILE_STORE, message_ids=fid)
-            if msg.empty:
-                return await editMessage(temp, "<b>File Not Found !</b>")
-            nmsg = await msg.copy(message.chat.id, reply_markup=None)
-            await temp.delete()
-            if Var.AUTO_DEL:
-                async def auto_del(msg, timer):
-                    await asleep(timer)
-                    await msg.delete()
-                await sendMessage(message, f'<i>File will be Auto Deleted in {convertTime(Var.DEL_TIMER)}, Forward to Saved Messages Now..</i>')
-                bot_loop.create_task(auto_del(nmsg, Var.DEL_TIMER))
-        except Exception as e:
-            await rep.report(f"User : {uid} | Error : {str(e)}", "error")
-            await editMessage(temp, "<b>File Not Found !</b>")
-    else:
-        await editMessage(temp, "<b>Input Link is Invalid for Usage !</b>")
-    
 @bot.on_message(command('pause') & private & user(Var.ADMINS))
 async def pause_fetch(client, message):
     ani_cache['fetch_animes'] = False
@@ -92,14 +34,80 @@ async def pause_fetch(client, message):
 @bot.on_message(command('log') & private & user(Var.ADMINS))
 @new_task
 async def _log(client, message):
-    await message.reply_document("log.txt", quote=True)
+    args = message.text.split()
+    if len(args) > 1 and args[1].lower() in ("full", "all"):
+        return await message.reply_document(await get_log_bundle(), quote=True)
+    lines = int(args[1]) if len(args) > 1 and args[1].isdigit() else Var.LOG_TAIL
+    await message.reply_document(await get_log_tail(lines), quote=True, caption=f"<i>Last {lines} Lines of Log</i>")
+
+@bot.on_message(command('watchdog') & private & user(Var.ADMINS))
+@new_task
+async def _watchdog(client, message):
+    args = message.text.split()
+    if len(args) > 1 and args[1].lower() == "off":
+        watchdog.disable()
+    elif len(args) > 1:
+        threshold = (args[2] if len(args) > 2 else None) if args[1].lower() == "on" else args[1]
+        try:
+            watchdog.enable(float(threshold) if threshold else None)
+        except ValueError:
+            return await sendMessage(message, "<b>Usage :</b> <code>/watchdog [on|off|threshold]</code>")
+    txt = f"<b>Loop Watchdog :</b> <i>{'Enabled' if watchdog.enabled else 'Disabled'}</i>\n    • <b>Threshold :</b> {watchdog.threshold}s\n    • <b>Stalls Caught :</b> {watchdog.stalls}"
+    if (stall := watchdog.last_stall):
+        txt += f"\n    • <b>Last Stall :</b> <code>{stall['coro']}</code> at <code>{stall['where']}</code> ({stall['blocked'] or '?'}s)"
+    await sendMessage(message, txt)
+
+@bot.on_message(command('batch') & private & user(Var.ADMINS))
+@new_task
+async def _batch(client, message):
+    args = message.text.split()
+    ids = []
+    for arg in args[1:3]:
+        if arg.isdigit():
+            ids.append(int(arg))
+        elif (match := re.match(r"https://t.me/(?:c/)?(?:.*)/(\d+)", arg)):
+            ids.append(int(match.group(1)))
+    if len(ids) != 2:
+        return await sendMessage(message, "<b>Usage :</b> <code>/batch [first_post_link|id] [last_post_link|id]</code> from File Store")
+    start_id, end_id = sorted(ids)
+    if end_id - start_id >= Var.BATCH_LIMIT:
+        return await sendMessage(message, f"<b>Batch can have at most {Var.BATCH_LIMIT} Posts !</b>")
+    await sendMessage(message, f"<b>Batch Link :</b> {await get_file_link(start_id, end_id)}")
+
+@bot.on_message(command('storage') & private & user(Var.ADMINS))
+@new_task
+async def _storage(client, message):
+    freed = await storage.collect() if len(message.text.split()) > 1 and message.text.split()[1].lower() == "gc" else None
+    total, used, free = shutil.disk_usage(".")
+    txt = f"""<b>Storage Usage :</b>
+    • <b>Disk :</b> {convertBytes(used)} used of {convertBytes(total)}, {convertBytes(free)} free
+    • <b>Reserved by Jobs :</b> {convertBytes(storage.reserved) or '0 B'}
+    • <b>Intake :</b> <i>{'Paused' if storage.paused else 'Open'}</i>\n"""
+    for wdir, (count, size) in (await storage.usage()).items():
+        txt += f"    • <b>{wdir}/ :</b> {count} file(s), {convertBytes(size) or '0 B'}\n"
+    if freed is not None:
+        txt += f"\n<i>GC Evicted {convertBytes(freed) or '0 B'}</i>"
+    await sendMessage(message, txt)
+
+@bot.on_message(command('status') & private & user(Var.ADMINS))
+@new_task
+async def _status(client, message):
+    active = jobs.active()
+    txt = f"<b>Active Jobs :</b> {len(active)}\n"
+    for job in active:
+        txt += f"    • <i>{job.name}</i> : <b>{job.stage.title()}</b> for {convertTime(job.elapsed) or '0s'}\n"
+    txt += f"\n<b>Bandwidth :</b> {bandwidth.waiting} transfer(s) waiting\n"
+    for traffic in TRAFFIC + (None,):
+        rate = sum(bandwidth.rate(other) for other in TRAFFIC) if traffic is None else bandwidth.rate(traffic)
+        budget = bandwidth.budget(traffic)
+        txt += f"    • <b>{(traffic or 'total').title()} :</b> {convertBytes(rate) or '0 B'}/s of {f'{convertBytes(budget)}/s' if budget else 'No Limit'}"
+        txt += f" ({rate / budget:.0%})\n" if budget else "\n"
+    await sendMessage(message, txt)
 
 @bot.on_message(command('link') & private & user(Var.ADMINS))
 @new_task
 async def _link(client, message):
-    with open("/root/cfd.log") as f:
-        url_match = re.search(r'https?://\S+\.trycloudflare\.com', f.read())
-        await message.reply_text(url_match.group() if url_match else "No tunnel URL found.")
+    await message.reply_text(f"<b>File Server :</b> {base_url()}" if Var.SERVE_FILES and Var.SERVE_PORT else "<b>File Server is Disabled</b>")
         
 @bot.on_message(command('addlink') & private & user(Var.ADMINS))
 @new_task
@@ -115,32 +123,58 @@ async def add_task(client, message):
 @new_task
 async def dwe_file(client, message):
     start_time = time.time()
+    from bot.core.auto_animes import fencode
+    streamed = Var.STREAM_INPUT and TgDownloader.is_streamable(message)
+    m = await message.reply(
+        "<b>File Received. Checking Disk Space...</b>",
+        reply_to_message_id=message.id
+    )
+    await storage.admit_media(m.id, TgDownloader.get_media(message), streamed, status=m)
+    if streamed:
+        await editMessage(m, "<b>File Received. Streaming into Encoder...</b>")
+        file_name = message.document.file_name if message.document else message.video.file_name
+        return storage.release_when_done(bot_loop.create_task(fencode(file_name, None, message, m, source=message)), m.id)
     try:
         #m = await message.reply("File Received. Start Downloading.....")
-        m = await message.reply(
-            "<b>File Received. Start Downloading.....</b>",
-            reply_to_message_id=message.id
-        )
+        await editMessage(m, "<b>File Received. Start Downloading.....</b>")
         # Download the file
-        file_path = await client.download_media(
-            message,
-            progress=progress_for_pyrogram,
-            progress_args=("<b>Download Started....</b>", m, start_time)
-        )
+        with time_stage("download"):
+            file_path = await TgDownloader(client).download(
+                message,
+                progress=progress_for_pyrogram,
+                progress_args=("<b>Download Started....</b>", m, start_time)
+            )
     except Exception as e:
+        await storage.release(m.id)
         return await message.reply(f"Failed to download the file: {str(e)}")
 
     if not file_path:
+        await storage.release(m.id)
         return await message.reply("Failed to download the file. Please try again.")
+    observe_transfer("download", os.path.getsize(file_path), time.time() - start_time)
 
     # Extract the file name
     file_name = (
         message.document.file_name if message.document else message.video.file_name
     )
-    encode_task = bot_loop.create_task(fencode(file_name, file_path, message, m))
+    encode_task = storage.release_when_done(bot_loop.create_task(fencode(file_name, file_path, message, m)), m.id)
 
 
 
+async def resume_downloads():
+    for manifest in await TgDownloader.pending():
+        if manifest.get('chat_id', 0) <= 0:
+            continue
+        try:
+            msg = await bot.get_messages(manifest['chat_id'], manifest['msg_id'])
+            if msg.empty or not msg.media:
+                continue
+            await rep.report(f"Resuming Interrupted Download : {manifest['msg_id']}", "info")
+            dwe_file(bot, msg)
+        except Exception as e:
+            await rep.report(f"Resume Failed : {manifest.get('msg_id')} | Error : {str(e)}", "warning")
+
+
 async def get_message_id(message):
     if message.forward_from_chat:
         return message.forward_from_message_id
@@ -156,6 +190,113 @@ async def get_message_id(message):
         return 0
 
 
+import_jobs = {}
+
+def is_video(msg):
+    return not msg.empty and (msg.video or (msg.document and (msg.document.mime_type or "").startswith("video/")))
+
+async def run_import(client, message, chat_id, start_msg_id, end_msg_id):
+    from bot.core.auto_animes import fencode
+    status = await message.reply(f"<b>Processing messages from ID {start_msg_id} to {end_msg_id} in channel {chat_id}.</b>")
+    state = import_jobs[status.id] = {
+        'cancelled': False, 'total': end_msg_id - start_msg_id + 1, 'scanned': 0, 'videos': [],
+        'downloading': {}, 'downloaded': 0, 'encoding': set(), 'done': 0, 'failed': 0
+    }
+    buttons = InlineKeyboardMarkup([[InlineKeyboardButton("Cancel Import", callback_data=f"cancel_import:{status.id}")]])
+    total_start_time = time.time()
+
+    async def report(final=False):
+        dl_bytes = sum(state['downloading'].values())
+        txt = f"""<b>Channel Import :</b> <code>{chat_id}</code> [{start_msg_id} → {end_msg_id}]
+    • <b>Scanned :</b> {state['scanned']} / {state['total']}
+    • <b>Videos :</b> {len(state['videos'])}
+    • <b>Downloading :</b> {len(state['downloading'])}{f" ({convertBytes(dl_bytes)})" if dl_bytes else ""}
+    • <b>Downloaded :</b> {state['downloaded']}
+    • <b>Encoding / Queued :</b> {len(state['encoding'])}
+    • <b>Encoded :</b> {state['done']}
+    • <b>Failed :</b> {state['failed']}
+    • <b>Time Took :</b> {convertTime(time.time() - total_start_time) or '0s'}"""
+        if state['cancelled']:
+            txt += "\n\n<i>Import Cancelled, Queued Encodes will Continue.</i>"
+        await editMessage(status, txt, None if final or state['cancelled'] else buttons)
+
+    async def reporter():
+        while True:
+            await asleep(10)
+            await report()
+
+    async def import_file(msg, sem):
+        async with sem:
+            # Held back while the backlog is over the limit in jobs, or in predicted encode and upload time
+            while (len(state['encoding']) >= Var.IMPORT_BACKLOG or (Var.IMPORT_HORIZON and throughput.queue_wait() > Var.IMPORT_HORIZON * 60)) and not state['cancelled']:
+                await asleep(5)
+            if state['cancelled']:
+                return
+            file_name = msg.video.file_name if msg.video else msg.document.file_name
+            job_id = f"import:{chat_id}:{msg.id}"
+            streamed = Var.STREAM_INPUT and TgDownloader.is_streamable(msg)
+            await storage.admit_media(job_id, TgDownloader.get_media(msg), streamed)
+            if streamed:
+                file_path = None
+            else:
+                async def dl_progress(current, total):
+                    state['downloading'][msg.id] = current
+                start_time = time.time()
+                state['downloading'][msg.id] = 0
+                try:
+                    with time_stage("download"):
+                        file_path = await TgDownloader(client, priority=PRIO_BULK).download(msg, progress=dl_progress)
+                except Exception as e:
+                    await rep.report(f"Channel Import : {msg.id} | Error : {str(e)}", "error")
+                    file_path = None
+                finally:
+                    state['downloading'].pop(msg.id, None)
+                if not file_path:
+                    state['failed'] += 1
+                    return await storage.release(job_id)
+                observe_transfer("download", os.path.getsize(file_path), time.time() - start_time)
+                state['downloaded'] += 1
+        reply_message = await message.reply(f"<b>Queued message {msg.id} for Encoding...</b>")
+        task = storage.release_when_done(bot_loop.create_task(fencode(file_name, file_path, message, reply_message, source=None if file_path else msg)), job_id)
+        state['encoding'].add(task)
+        task.add_done_callback(encode_done)
+
+    def encode_done(task):
+        state['encoding'].discard(task)
+        if not task.cancelled() and task.exception() is None and task.result() == "done":
+            state['done'] += 1
+        else:
+            state['failed'] += 1
+
+    report_task = bot_loop.create_task(reporter())
+    try:
+        msg_ids = list(range(start_msg_id, end_msg_id + 1))
+        for i in range(0, len(msg_ids), 200):
+            if state['cancelled']:
+                break
+            msgs = await client.get_messages(chat_id, msg_ids[i:i+200])
+            state['scanned'] += len(msgs)
+            state['videos'].extend(msg for msg in msgs if is_video(msg))
+        sem = Semaphore(Var.IMPORT_WORKERS)
+        await gather(*(import_file(msg, sem) for msg in state['videos']))
+    finally:
+        report_task.cancel()
+        await report(final=True)
+        import_jobs.pop(status.id, None)
+
+    await message.reply(
+        f"<b>✅ All files have been {'handed to the encoder' if not state['cancelled'] else 'processed until cancel'}!\n\nTotal time taken: {convertTime(time.time() - total_start_time)}</b>"
+    )
+
+@bot.on_callback_query(filters.regex(r"^cancel_import:"), group=-1)
+async def cancel_import(client, query):
+    if query.from_user.id not in Var.ADMINS:
+        return await query.answer("Not Allowed !", show_alert=True)
+    if not (state := import_jobs.get(int(query.data.split(":")[1]))):
+        return await query.answer("Import Already Finished.", show_alert=True)
+    state['cancelled'] = True
+    await query.answer("Import Cancelled, Pending Downloads will be Skipped.", show_alert=True)
+
 @bot.on_message(command("channel") & private & user(Var.ADMINS))
 @new_task
 async def channel_task(client, message):
@@ -204,46 +345,7 @@ async def channel_task(client, message):
         end_msg_id = max(f_msg_id, s_msg_id)
         chat_id = first_message.forward_from_chat.id
 
-        await message.reply(
-            f"<b>Processing messages from ID {start_msg_id} to {end_msg_id} in channel {chat_id}.</b>"
-        )
-
-        # Track the start time of the entire download process
-        total_start_time = time.time()
-
-        # Iterate through messages in the range
-        for msg_id in range(start_msg_id, end_msg_id + 1):
-            try:
-                msg = await client.get_messages(chat_id, msg_id)
-                if msg.video or (msg.document and msg.document.mime_type.startswith("video/")):
-                    start_time = time.time()
-                    reply_message = await message.reply(
-                        f"<b>Downloading message {msg_id}...</b>"
-                    )
-                    file_path = await client.download_media(
-                        msg,
-                        progress=progress_for_pyrogram,
-                        progress_args=(f"<b>Downloading...</b>", reply_message, start_time),
-                    )
-                    if file_path:
-                        # Extract filename from message
-                        file_name = (
-                            msg.video.file_name if msg.video else msg.document.file_name
-                        )
-
-                        # Pass the downloaded file to video processing function
-                        encode_task = bot_loop.create_task(fencode(file_name, file_path, message, reply_message))
-                    else:
-                        await reply_message.edit("Failed to download media.")
-            except Exception as e:
-                await message.reply(f"Error processing message {msg_id}: {str(e)}")
-
-        # After all files have been processed
-        total_time_taken = time.time() - total_start_time
-        # Send the final message with time taken
-        await message.reply(
-            f"<b>✅ All files have been downloaded successfully!\n\nTotal time taken: {convertTime(total_time_taken)}</b>"
-        )
+        await run_import(client, message, chat_id, start_msg_id, end_msg_id)
 
     except Exception as e:
         await message.reply(f"An unexpected error occurred: {str(e)}")
@@ -0,0 +1,130 @@
+from asyncio import sleep as asleep
+from pyrogram import filters
+from pyrogram.filters import command, private
+from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from pyrogram.errors import FloodWait, FileReferenceExpired, FileReferenceEmpty, FileReferenceInvalid, FileIdInvalid, MediaInvalid, MediaEmpty
+from bot import bot, Var
+from bot.core.func_utils import decode, is_fsubbed, get_fsubs, invalidate_fsub, editMessage, sendMessage, new_task, convertTime
+from bot.core.reporter import rep
+from bot.core.metrics import observe_floodwait
+from bot.core.filecache import file_cache
+from bot.core.autodel import auto_deleter
+from bot.core.assets import assets
+
+# A cached file_id Telegram no longer accepts, anything else leaves the entry alone
+STALE_MEDIA = (FileReferenceExpired, FileReferenceEmpty, FileReferenceInvalid, FileIdInvalid, MediaInvalid, MediaEmpty, ValueError)
+
+@bot.on_message(command('start') & private)
+@new_task
+async def start_msg(client, message):
+    uid = message.from_user.id
+    from_user = message.from_user
+    txtargs = message.text.split()
+    temp = await sendMessage(message, "<i>Connecting..</i>")
+    if not await is_fsubbed(uid):
+        txt, btns = await get_fsubs(uid, txtargs)
+        return await editMessage(temp, txt, InlineKeyboardMarkup(btns))
+    if len(txtargs) <= 1:
+        await temp.delete()
+        btns = []
+        for elem in Var.START_BUTTONS.split():
+            try:
+                bt, link = elem.split('|', maxsplit=1)
+            except:
+                continue
+            if len(btns) != 0 and len(btns[-1]) == 1:
+                btns[-1].insert(1, InlineKeyboardButton(bt, url=link))
+            else:
+                btns.append([InlineKeyboardButton(bt, url=link)])
+        smsg = Var.START_MSG.format(first_name=from_user.first_name,
+                                    last_name=from_user.first_name,
+                                    mention=from_user.mention, 
+                                    user_id=from_user.id)
+        if Var.START_PHOTO:
+            sent = await message.reply_photo(
+                photo=assets.file_id(Var.START_PHOTO),
+                caption=smsg,
+                reply_markup=InlineKeyboardMarkup(btns) if len(btns) != 0 else None
+            )
+            await assets.uploaded(Var.START_PHOTO, sent.photo.file_id)
+        else:
+            await sendMessage(message, smsg, InlineKeyboardMarkup(btns) if len(btns) != 0 else None)
+        return
+    try:
+        arg = (await decode(txtargs[1])).split('-')
+    except Exception as e:
+        await rep.report(f"User : {uid} | Error : {str(e)}", "error")
+        await editMessage(temp, "<b>Input Link Code Decode Failed !</b>")
+        return
+    if len(arg) == 2 and arg[0] == 'get':
+        try:
+            fid = int(int(arg[1]) / abs(int(Var.FILE_STORE)))
+        except Exception as e:
+            await rep.report(f"User : {uid} | Error : {str(e)}", "error")
+            await editMessage(temp, "<b>Input Link Code is Invalid !</b>")
+            return
+        try:
+            nmsg = None
+            if (cached := await file_cache.get(fid)):
+                try:
+                    nmsg = await client.send_cached_media(message.chat.id, cached['file_id'], caption=cached['caption'])
+                except FloodWait as f:
+                    # The entry is fine, dropping it would send the rush down the two call path
+                    observe_floodwait("send", f.value)
+                    await asleep(f.value * 1.2)
+                    nmsg = await client.send_cached_media(message.chat.id, cached['file_id'], caption=cached['caption'])
+                except STALE_MEDIA as e:
+                    await rep.report(f"File Cache : {fid} | Stale Entry Dropped : {str(e)}", "warning")
+                    await file_cache.drop(fid)
+                except Exception as e:
+                    await rep.report(f"File Cache : {fid} | Error : {str(e)}", "warning")
+            if nmsg is None:
+                msg = await client.get_messages(Var.FILE_STORE, message_ids=fid)
+                if msg.empty:
+                    return await editMessage(temp, "<b>File Not Found !</b>")
+                nmsg = await msg.copy(message.chat.id, reply_markup=None)
+                await file_cache.put(msg)
+            await temp.delete()
+            if Var.AUTO_DEL:
+                await sendMessage(message, f'<i>File will be Auto Deleted in {convertTime(Var.DEL_TIMER)}, Forward to Saved Messages Now..</i>')
+                await auto_deleter.schedule(nmsg.chat.id, [nmsg.id], Var.DEL_TIMER)
+        except Exception as e:
+            await rep.report(f"User : {uid} | Error : {str(e)}", "error")
+            await editMessage(temp, "<b>File Not Found !</b>")
+    elif len(arg) == 3 and arg[0] == 'get':
+        try:
+            start_id, end_id = sorted(int(int(x) / abs(int(Var.FILE_STORE))) for x in arg[1:])
+            if end_id - start_id >= Var.BATCH_LIMIT:
+                raise ValueError(f"Batch of {end_id - start_id + 1} Exceeds Limit")
+        except Exception as e:
+            await rep.report(f"User : {uid} | Error : {str(e)}", "error")
+            await editMessage(temp, "<b>Input Link Code is Invalid !</b>")
+            return
+        try:
+            msg_ids = list(range(start_id, end_id + 1))
+            msgs = []
+            for i in range(0, len(msg_ids), 200):
+                msgs.extend(await client.get_messages(Var.FILE_STORE, message_ids=msg_ids[i:i+200]))
+            file_ids = [msg.id for msg in msgs if not msg.empty and msg.media]
+            if not file_ids:
+                return await editMessage(temp, "<b>File Not Found !</b>")
+            nmsgs = []
+            for i in range(0, len(file_ids), 100):
+                nmsgs.extend(await client.forward_messages(message.chat.id, Var.FILE_STORE, file_ids[i:i+100], drop_author=True))
+                await asleep(1)
+            for msg in msgs:
+                await file_cache.put(msg)
+            await temp.delete()
+            if Var.AUTO_DEL:
+                await sendMessage(message, f'<i>Files will be Auto Deleted in {convertTime(Var.DEL_TIMER)}, Forward to Saved Messages Now..</i>')
+                await auto_deleter.schedule(message.chat.id, [nmsg.id for nmsg in nmsgs], Var.DEL_TIMER)
+        except Exception as e:
+            await rep.report(f"User : {uid} | Error : {str(e)}", "error")
+            await editMessage(temp, "<b>Files Not Found !</b>")
+    else:
+        await editMessage(temp, "<b>Input Link is Invalid for Usage !</b>")
+    
+@bot.on_chat_member_updated(filters.chat(Var.FSUB_CHATS))
+async def fsub_member_update(client, update):
+    if (member := update.new_chat_member or update.old_chat_member) and member.user:
+        invalidate_fsub(update.chat.id, member.user.id)
@@ -0,0 +1,126 @@
+from os import path as ospath, makedirs, chdir, getpid
+from socket import gethostname
+from time import time
+from argparse import ArgumentParser
+from traceback import format_exc
+from asyncio import sleep as asleep, create_task
+from aiofiles.os import remove as aioremove
+
+from bot import Var, LOGS, bot_loop, log_jobid
+from bot.core.database import db
+from bot.core.reporter import rep
+from bot.core.ffencoder import FFEncoder
+from bot.core.assets import assets
+from bot.core.mediapool import media_pool
+from bot.core.jobqueue import stage_file, fetch_file, drop_file
+
+# Lease lengths an encode may go without a status change before the worker gives it up
+STALL_LEASES = 5
+
+class EncodeWorker:
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.__encoder = None
+
+    async def __heartbeat(self, job_id, work):
+        """Renews the lease only while work runs and its status keeps moving, a stuck encode lets it expire for a retry."""
+        last, changed = None, time()
+        while True:
+            await asleep(Var.LEASE_TTL / 3)
+            if work.done():
+                return
+            status = self.__encoder.status if self.__encoder else None
+            if status != last:
+                last, changed = status, time()
+            elif status is not None and time() - changed > Var.LEASE_TTL * STALL_LEASES:
+                LOGS.warning(f"Job {job_id} Made no Progress for {int(time() - changed)}s, Giving up its Lease")
+                await self.__encoder.cancel_encode()
+                return
+            try:
+                alive = await db.renewEncodeJob(job_id, self.worker_id, Var.LEASE_TTL, self.__encoder.status if self.__encoder else None)
+            except Exception:
+                LOGS.error(format_exc())
+                continue
+            if not alive:
+                LOGS.warning(f"Lease on Job {job_id} Lost, Dropping the Encode")
+                if self.__encoder:
+                    await self.__encoder.cancel_encode()
+                return
+
+    async def __encode(self, job, in_path):
+        await fetch_file(job['input'], in_path, keep=True)
+        self.__encoder = FFEncoder(None, in_path, job['name'], job['_id'], job['qual'])
+        return await self.__encoder.start_encode()
+
+    async def __process(self, job):
+        job_id = job['_id']
+        log_jobid.set(job_id)
+        if job['attempts'] > Var.JOB_ATTEMPTS:
+            await db.finishEncodeJob(job_id, self.worker_id, {'state': 'failed', 'error': f"Gave up after {Var.JOB_ATTEMPTS} Attempts"})
+            return
+        LOGS.info(f"Claimed Job {job_id} : {job['name']} ( Attempt {job['attempts']} )")
+        in_path, out_path, out_ref = ospath.join("downloads", job['input']['name']), None, None
+        work = create_task(self.__encode(job, in_path))
+        beat = create_task(self.__heartbeat(job_id, work))
+        try:
+            out_path = await work
+            if self.__encoder.is_cancelled:
+                return
+            if not out_path:
+                result = {'state': 'failed', 'error': (self.__encoder.error or "FFmpeg exited with an error")[-3500:]}
+            else:
+                out_ref = await stage_file(job_id, out_path, "output")
+                result = {'state': 'done', 'output': out_ref}
+        except Exception as e:
+            LOGS.error(format_exc())
+            result = {'state': 'failed', 'error': str(e)}
+        finally:
+            beat.cancel()
+            self.__encoder = None
+            for path in (in_path, out_path):
+                if path and ospath.exists(path):
+                    await aioremove(path)
+        if not await db.finishEncodeJob(job_id, self.worker_id, result):
+            LOGS.warning(f"Job {job_id} was Cancelled or Reclaimed, Discarding the Result")
+            if out_ref:
+                await drop_file(out_ref)
+            return
+        LOGS.info(f"Job {job_id} {result['state'].title()}")
+
+    async def run(self):
+        try:
+            await assets.prepare(media=False)
+        except Exception as e:
+            LOGS.critical(f"{e}. Exiting Now...")
+            exit(1)
+        create_task(assets.revalidate_loop())
+        LOGS.info(f"Encode Worker {self.worker_id} Started !!")
+        while True:
+            try:
+                job = await db.claimEncodeJob(self.worker_id, Var.LEASE_TTL)
+            except Exception:
+                LOGS.error(format_exc())
+                job = None
+            if not job:
+                await asleep(5)
+                continue
+            await self.__process(job)
+
+def main():
+    parser = ArgumentParser(description="Headless encode worker, claims jobs queued by the bot in MongoDB")
+    parser.add_argument("--id", default=f"{gethostname()}-{getpid()}", help="Worker name shown in job status")
+    parser.add_argument("--workdir", default=None, help="Scratch directory ( default: workers/<id> )")
+    args = parser.parse_args()
+
+    # Inputs keep their episode names under downloads/, so every worker gets its own scratch dir
+    workdir = args.workdir or ospath.join("workers", args.id)
+    for sub in ("downloads", "encode", "thumbs"):
+        makedirs(ospath.join(workdir, sub), exist_ok=True)
+    chdir(workdir)
+    # The worker never starts the bot session, reports stay in the log and the job document
+    rep.set_chat(0)
+    media_pool.start()
+    bot_loop.run_until_complete(EncodeWorker(args.id).run())
+
+if __name__ == '__main__':
+    main()
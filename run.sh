@@ -31,23 +31,14 @@ else
     exit 1
 fi
 
-# Start a Python HTTP server in the background
-log "Starting Python HTTP server on port 8000..."
-python3 -m http.server &> /dev/null &
-HTTP_PID=$!
-sleep 3  # Allow server setup to complete
-
-# Verify HTTP server is running
-if kill -0 $HTTP_PID 2>/dev/null; then
-    log "[Success] HTTP server running with PID: $HTTP_PID"
-else
-    log "[Error] Failed to start HTTP server"
-    exit 1
-fi
+# Finished outputs are served by the bot itself on SERVE_PORT ( signed links, Range, rate limits ),
+# the tunnel can come up first and starts forwarding once the bot is listening
+SERVE_PORT=$(grep -oP '^SERVE_PORT\s*=\s*"?\K[0-9]+' config.env 2>/dev/null || true)
+SERVE_PORT=${SERVE_PORT:-8000}
 
 # Start Cloudflare tunnel, logging output to /root/cfd.log
-log "Initiating Cloudflare tunnel..."
-cfd --url http://localhost:8000 --no-autoupdate > /root/cfd.log 2>&1 &
+log "Initiating Cloudflare tunnel to the bot file server on port $SERVE_PORT..."
+cfd --url http://localhost:$SERVE_PORT --no-autoupdate > /root/cfd.log 2>&1 &
 CFD_PID=$!
 sleep 5  # Allow tunnel to initialize
 
@@ -82,6 +73,7 @@ if [[ -z $URL ]]; then
 fi
 
 # Run main Python bot module, log error if it fails
+# The bot serves Prometheus metrics itself on METRICS_HOST:METRICS_PORT (default 127.0.0.1:9100)
 log "Updating and starting main bot..."
 if python3 update.py && python3 -m bot; then
     log "[Success] Bot updated and started successfully."
@@ -89,8 +81,8 @@ else
     log "[Error] Failed to update or start main bot module"
 fi
 
-# Cleanup: Stop HTTP server and Cloudflare tunnel on exit
-trap "log 'Cleaning up and stopping services...'; kill $HTTP_PID $CFD_PID; log 'Services stopped.'" EXIT
+# Cleanup: Stop Cloudflare tunnel on exit
+trap "log 'Cleaning up and stopping services...'; kill $CFD_PID; log 'Services stopped.'" EXIT
 
 log "===== Cloudflare Tunnel Setup Complete ====="
 echo "Setup complete. Check the log file for details: $LOG_FILE"
@@ -0,0 +1,22 @@
+import os
+import sys
+from tempfile import mkdtemp
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The bot package reads its settings and creates its work dirs at import, same setup as bench.pipeline
+os.environ.update({
+    'API_ID': "1", 'API_HASH': "tests", 'BOT_TOKEN': "1:tests", 'MONGO_URI': os.getenv("TEST_MONGO_URI") or "mongodb://127.0.0.1:1",
+    'FSUB_CHATS': "", 'MAIN_CHANNEL': "-1001", 'FILE_STORE': "-1002", 'LOG_CHANNEL': "0",
+    'THUMB': "", 'METRICS_PORT': "0", 'WATCHDOG': "False", 'TRACE_FILE': "", 'TUNING_FILE': "",
+    'SERVE_SECRET': "tests", 'SERVE_URL': "http://files.test", 'DISTRIBUTED': "False",
+})
+os.chdir(mkdtemp(prefix="aatests-"))
+sys.path.insert(0, REPO_DIR)
+
+@pytest.fixture
+def run():
+    from bot import bot_loop
+    return bot_loop.run_until_complete
@@ -0,0 +1,76 @@
+from time import time
+from asyncio import gather
+
+from bot.core.bandwidth import TokenBucket, BandwidthManager
+
+def test_bucket_refills_up_to_one_second_of_burst():
+    bucket = TokenBucket(1000)
+    bucket.tokens = 0
+    assert bucket.refill(bucket.last + 0.5) == 500
+    assert bucket.refill(bucket.last + 10) == 1000
+
+def test_bucket_in_debt_reports_wait():
+    bucket = TokenBucket(1000)
+    bucket.tokens = -500
+    assert bucket.ready_in() == 0.5
+    bucket.tokens = 10
+    assert bucket.ready_in() == 0
+
+def test_unlimited_traffic_passes_and_is_recorded(run):
+    manager = BandwidthManager(0, {'upload': 1000})
+    start = time()
+    run(manager.acquire("download", 10 ** 9))
+    assert time() - start < 0.1
+    assert manager.rate("download") > 0
+    assert manager.waiting == 0
+
+def test_limit_holds_the_average_rate(run):
+    manager = BandwidthManager(0, {'upload': 1000})
+
+    async def transfer():
+        for _ in range(3):
+            await manager.acquire("upload", 1000)
+
+    start = time()
+    run(transfer())
+    # One second of burst, then the debt of the second chunk has to be paid off
+    assert 0.8 < time() - start < 1.5
+
+def test_other_classes_flow_past_a_blocked_one(run):
+    manager = BandwidthManager(0, {'upload': 1000, 'download': 1000})
+    order = []
+
+    async def transfer(traffic, nbytes):
+        await manager.acquire(traffic, nbytes)
+        order.append(traffic)
+
+    async def contend():
+        # A second of debt on uploads only
+        await manager.acquire("upload", 2000)
+        await gather(transfer("upload", 1000), transfer("upload", 1000), transfer("download", 1000))
+
+    run(contend())
+    assert order[0] == "download"
+
+def test_higher_priority_goes_first_on_the_global_budget(run):
+    manager = BandwidthManager(1000, {})
+    order = []
+
+    async def transfer(traffic):
+        await manager.acquire(traffic, 500)
+        order.append(traffic)
+
+    async def contend():
+        await manager.acquire("torrent", 1500)
+        # Queued behind the torrent, the upload still gets the first tokens once the debt is paid
+        await gather(transfer("torrent"), transfer("upload"))
+
+    run(contend())
+    assert order == ["upload", "torrent"]
+
+def test_rate_window_sums_recent_traffic():
+    manager = BandwidthManager(0, {})
+    manager.record("upload", 5000)
+    manager.record("upload", 0)
+    assert manager.rate("upload") == 1000
+    assert manager.rate("torrent") == 0
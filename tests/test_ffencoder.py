@@ -0,0 +1,36 @@
+import os
+from asyncio import wait_for
+
+import pytest
+
+from bot.core.ffencoder import FFEncoder, ffargs, hls_args
+from bot.core.jobs import jobs
+
+@pytest.fixture
+def source():
+    path = os.path.join("downloads", "failing.mkv")
+    with open(path, "wb") as f:
+        f.write(b"\0" * 1024)
+    return path
+
+def test_failed_ffmpeg_returns_promptly(run, source, monkeypatch):
+    # Exits non-zero without ever writing progress=end
+    monkeypatch.setitem(ffargs, "360", "sh -c 'echo broken input >&2; exit 3' _ '{}' '{}' '{}'")
+    jobs.add(7001, "failing.mkv", source).duration = 60
+    encoder = FFEncoder(None, source, "failing.mkv", 7001, "360")
+    # Well inside the progress loop's first 8s sleep, a loop waiting for progress=end would time out
+    assert run(wait_for(encoder.start_encode(), 5)) is None
+    assert encoder.error == "broken input"
+    # The source is handed back under its own name for a retry
+    assert os.path.exists(source)
+    assert not os.path.exists(os.path.join("encode", "ffanimeadvout_7001.mkv"))
+
+def test_hls_without_audio_has_no_audio_group():
+    args = hls_args("/tmp/hls", ["720", "480"], height=720, audio=False)
+    assert "0:a" not in args and "agroup" not in args
+    assert "v:0,name:720p v:1,name:480p" in args
+
+def test_hls_never_upscales():
+    args = hls_args("/tmp/hls", ["1080", "720", "480"], height=576)
+    assert "1080p" not in args and "720p" not in args and "480p" in args
+    assert "-map 0:a:0?" in args
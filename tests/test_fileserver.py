@@ -0,0 +1,45 @@
+import os
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+from bot.core.fileserver import OUTPUT_DIR, sign, signed_url, hls_url, download_handler
+
+@pytest.fixture
+def output():
+    os.makedirs(os.path.join(OUTPUT_DIR, "42"), exist_ok=True)
+    with open(os.path.join(OUTPUT_DIR, "42", "ep 01.mkv"), "wb") as f:
+        f.write(b"\0" * 1024)
+    return "42", "ep 01.mkv"
+
+def request(url):
+    parts = urlsplit(url)
+    _, _, job_id, name = parts.path.split("/", 3)
+    return make_mocked_request("GET", f"{parts.path}?{parts.query}", match_info={'job_id': job_id, 'name': unquote(name)})
+
+def test_valid_link_is_served(run, output):
+    resp = run(download_handler(request(signed_url(*output, ttl=60))))
+    assert isinstance(resp, web.FileResponse)
+
+def test_expired_link_is_refused(run, output):
+    with pytest.raises(web.HTTPForbidden):
+        run(download_handler(request(signed_url(*output, ttl=-1))))
+
+def test_extended_expiry_breaks_the_signature(run, output):
+    url = signed_url(*output, ttl=60)
+    query = parse_qs(urlsplit(url).query)
+    forged = url.replace(f"exp={query['exp'][0]}", f"exp={int(query['exp'][0]) + 3600}")
+    with pytest.raises(web.HTTPForbidden):
+        run(download_handler(request(forged)))
+
+def test_signature_is_bound_to_the_file(output):
+    assert sign("42", "ep 01.mkv", 100) != sign("42", "ep 02.mkv", 100)
+    assert sign("42", "ep 01.mkv", 100) != sign("43", "ep 01.mkv", 100)
+
+def test_hls_link_carries_its_signature_in_the_path():
+    url = hls_url("42", ttl=60, player=False)
+    _, _, job_id, expires, sig, playlist = urlsplit(url).path.split("/")
+    assert (job_id, playlist) == ("42", "master.m3u8")
+    assert sig == sign("42", "hls", int(expires))
@@ -0,0 +1,59 @@
+import os
+from time import time
+
+import pytest
+
+# Leases are MongoDB atomics, they are only worth testing against a real server
+pytestmark = pytest.mark.skipif(not os.getenv("TEST_MONGO_URI"), reason="TEST_MONGO_URI is not set")
+
+@pytest.fixture
+def queue(run):
+    from bot.core.database import db
+
+    async def clear():
+        for job in await db.getEncodeJobs():
+            await db.delEncodeJob(job['_id'])
+
+    run(clear())
+    yield db
+    run(clear())
+
+def new_job(job_id, created=None):
+    now = created or time()
+    return {'_id': job_id, 'name': f"{job_id}.mkv", 'qual': "360", 'state': 'queued', 'input': {'path': f"/nowhere/{job_id}.mkv", 'name': f"{job_id}.mkv"}, 'attempts': 0, 'created': now, 'updated': now}
+
+def test_claim_takes_the_oldest_queued_job_once(run, queue):
+    run(queue.addEncodeJob(new_job("b", 2)))
+    run(queue.addEncodeJob(new_job("a", 1)))
+    job = run(queue.claimEncodeJob("w1", 60))
+    assert (job['_id'], job['state'], job['worker'], job['attempts']) == ("a", 'running', "w1", 1)
+    assert run(queue.claimEncodeJob("w2", 60))['_id'] == "b"
+    assert run(queue.claimEncodeJob("w3", 60)) is None
+
+def test_only_the_lease_holder_renews(run, queue):
+    run(queue.addEncodeJob(new_job("a")))
+    run(queue.claimEncodeJob("w1", 60))
+    assert run(queue.renewEncodeJob("a", "w1", 60, "50%"))
+    assert not run(queue.renewEncodeJob("a", "w2", 60))
+    assert run(queue.getEncodeJob("a"))['progress'] == "50%"
+
+def test_expired_lease_is_reclaimed(run, queue):
+    run(queue.addEncodeJob(new_job("a")))
+    # A lease already in the past, as if the worker died right after claiming
+    run(queue.claimEncodeJob("w1", -1))
+    job = run(queue.claimEncodeJob("w2", 60))
+    assert (job['worker'], job['attempts']) == ("w2", 2)
+    # The first worker finds out on its next renewal and can no longer finish
+    assert not run(queue.renewEncodeJob("a", "w1", 60))
+    assert not run(queue.finishEncodeJob("a", "w1", {'state': 'done'}))
+    assert run(queue.finishEncodeJob("a", "w2", {'state': 'done'}))
+
+def test_reap_drops_jobs_left_by_the_last_run(run, queue):
+    from bot.core.jobqueue import reap_jobs
+    run(queue.addEncodeJob(new_job("a")))
+    run(queue.addEncodeJob(new_job("b")))
+    run(queue.claimEncodeJob("w1", 60))
+    run(reap_jobs())
+    assert run(queue.getEncodeJobs()) == []
+    # The worker still encoding the reaped job loses its lease
+    assert not run(queue.renewEncodeJob("a", "w1", 60))
@@ -0,0 +1,66 @@
+import os
+from time import time
+from collections import namedtuple
+from asyncio import sleep as asleep, wait_for, ensure_future
+
+import pytest
+
+from bot.core import storage as storage_mod
+from bot.core.storage import StorageManager
+
+Usage = namedtuple("Usage", "total used free")
+
+@pytest.fixture
+def disk(monkeypatch):
+    # A fixed 1000 byte free disk, admission only depends on reservations and the watermark
+    monkeypatch.setattr(storage_mod, "disk_usage", lambda path: Usage(2000, 1000, 1000))
+
+def touch(path, size=10, age=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    if age:
+        os.utime(path, (time() - age, time() - age))
+    return path
+
+def test_reservations_count_against_free_space(run, disk):
+    manager = StorageManager(100, 3600)
+    run(manager.admit(1, 500))
+    assert manager.available() == 1000 - 500 - 100
+
+def test_written_protected_files_shrink_the_reservation(run, disk):
+    manager = StorageManager(100, 3600)
+    path = touch(os.path.join("downloads", "admit.mkv"), size=200)
+    run(manager.admit(1, 500, (path,)))
+    assert manager.reserved == 300
+
+def test_intake_pauses_below_the_watermark_until_release(run, disk):
+    manager = StorageManager(100, 3600)
+
+    async def contend():
+        await manager.admit(1, 600)
+        task = ensure_future(manager.admit(2, 600))
+        await asleep(0.05)
+        assert manager.paused and not task.done()
+        await manager.release(1)
+        await wait_for(task, 1)
+        assert not manager.paused
+
+    run(contend())
+
+def test_collect_evicts_stale_and_keeps_protected(run, disk):
+    manager = StorageManager(100, 3600)
+    stale = touch(os.path.join("downloads", "stale.mkv"), age=7200)
+    fresh = touch(os.path.join("downloads", "fresh.mkv"))
+    kept = touch(os.path.join("downloads", "kept.mkv"), age=7200)
+    partial = touch(os.path.join("downloads", "resume.mkv.part"), age=7200)
+    encoder = touch(os.path.join("encode", "ffanimeadvin_1.mkv"), age=7200)
+    manager.protect(1, kept)
+    assert run(manager.collect()) == 10
+    assert not os.path.exists(stale)
+    assert all(os.path.exists(p) for p in (fresh, kept, partial, encoder))
+    run(manager.release(1))
+
+def test_estimate_adds_the_download_unless_streamed():
+    assert StorageManager.estimate(1000, streamed=True) == int(1000 * storage_mod.Var.OUTPUT_RATIO)
+    assert StorageManager.estimate(1000) == 1000 + int(1000 * storage_mod.Var.OUTPUT_RATIO)
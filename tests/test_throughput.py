@@ -0,0 +1,45 @@
+from pytest import approx
+
+from bot.core.throughput import LinearFit, ThroughputModel
+
+def test_fit_learns_fixed_cost_and_slope():
+    fit = LinearFit()
+    for x in (100, 200, 400, 800):
+        fit.update(x, 5 + 2 * x, 1.0)
+    assert fit.predict(1000) == approx(2005)
+
+def test_single_size_falls_back_to_plain_rate():
+    fit = LinearFit()
+    for _ in range(5):
+        fit.update(100, 50, 1.0)
+    assert fit.predict(300) == approx(150)
+
+def test_empty_fit_predicts_nothing():
+    assert LinearFit().predict(100) is None
+
+def test_decay_favours_recent_samples():
+    fit = LinearFit()
+    fit.update(100, 100, 0.5)
+    for _ in range(10):
+        fit.update(100, 50, 0.5)
+    assert fit.predict(100) == approx(50, rel=0.01)
+
+def test_fit_survives_a_dump_round_trip():
+    fit = LinearFit()
+    for x in (10, 20, 30):
+        fit.update(x, x * 3 + 1, 0.9)
+    assert LinearFit(**fit.dump()).predict(50) == fit.predict(50)
+
+def test_time_left_without_model_uses_observed_rate():
+    assert ThroughputModel.time_left(None, 10, 0.25) == approx(30)
+    assert ThroughputModel.time_left(None, 10, 0) is None
+
+def test_time_left_before_progress_uses_model():
+    assert ThroughputModel.time_left(100, 30, 0) == 70
+    # Overrunning the estimate never goes negative
+    assert ThroughputModel.time_left(100, 130, 0) == 0
+
+def test_time_left_blends_towards_observation():
+    # Model says 60s left, observed rate says 30s, half way the two weigh equally
+    assert ThroughputModel.time_left(90, 30, 0.5) == approx(45)
+    assert ThroughputModel.time_left(90, 30, 0.9) == approx(0.1 * 60 + 0.9 * 30 / 9)
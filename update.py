@@ -1,24 +1,42 @@
 from os import path as opath, getenv
-from logging import FileHandler, StreamHandler, INFO, basicConfig, error as log_error, info as log_info
+from logging import StreamHandler, INFO, basicConfig, error as log_error, info as log_info
 from logging.handlers import RotatingFileHandler
 from subprocess import run as srun
 from dotenv import load_dotenv
 
-if opath.exists("log.txt"):
-    with open("log.txt", 'r+') as f:
-        f.truncate(0)
+load_dotenv('config.env', override=True)
+
+# Same file as the bot, so update output shows up in /log
+LOG_FILE = getenv("LOG_FILE", "log.txt")
+file_handler = RotatingFileHandler(LOG_FILE, maxBytes=int(getenv("LOG_MAX_SIZE", "10")) * 1024 * 1024, backupCount=int(getenv("LOG_BACKUPS", "5")))
+if opath.exists(LOG_FILE) and opath.getsize(LOG_FILE):
+    file_handler.doRollover()
 
 basicConfig(format="[%(asctime)s] [%(name)s | %(levelname)s] - %(message)s [%(filename)s:%(lineno)d]",
             datefmt="%m/%d/%Y, %H:%M:%S %p",
-            handlers=[FileHandler('log.txt'), StreamHandler()],
+            handlers=[file_handler, StreamHandler()],
             level=INFO)
 
-load_dotenv('config.env', override=True)
-
 UPSTREAM_REPO = getenv('UPSTREAM_REPO')
 UPSTREAM_BRANCH = getenv('UPSTREAM_BRANCH')
+UPDATE_ON_BOOT = getenv('UPDATE_ON_BOOT', 'True').lower() == 'true'
+
+def current_remote():
+    res = srun(["git", "remote", "get-url", "origin"], capture_output=True, text=True)
+    return res.stdout.strip() if res.returncode == 0 else None
 
-if UPSTREAM_REPO is not None:
+if UPSTREAM_REPO is not None and not UPDATE_ON_BOOT:
+    log_info('Skipping Update, UPDATE_ON_BOOT is Disabled')
+elif UPSTREAM_REPO is not None and opath.exists('.git') and current_remote() == UPSTREAM_REPO:
+    update = srun(["git", "fetch", "-q", "--depth", "1", "origin", UPSTREAM_BRANCH])
+    if update.returncode == 0:
+        update = srun(["git", "reset", "--hard", "-q", "FETCH_HEAD"])
+
+    if update.returncode == 0:
+        log_info('Successfully updated with latest commit from UPSTREAM_REPO')
+    else:
+        log_error('Something went wrong while updating, check UPSTREAM_REPO if valid or not!')
+elif UPSTREAM_REPO is not None:
     if opath.exists('.git'):
         srun(["rm", "-rf", ".git"])
         